@@ -0,0 +1,69 @@
+"""
+Compares ways of getting pty output from bytes into `CharDisplay`, on ASCII-heavy and CJK-heavy streams:
+    per-read:    `chunk.decode('utf8', 'replace')` on every read (the old behaviour, mangles split characters)
+    incremental: `TerminalProcess`' incremental decoder, str into the parser
+    bytes:       raw bytes into the parser, which only decodes printable runs
+Run from the src directory: `python -m bench.bench_decode [size in bytes]`
+"""
+import sys
+import time
+import codecs
+from core.char_display import CharDisplay
+from core.esc_code import EscCodeHandler
+from core.vt_parser import VTParser
+from bench.bench_logs import NullLogger, build_log
+
+def build_cjk(size: int) -> bytes:
+    """ Mostly 3-byte characters, with some colour so escape sequences are in the mix too """
+    lines: list[str] = []
+    total: int = 0
+    i: int = 0
+    while total < size:
+        line: str = f"\x1b[33m{i:6d}\x1b[0m 终端多路复用器测试行，包含中文字符和日本語のテキスト {i%97}\r\n"
+        lines.append(line)
+        total += len(line.encode("utf8"))
+        i += 1
+    return "".join(lines).encode("utf8")
+
+def decode_only(data: bytes, mode: str, chunk_size: int = 4096) -> float:
+    """ Time spent decoding alone, without the parser """
+    decoder = codecs.getincrementaldecoder("utf8")("replace")
+    view = memoryview(data)
+    start: float = time.perf_counter()
+    for i in range(0, len(data), chunk_size):
+        chunk = view[i:i+chunk_size]
+        if mode == "per-read":
+            bytes(chunk).decode("utf8", "replace")
+        elif mode == "incremental":
+            decoder.decode(chunk)
+    return time.perf_counter() - start
+
+def run(data: bytes, mode: str, chunk_size: int = 4096) -> float:
+    """ Feed `data` through the parser in `chunk_size` reads, returning seconds taken """
+    logs = NullLogger()
+    disp = CharDisplay(logs, (200, 50))
+    parser = VTParser(logs, disp, EscCodeHandler(logs, disp))
+    decoder = codecs.getincrementaldecoder("utf8")("replace")
+    view = memoryview(data)
+    start: float = time.perf_counter()
+    for i in range(0, len(data), chunk_size):
+        chunk = view[i:i+chunk_size]
+        if mode == "per-read":
+            parser.feed(bytes(chunk).decode("utf8", "replace"))
+        elif mode == "incremental":
+            parser.feed(decoder.decode(chunk))
+        else:
+            parser.feed(chunk)
+    return time.perf_counter() - start
+
+def main() -> None:
+    size: int = int(sys.argv[1]) if len(sys.argv) > 1 else 10*1024*1024
+    streams = (("ascii", build_log(size).encode("utf8")), ("cjk", build_cjk(size)))
+    for name, data in streams:
+        for mode in ("per-read", "incremental", "bytes"):
+            taken: float = min(run(data, mode) for _ in range(5))
+            decoding: float = min(decode_only(data, mode) for _ in range(5))
+            print(f"{name:5} {mode:11}: {taken:.3f}s, {len(data)/1e6/taken:.1f} MB/s (decoding outside the parser: {decoding*1000:.1f}ms)")
+
+if __name__ == '__main__':
+    main()
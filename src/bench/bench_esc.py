@@ -0,0 +1,79 @@
+"""
+Per-sequence cost of parsing and dispatching escape codes, on streams resembling `htop` and `vim` redraws.
+Sequences are timed going through `VTParser.sequence_re` as usual, and stepped through
+the state machine alone (as sequences split across reads are) for comparison, along
+with the cost of `EscCodeHandler.handle_csi` dispatching to `TerminalWindow`'s handlers alone.
+Run from the src directory: `python -m bench.bench_esc [frames]`
+"""
+import re
+import sys
+import time
+from core.vt_parser import VTParser
+from ui.term_window import HeadlessTerminal
+from bench.bench_logs import NullLogger
+
+cols: int = 120
+lines: int = 40
+
+def htop_frame(n: int) -> str:
+    """ Header meters then a coloured process table, with the cursor hidden throughout """
+    out: list[str] = ["\x1b[?25l\x1b[H"]
+    for cpu in range(4):
+        bar: str = "|" * ((n * 7 + cpu * 13) % 40)
+        out.append(f"\x1b[{cpu+1};3H\x1b[36m{cpu}\x1b[1;30m[\x1b[32m{bar}\x1b[31m||\x1b[30;1m{' '*(42-len(bar))}\x1b[0m{(n+cpu)%100:3d}%]\x1b[K")
+    out.append(f"\x1b[6;1H\x1b[30;42m  PID USER      PRI  NI  VIRT   RES   SHR S CPU% MEM%   TIME+  Command\x1b[K\x1b[m")
+    for row in range(7, lines):
+        pid: int = 1000 + row * 37
+        out.append(f"\x1b[{row};1H\x1b[m{pid:5d} \x1b[1;34mroot\x1b[m      20   0 \x1b[36m{(pid*13)%9999:5d}M\x1b[m "
+                   f"{(pid*7)%999:4d}M  \x1b[32m{n%4}\x1b[m \x1b[1mS\x1b[m  {(row+n)%50/10:3.1f}  0.{row%10} "
+                   f"\x1b[32m0:{n%60:02d}.{row:02d}\x1b[m /usr/bin/worker --id={row}\x1b[K")
+    out.append(f"\x1b[{lines};1H\x1b[30;46mF1\x1b[39;49mHelp  \x1b[30;46mF10\x1b[39;49mQuit\x1b[K\x1b[?25h")
+    return "".join(out)
+
+def vim_frame(n: int) -> str:
+    """ Syntax highlighted buffer with 256-colour and bold runs, a title and a status line """
+    out: list[str] = [f"\x1b]2;module_{n%5}.py (~/src) - VIM\x07\x1b[?25l\x1b[?2004h\x1b[H"]
+    for row in range(1, lines-1):
+        num: int = n + row
+        out.append(f"\x1b[{row};1H\x1b[33m{num:4d} \x1b[m\x1b[38;5;130mdef\x1b[m \x1b[38;5;33mhandler_{num}\x1b[m(self, "
+                   f"\x1b[1mevent\x1b[22m: \x1b[38;5;70mint\x1b[m = \x1b[38;5;166m{num}\x1b[m):\x1b[K")
+    out.append(f"\x1b[{lines-1};1H\x1b[1;7m module_{n%5}.py \x1b[27m{' '*40}{n},1  All\x1b[m\x1b[{lines};1H\x1b[K")
+    out.append(f"\x1b[{n%30+1};9H\x1b[?25h")
+    return "".join(out)
+
+def make_parser() -> VTParser:
+    """ A parser dispatching to the handlers `TerminalWindow` registers, without any curses windows """
+    return HeadlessTerminal(NullLogger(), (cols, lines)).parser
+
+def run(data, whole: bool) -> float:
+    parser: VTParser = make_parser()
+    if not whole: # Never match sequences whole, so every one goes through the state machine
+        parser.sequence_re = parser.sequence_bytes_re = re.compile(r"(?!)" if isinstance(data, str) else rb"(?!)")
+    start: float = time.perf_counter()
+    parser.feed(data)
+    return time.perf_counter() - start
+
+def dispatch_only(data: str) -> float:
+    """ `EscCodeHandler.handle_csi` alone, over the CSI sequences of `data` tokenized beforehand """
+    parser: VTParser = make_parser()
+    sequences: list = [match.group(1, 2, 3) for match in parser.sequence_re.finditer(data) if match.lastindex == 3]
+    handle_csi = parser.esc_handler.handle_csi
+    start: float = time.perf_counter()
+    for params, intermediates, final in sequences:
+        handle_csi(params, intermediates, final)
+    return (time.perf_counter() - start) / len(sequences)
+
+def main() -> None:
+    frames: int = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    for name, frame in (("htop", htop_frame), ("vim", vim_frame)):
+        data: str = "".join(frame(n) for n in range(frames))
+        sequences: int = data.count("\x1b")
+        for kind, stream in (("str", data), ("bytes", data.encode("utf8"))):
+            for whole in (True, False):
+                taken: float = min(run(stream, whole) for _ in range(5))
+                path: str = "whole" if whole else "stepped"
+                print(f"{name:4} {kind:5} {path:7}: {sequences} sequences, {taken/sequences*1e9:6.0f} ns/sequence (including text)")
+        print(f"{name:4} dispatch only: {min(dispatch_only(data) for _ in range(5))*1e9:6.0f} ns/CSI sequence")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""
+Measures logging overhead on the parse path while `cat`-ing a 10 MB build log.
+Run from the src directory: `python -m bench.bench_logs`
+"""
+import os
+import sys
+import time
+import tempfile
+from core.logs import Logger, DEBUG, INFO
+from core.char_display import CharDisplay
+from core.esc_code import EscCodeHandler
+from core.vt_parser import VTParser
+
+class NullLogger:
+    """ Logger stand-in which drops everything, the zero-overhead baseline """
+    def debug(self, msg, *args): pass
+    def info(self, msg, *args): pass
+    def warning(self, msg, *args): pass
+    def error(self, msg, exception=None): pass
+
+def build_log(size: int) -> str:
+    """ Compiler-style output with a coloured status every few lines """
+    lines: list[str] = []
+    total: int = 0
+    i: int = 0
+    while total < size:
+        if i % 8 == 0:
+            line = f"\x1b[1;32m[ {i*100//(size//60+1):3d}%]\x1b[0m Building CXX object src/module_{i}.cpp.o\r\n"
+        else:
+            line = f"src/module_{i}.cpp:{i%300}: warning: unused variable 'tmp{i}' [-Wunused-variable]\r\n"
+        lines.append(line)
+        total += len(line)
+        i += 1
+    return "".join(lines)
+
+def run(logs, data: str, chunk_size: int = 4096) -> float:
+    """ Feed `data` through the parser the way `TerminalWindow.update` does, returning seconds taken """
+    disp = CharDisplay(logs, (200, 50))
+    parser = VTParser(logs, disp, EscCodeHandler(logs, disp))
+    start: float = time.perf_counter()
+    for i in range(0, len(data), chunk_size):
+        chunk: str = data[i:i+chunk_size]
+        logs.debug("Chunk Received: %r", chunk)
+        parser.feed(chunk)
+    return time.perf_counter() - start
+
+def main() -> None:
+    size: int = int(sys.argv[1]) if len(sys.argv) > 1 else 10*1024*1024
+    data: str = build_log(size)
+    baseline: float = min(run(NullLogger(), data) for _ in range(3))
+    print(f"{len(data)/1e6:.1f} MB, no logging: {baseline:.3f}s")
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, level in (("debug", DEBUG), ("info", INFO)):
+            logs = Logger(os.path.join(tmp, f"{name}.log"), level=level)
+            taken: float = min(run(logs, data) for _ in range(3))
+            logs.close()
+            print(f"level={name}: {taken:.3f}s ({(taken-baseline)/baseline*100:+.1f}% vs no logging)")
+
+if __name__ == '__main__':
+    main()
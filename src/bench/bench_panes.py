@@ -0,0 +1,89 @@
+"""
+Aggregate parsing throughput of 1, 4 and 16 panes flooding output at once (`cat`-ing a coloured
+build log), with each pane parsed on a reader thread of the UI process as by default, and
+hosted by a worker process publishing its screen through shared memory (`panes processes`).
+Threads share the GIL, so only worker processes can make use of more than one core.
+Run from the src directory: `python -m bench.bench_panes [bytes per pane]`
+"""
+import os
+import sys
+import time
+import select
+import threading
+import tempfile
+from core.logs import Logger
+from core.char_display import CharDisplay
+from core.style import StyleTable
+from core.termproc import TerminalProcess
+from ui.term_window import HeadlessTerminal
+from ui.process_window import PaneProcess
+from bench.bench_logs import build_log
+
+cols: int = 120
+lines: int = 40
+
+def flood(path: str) -> bytes:
+    return f"cat {path}; exit\n".encode()
+
+def run_threads(logs, path: str, panes: int) -> float:
+    """ Seconds until every pane has parsed its log, each on a reader thread """
+    terms: list[HeadlessTerminal] = []
+    for _ in range(panes):
+        term: TerminalProcess = TerminalProcess(decode=False)
+        term.resize(cols, lines)
+        terms.append(HeadlessTerminal(logs, (cols, lines), term=term))
+    prompted: list[threading.Event] = [threading.Event() for _ in terms]
+    for term, event in zip(terms, prompted):
+        term.start_reader(lambda term, event=event: event.set())
+    for event in prompted: # Shells are up once they have printed their prompt
+        event.wait()
+    start: float = time.perf_counter()
+    for term in terms:
+        term.term.send(flood(path))
+    for term in terms:
+        term.reader.join()
+    taken: float = time.perf_counter() - start
+    for term in terms:
+        term.stop_reader()
+    return taken
+
+def run_processes(logs, path: str, panes: int) -> float:
+    """ Seconds until every pane has parsed its log, each in a worker process, with the screens copied out as the UI would """
+    styles: StyleTable = StyleTable()
+    hosts: list = [(PaneProcess(logs, cols, lines), CharDisplay(logs, (cols, lines))) for _ in range(panes)]
+    for host, disp in hosts: # Workers are up once their shell has printed its prompt
+        host.conn.recv_bytes()
+        host.screen.copy_into(disp, styles.unpack)
+    start: float = time.perf_counter()
+    for host, _ in hosts:
+        host.send(flood(path))
+    waiting: list = list(hosts)
+    while waiting:
+        readable, _, _ = select.select([host.stdout for host, _ in waiting], [], [])
+        for host, disp in list(waiting):
+            if host.stdout in readable:
+                host.receive()
+                host.screen.copy_into(disp, styles.unpack)
+                if host.closed:
+                    waiting.remove((host, disp))
+    taken: float = time.perf_counter() - start
+    for host, _ in hosts:
+        host.close()
+    return taken
+
+def main() -> None:
+    size: int = int(sys.argv[1]) if len(sys.argv) > 1 else 1024*1024
+    print(f"{os.cpu_count()} cores, {size/1e6:.1f} MB per pane")
+    with tempfile.TemporaryDirectory() as tmp:
+        path: str = os.path.join(tmp, "build.log")
+        with open(path, "w") as f:
+            f.write(build_log(size))
+        logs = Logger(os.path.join(tmp, "bench.log"))
+        for panes in (1, 4, 16):
+            for name, run in (("threads", run_threads), ("processes", run_processes)):
+                taken: float = run(logs, path, panes)
+                print(f"{panes:2d} panes, {name:9}: {taken:6.2f}s, {panes*size/taken/1e6:6.2f} MB/s aggregate")
+        logs.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""
+Split-to-prompt latency: from a new pane asking for a shell until the shell's prompt has been
+parsed, for a shell started then (`TerminalProcess`) and one adopted from a `ShellPool` of shells
+started ahead. A prompt counts as up once the shell has gone quiet for `quiet` seconds, and is
+timed at its last output. Also how long starting a shell blocks the caller (ie. the UI) for,
+against `subprocess.Popen` with a Python `preexec_fn` making the pty the controlling tty.
+Run from the src directory: `python -m bench.bench_spawn [samples]`
+"""
+import os
+import sys
+import pty
+import time
+import fcntl
+import select
+import termios
+import tempfile
+import statistics
+import subprocess
+from typing import Callable, List
+from core.logs import Logger
+from core.termproc import TerminalProcess, ShellPool
+from ui.term_window import HeadlessTerminal
+
+cols: int = 80
+lines: int = 24
+quiet: float = 0.3
+
+def to_prompt(logs, spawn: Callable[[], TerminalProcess]) -> float:
+    """ Seconds from calling `spawn` until the shell it returns has printed its prompt, as parsed by a pane """
+    start: float = time.perf_counter()
+    term: TerminalProcess = spawn()
+    terminal: HeadlessTerminal = HeadlessTerminal(logs, (cols, lines), term=term)
+    last: float = None
+    deadline: float = start + 30
+    while not term.closed and time.perf_counter() < deadline:
+        if not select.select([term.stdout], [], [], quiet)[0]:
+            if last is not None:
+                break
+            continue
+        if terminal.update():
+            last = time.perf_counter()
+    term.close()
+    term.proc.wait()
+    if last is None:
+        raise TimeoutError("The shell printed no prompt")
+    return last - start
+
+def spawn_popen() -> float:
+    """ Seconds `subprocess.Popen` blocks for starting a shell on a pty with a `preexec_fn` """
+    master, slave = pty.openpty()
+    def preexec() -> None:
+        os.setsid()
+        fcntl.ioctl(0, termios.TIOCSCTTY, 0)
+    start: float = time.perf_counter()
+    proc = subprocess.Popen([os.environ.get("SHELL", "/bin/bash")], stdin=slave, stdout=slave, stderr=slave,
+                            close_fds=True, preexec_fn=preexec)
+    taken: float = time.perf_counter() - start
+    os.close(slave)
+    os.close(master)
+    proc.wait()
+    return taken
+
+def spawn_posix() -> float:
+    """ Seconds `TerminalProcess` blocks for starting a shell """
+    start: float = time.perf_counter()
+    term: TerminalProcess = TerminalProcess(decode=False, size=(cols, lines))
+    taken: float = time.perf_counter() - start
+    term.close()
+    term.proc.wait()
+    return taken
+
+def report(name: str, samples: List[float]) -> None:
+    samples = sorted(samples)
+    print(f"{name:24} {statistics.median(samples)*1000:8.2f} ms median {samples[int(len(samples)*0.95)]*1000:8.2f} ms p95")
+
+def main() -> None:
+    samples: int = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    print(f"{os.cpu_count()} cores, shell {os.environ.get('SHELL', '/bin/bash')}, {samples} samples")
+    report("spawn, Popen+preexec", [spawn_popen() for _ in range(samples)])
+    report("spawn, posix_spawn", [spawn_posix() for _ in range(samples)])
+    with tempfile.TemporaryDirectory() as tmp:
+        logs = Logger(os.path.join(tmp, "bench.log"))
+        spawned: List[float] = [to_prompt(logs, lambda: TerminalProcess(decode=False, size=(cols, lines)))
+                                for _ in range(samples)]
+        report("split to prompt, spawned", spawned)
+        # Pooled shells are left twice as long as shells took to start, so they are ready when adopted
+        warmup: float = 2 * max(spawned)
+        pool: ShellPool = ShellPool(1, cols, lines)
+        pooled: List[float] = []
+        for _ in range(samples):
+            time.sleep(warmup)
+            pooled.append(to_prompt(logs, lambda: pool.take(cols, lines)))
+            pool.fill()
+        pool.close()
+        report("split to prompt, pooled", pooled)
+        logs.close()
+
+if __name__ == '__main__':
+    main()
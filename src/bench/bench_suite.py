@@ -0,0 +1,259 @@
+"""
+Headless benchmark suite of the emulator core, to catch regressions between commits.
+
+Core: each corpus is fed through `TerminalWindow._parse` (a `HeadlessTerminal` with scrollback, so
+`VTParser`, `EscCodeHandler` and `CharDisplay` run as in a pane) in 4 KB chunks, without curses or a pty.
+Reported are MB/s, escape sequences/s, the tracemalloc peak while parsing and the peak RSS so far
+(process wide, corpora always run in the same order so runs stay comparable).
+Corpora: a plain ASCII flood, `ls --color`, a `vim` session, `htop` refreshes, CJK text, and any
+recordings given (see `core.recording`).
+
+End-to-end: a real shell through `TerminalProcess` on a pty, read, parsed and rendered on one thread
+(the damaged spans are extracted as `TerminalWindow.draw` does, minus the curses calls):
+    echo:     keystroke sent until its echo has been rendered, median and 95th percentile
+    command:  `printf` sent until its output has been rendered
+    cat:      `cat` of each corpus until all of it has been rendered, in MB/s
+
+Results can be saved as JSON along with the commit, and compared against an earlier run's.
+Run from the src directory: `python -m bench.bench_suite [--size BYTES] [--json PATH] [--compare PATH] [--recording FILE ...] [--no-e2e]`
+"""
+import os
+import json
+import time
+import select
+import platform
+import argparse
+import resource
+import tempfile
+import statistics
+import subprocess
+import tracemalloc
+from typing import Callable, Dict, List
+from core.logs import Logger
+from core.scrollback import Scrollback
+from core.termproc import TerminalProcess
+from core.recording import Recording
+from ui.term_window import HeadlessTerminal
+from bench.bench_logs import NullLogger
+from bench.bench_esc import htop_frame, vim_frame, cols, lines
+from bench.bench_decode import build_cjk
+
+chunk_size: int = 4096
+
+def build_ascii(size: int) -> bytes:
+    """ Plain text and newlines only, the parser's fastest path """
+    line: bytes = b"The quick brown fox jumps over the lazy dog, 0123456789 times over and over again\r\n"
+    return line * (size // len(line) + 1)
+
+def build_ls(size: int) -> bytes:
+    """ `ls --color` of a large directory, a short coloured run per entry """
+    colours: List[str] = ["01;34", "01;32", "01;36", "0", "01;31", "40;33;01"]
+    out: List[str] = []
+    total: int = 0
+    i: int = 0
+    while total < size:
+        row: str = "".join(f"\x1b[0m\x1b[{colours[(i+col) % len(colours)]}mentry_{i+col:06d}.dat\x1b[0m  " for col in range(5)) + "\r\n"
+        out.append(row)
+        total += len(row)
+        i += 5
+    return "".join(out).encode("utf8")
+
+def build_frames(frame: Callable[[int], str], size: int) -> bytes:
+    out: List[str] = []
+    total: int = 0
+    n: int = 0
+    while total < size:
+        out.append(frame(n))
+        total += len(out[-1])
+        n += 1
+    return "".join(out).encode("utf8")
+
+def build_corpora(size: int, recordings: List[str]) -> Dict[str, bytes]:
+    corpora: Dict[str, bytes] = {
+        "ascii": build_ascii(size),
+        "ls": build_ls(size),
+        "vim": build_frames(vim_frame, size),
+        "htop": build_frames(htop_frame, size),
+        "cjk": build_cjk(size),
+    }
+    for path in recordings:
+        recording: Recording = Recording(path)
+        corpora[os.path.basename(path)] = b"".join(recording.output())
+        recording.close()
+    return corpora
+
+def make_terminal(logs, term: TerminalProcess = None) -> HeadlessTerminal:
+    return HeadlessTerminal(logs, (cols, lines), term=term, history=Scrollback(10000))
+
+def parse(data: bytes) -> float:
+    """ Seconds taken to parse `data` in `chunk_size` reads """
+    terminal: HeadlessTerminal = make_terminal(NullLogger())
+    view: memoryview = memoryview(data)
+    start: float = time.perf_counter()
+    for i in range(0, len(data), chunk_size):
+        terminal._parse(view[i:i+chunk_size])
+    return time.perf_counter() - start
+
+def alloc_peak(data: bytes) -> int:
+    """ Peak bytes allocated while parsing `data`, as traced by tracemalloc """
+    tracemalloc.start()
+    parse(data)
+    peak: int = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+def peak_rss() -> int:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024 # Reported in KB on Linux
+
+def bench_core(corpora: Dict[str, bytes], repeat: int = 3) -> Dict[str, dict]:
+    results: Dict[str, dict] = {}
+    for name, data in corpora.items():
+        taken: float = min(parse(data) for _ in range(repeat))
+        sequences: int = data.count(b"\x1b")
+        results[name] = {
+            "bytes": len(data),
+            "mb_per_s": len(data) / 1e6 / taken,
+            "sequences_per_s": sequences / taken,
+            "alloc_peak_kb": alloc_peak(data) / 1024,
+            "peak_rss_mb": peak_rss() / 1e6,
+        }
+        print(f"{name:12} {results[name]['mb_per_s']:7.2f} MB/s {results[name]['sequences_per_s']/1e6:6.2f} M sequences/s "
+              f"{results[name]['alloc_peak_kb']:9.0f} KB alloc peak {results[name]['peak_rss_mb']:7.1f} MB peak RSS")
+    return results
+
+class Shell:
+    """ A shell on a pty whose output is read, parsed and rendered on the calling thread """
+    def __init__(self, logs) -> None:
+        term: TerminalProcess = TerminalProcess(decode=False)
+        term.resize(cols, lines)
+        self.terminal: HeadlessTerminal = make_terminal(logs, term)
+        self.term: TerminalProcess = term
+        self.run_command("printf 'bench-%s\\n' ready") # Also waits out the shell's startup
+        self.settle()
+
+    def render(self) -> List[str]:
+        """ Extract damaged spans the way `TerminalWindow.draw` does, returns their text """
+        disp = self.terminal.char_disp
+        disp.take_scrolls()
+        spans: List[str] = []
+        for y, (start_x, end_x) in disp.take_damage().items():
+            spans.append(disp.view_text(y, start_x, end_x))
+            disp.view_attrs(y, start_x, end_x)
+        return spans
+
+    def pump(self, done: Callable[[List[str]], bool], timeout: float = 60.0) -> None:
+        """ Read, parse and render until `done` is true of the spans rendered """
+        deadline: float = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            select.select([self.term.stdout], [], [], 0.1)
+            self.terminal.update()
+            if done(self.render()):
+                return
+        raise TimeoutError("The shell did not answer in time")
+
+    def settle(self, quiet: float = 0.3) -> None:
+        """ Read until the shell has been quiet for `quiet` seconds, ie. its prompt is up """
+        while select.select([self.term.stdout], [], [], quiet)[0]:
+            self.terminal.update()
+            self.render()
+
+    def run_command(self, command: str, marker: str = "bench-ready") -> float:
+        """ Seconds from sending `command` until `marker` has been rendered, which must not appear in `command` itself """
+        start: float = time.perf_counter()
+        self.term.send(command.encode() + b"\n")
+        self.pump(lambda spans: any(marker in span for span in spans))
+        return time.perf_counter() - start
+
+    def echo(self) -> float:
+        """ Seconds from sending a keystroke until its echo has been rendered """
+        curs = self.terminal.char_disp.curs
+        x: int = curs.x
+        start: float = time.perf_counter()
+        self.term.send(b"x")
+        self.pump(lambda spans: curs.x != x)
+        return time.perf_counter() - start
+
+    def close(self) -> None:
+        self.term.send(b"\x15exit\n")
+        self.term.proc.wait()
+
+def percentiles(samples: List[float]) -> dict:
+    samples = sorted(samples)
+    return {"median_ms": statistics.median(samples) * 1000, "p95_ms": samples[int(len(samples) * 0.95)] * 1000}
+
+def bench_e2e(corpora: Dict[str, bytes], samples: int = 40) -> Dict[str, dict]:
+    results: Dict[str, dict] = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        logs = Logger(os.path.join(tmp, "bench.log"))
+        shell: Shell = Shell(logs)
+        results["echo"] = percentiles([shell.echo() for _ in range(samples)])
+        shell.term.send(b"\x15") # Clear the line of echoed keystrokes
+        shell.settle()
+        command: List[float] = []
+        for i in range(samples):
+            command.append(shell.run_command(f"printf 'bench-%s\\n' {i}", f"bench-{i}"))
+            shell.settle(0.05)
+        results["command"] = percentiles(command)
+        for name in ("echo", "command"):
+            print(f"e2e {name:8} {results[name]['median_ms']:7.2f} ms median {results[name]['p95_ms']:7.2f} ms p95")
+        for name, data in corpora.items():
+            path: str = os.path.join(tmp, name)
+            with open(path, "wb") as f:
+                f.write(data)
+            taken: float = shell.run_command(f"cat {path}; printf 'bench-%s\\n' done", "bench-done")
+            results[f"cat {name}"] = {"mb_per_s": len(data) / 1e6 / taken}
+            print(f"e2e cat {name:12} {results[f'cat {name}']['mb_per_s']:7.2f} MB/s")
+        shell.close()
+        logs.close()
+    return results
+
+def commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(__file__)).stdout.strip() or None
+    except OSError:
+        return None
+
+def compare(results: dict, path: str) -> None:
+    """ Print the change of every metric since the results saved at `path` """
+    with open(path) as f:
+        old: dict = json.load(f)
+    print(f"\nChange since {old.get('commit') or path}:")
+    if old.get("size") != results["size"]:
+        print(f"(corpora were {old.get('size')} bytes then, {results['size']} now)")
+    for section in ("core", "e2e"):
+        for name, metrics in results.get(section, {}).items():
+            before: dict = old.get(section, {}).get(name)
+            if not before:
+                continue
+            changes: List[str] = [f"{metric} {(value - before[metric]) / before[metric] * 100:+.1f}%"
+                                  for metric, value in metrics.items() if before.get(metric) and metric != "bytes"]
+            print(f"{section} {name:12} {', '.join(changes)}")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size", type=int, default=4*1024*1024, help="bytes of each generated corpus")
+    parser.add_argument("--json", metavar="PATH", help="save results to PATH")
+    parser.add_argument("--compare", metavar="PATH", help="compare with results saved earlier")
+    parser.add_argument("--recording", nargs="*", default=[], metavar="FILE", help="recordings to add as corpora")
+    parser.add_argument("--no-e2e", action="store_true", help="skip the end-to-end benchmarks on a pty")
+    args = parser.parse_args()
+    corpora: Dict[str, bytes] = build_corpora(args.size, args.recording)
+    results: dict = {
+        "commit": commit(),
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": f"{platform.machine()}, {os.cpu_count()} cores",
+        "size": args.size,
+        "core": bench_core(corpora),
+    }
+    if not args.no_e2e:
+        results["e2e"] = bench_e2e(corpora)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        compare(results, args.compare)
+
+if __name__ == '__main__':
+    main()
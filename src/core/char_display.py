@@ -1,5 +1,8 @@
-import curses.ascii
-from typing import Tuple, List
+from array import array
+from typing import Callable, Tuple, List, Dict
+from core.scrollback import Line, Scrollback
+
+BLANK = " "
 
 class Cursor:
     """
@@ -18,82 +21,486 @@ class Cursor:
     def __repr__(self):
         return f"<Cursor x={self.x} y={self.y}>"
 
-class CharCell:
-    """
-    The smallest unit of each `CharDisplay`, each emulating a single
-    cell on a terminal display.
-    """
-    def __init__(self, char=""):
-        self.data = char
-    def __repr__(self):
-        return self.data
-
 class CharDisplay:
     """
     Backend terminal drawing and manipulation before being used duplicated to actual UI.
     This class exists because performing controlled manipulation of terminal cells
     to the UI itself in realtime would not only be extremely tedious, but also painfully slow.
+
+    Cells are stored in one flat preallocated array of characters per screen, with a
+    parallel array of attributes: ids into the shared `StyleTable`. `rows` maps each on-screen row to its physical row in
+    those arrays, so scrolling only rotates row indices and never allocates cells.
+    A cursor x equal to the display width means a wrap is pending: the last column has
+    been written and the next printable character will start a new line.
+
+    Every mutation records the span of cells it touched in `damage`, keyed by
+    on-screen row, so the UI only needs to repaint what actually changed.
+    Scrolling is recorded in `scrolls` instead, as (top, bottom, lines) operations for
+    the UI to replay with hardware scrolling before repainting the damaged spans, which
+    are kept relative to the scrolled content.
+
+    Scrolling happens within the margins set by DECSTBM, `top` and `bottom` (inclusive),
+    and only rotates row indices within them.
+
+    Rows scrolled off the top are pushed into `history`, if any, and the view
+    can be scrolled back into it without disturbing the live screen.
+
+    `wrapped` flags the physical rows which were soft-wrapped, ie. whose text carries on
+    in the next row because it ran past the last column rather than being ended by a
+    newline. Resizing uses them to rewrap logical lines to the new width, see `resize()`.
+
+    Besides the primary screen there is an alternate screen for full-screen programs,
+    allocated on first use. Only the active screen's storage lives in `chars`, `attrs`
+    and `rows`, the other one is set aside in `_other`, so switching swaps references
+    rather than copying cells. Nothing is pushed into history on the alternate screen.
     """
-    def __init__(self, logs, size):
+    def __init__(self, logs, size, history: Scrollback = None):
         self.logs = logs
+        self.history: Scrollback = history
+        self.view_offset: int = 0 # Lines the view is scrolled back into history, 0 when following live output
         self.size: Tuple[int, int] = size
         self.curs: Cursor = Cursor(0, 0)
-        self.buffer: List[List[CharCell]] = [[CharCell() for _ in range(self.size[0])] for _ in range(self.size[1])]
+        self.attr: int = 0 # Style id stamped onto written cells
+        self.alternate: bool = False # Whether the alternate screen is active
+        self.saved_curs: Tuple[int, int, int] = None # Cursor position and style saved by `save_cursor()`
+        self._other: tuple = None # (chars, attrs, rows, wrapped, saved_curs) of the inactive screen, if allocated
+        self.damage: Dict[int, Tuple[int, int]] = {} # row -> (start_x, end_x) of cells changed since last draw
+        self.scrolls: List[List[int]] = [] # [top, bottom, lines] scrolled up (down if negative) since last draw
+        self._alloc(*size)
+
+    def _alloc(self, cols: int, lines: int) -> None:
+        """ (Re)allocate blank cell storage for a display of the given size """
+        self.chars: array = array('u', BLANK * (cols*lines))
+        self.attrs: array = array('H', [0]) * (cols*lines)
+        self.rows: List[int] = list(range(lines))
+        self.wrapped: bytearray = bytearray(lines) # Per physical row, like `rows` indexes
+        self._blank_chars: array = array('u', BLANK * cols)
+        self._blank_attrs: array = array('H', [0]) * cols
+        self.top: int = 0
+        self.bottom: int = lines-1
+        self.damage_all()
+
+    def _damage(self, y: int, start_x: int, end_x: int) -> None:
+        """ Mark cells [start_x, end_x) of on-screen row `y` as needing a repaint """
+        span = self.damage.get(y)
+        if span is None:
+            self.damage[y] = (start_x, end_x)
+        elif start_x < span[0] or end_x > span[1]:
+            self.damage[y] = (min(start_x, span[0]), max(end_x, span[1]))
+
+    def damage_all(self) -> None:
+        """ Mark the whole display as needing a repaint """
+        cols, lines = len(self._blank_chars), len(self.rows)
+        self.damage = {y: (0, cols) for y in range(lines)}
+        self.scrolls = []
+
+    def take_damage(self) -> Dict[int, Tuple[int, int]]:
+        """ Return damaged spans accumulated since the last call and reset them """
+        if self.view_offset and self.damage:
+            # Screen rows are shown shifted down while scrolled back, so repaint the whole view
+            self.damage_all()
+        damage = self.damage
+        self.damage = {}
+        return damage
+
+    def take_scrolls(self) -> List[List[int]]:
+        """ Return scroll operations accumulated since the last call, to be replayed before painting `take_damage()` """
+        scrolls = self.scrolls
+        self.scrolls = []
+        return scrolls
+
+    def _damage_scroll(self, top: int, bottom: int, amnt: int) -> None:
+        """ Record rows [top, bottom] scrolling up by `amnt` (down if negative) """
+        height: int = bottom-top+1
+        last = self.scrolls[-1] if self.scrolls else None
+        if last and last[0] == top and last[1] == bottom and abs(last[2]) >= height:
+            return # Region is already repainted in full
+        # Damage already recorded within the region moves along with its content
+        damage: Dict[int, Tuple[int, int]] = {}
+        for y, span in self.damage.items():
+            if y < top or y > bottom:
+                damage[y] = span
+            elif top <= y-amnt <= bottom:
+                damage[y-amnt] = span
+        self.damage = damage
+        if last and last[0] == top and last[1] == bottom and (last[2] > 0) == (amnt > 0):
+            last[2] += amnt
+        else:
+            last = [top, bottom, amnt]
+            self.scrolls.append(last)
+        if abs(last[2]) >= height:
+            # Nothing on screen survives, so the region is painted from scratch
+            for y in range(top, bottom+1):
+                self.damage[y] = (0, self.size[0])
+
+    def _offset(self, y: int) -> int:
+        """ Index of the first cell of on-screen row `y` within `chars` and `attrs` """
+        return self.rows[y] * self.size[0]
+
+    def row_text(self, y: int, start_x: int = 0, end_x: int = None) -> str:
+        """ Text content of on-screen row `y`, optionally only of cells [start_x, end_x) """
+        start: int = self._offset(y)
+        if end_x is None:
+            end_x = self.size[0]
+        return self.chars[start+start_x:start+end_x].tounicode()
+
+    def view_text(self, y: int, start_x: int = 0, end_x: int = None) -> str:
+        """ Text shown on row `y` of the view, which may be scrolled back into history """
+        if end_x is None:
+            end_x = self.size[0]
+        if y >= self.view_offset:
+            return self.row_text(y - self.view_offset, start_x, end_x)
+        return self.history.view_line(self.view_offset-1 - y)[0][start_x:end_x].ljust(end_x-start_x)
+
+    def view_attrs(self, y: int, start_x: int = 0, end_x: int = None) -> array:
+        """ Style ids of the cells shown on row `y` of the view, see `view_text()` """
+        if end_x is None:
+            end_x = self.size[0]
+        if y >= self.view_offset:
+            start: int = self._offset(y - self.view_offset)
+            return self.attrs[start+start_x:start+end_x]
+        attrs: array = self.history.view_line(self.view_offset-1 - y)[1] or array('H')
+        attrs = attrs[start_x:end_x]
+        return attrs + self._blank_attrs[:end_x-start_x-len(attrs)]
+
+    def line_number(self, y: int, exact: bool = False) -> int:
+        """
+        Absolute number of the line shown on view row `y`, counting every line since the display was created.
+        History rewrapped since it was pushed only shows part of a line on some rows, for which this is
+        approximate, or None if `exact`
+        """
+        if self.history is None:
+            return y
+        if y >= self.view_offset:
+            return self.history.dropped + len(self.history) + y - self.view_offset
+        line_no, shown = self.history.view_line_number(self.view_offset-1 - y)
+        return line_no if shown or not exact else None
+
+    def scroll_view(self, amnt: int) -> None:
+        """ Scroll the view `amnt` lines back into history, or forwards if negative """
+        # History belongs to the primary screen, full-screen programs scroll by themselves
+        limit: int = self.history.view_len(self.view_offset + amnt) if self.history and not self.alternate else 0
+        offset: int = max(0, min(limit, self.view_offset + amnt))
+        if offset != self.view_offset:
+            self.view_offset = offset
+            self.damage_all()
+
+    def use_alternate(self, alternate: bool) -> None:
+        """ Switch to the alternate screen, or back to the primary one """
+        if alternate == self.alternate:
+            return
+        current: tuple = (self.chars, self.attrs, self.rows, self.wrapped, self.saved_curs)
+        if self._other is None:
+            cols, lines = self.size
+            self._other = (array('u', BLANK * (cols*lines)), array('H', [0]) * (cols*lines), list(range(lines)), bytearray(lines), None)
+        self.chars, self.attrs, self.rows, self.wrapped, self.saved_curs = self._other
+        self._other = current
+        self.alternate = alternate
+        self.view_offset = 0
+        self.damage_all()
+
+    def save_cursor(self) -> None:
+        """ DECSC, remember the cursor position and style of the current screen """
+        self.saved_curs = (self.curs.x, self.curs.y, self.attr)
+
+    def restore_cursor(self) -> None:
+        """ DECRC, back to where `save_cursor()` was last called on this screen, or home if never """
+        x, y, self.attr = self.saved_curs or (0, 0, 0)
+        self.curs.set_pos(min(x, self.size[0]), min(y, self.size[1]-1))
+
+    def row_attrs(self, y: int) -> array:
+        """ Attributes of on-screen row `y` """
+        start: int = self._offset(y)
+        return self.attrs[start:start+self.size[0]]
+
+    def load_row(self, y: int, text: str, attrs: array) -> None:
+        """ Overwrite on-screen row `y` as a whole, for displays mirroring one kept elsewhere """
+        start: int = self._offset(y)
+        self.chars[start:start+self.size[0]] = array('u', text)
+        self.attrs[start:start+self.size[0]] = attrs
+        self.wrapped[self.rows[y]] = False
+        self._damage(y, 0, self.size[0])
+
+    def snapshot(self, pack: Callable[[int], int]) -> tuple:
+        """
+        Both screens, the cursor, margins and current style as plain values, for `restore()` to
+        rebuild the display from, eg. in another process. `pack` maps our style ids to packed styles.
+        Soft-wrapping is not kept, rows restored are treated as ended by newlines
+        """
+        cols, lines = self.size
+        saved = lambda curs: (curs[0], curs[1], pack(curs[2])) if curs else None
+        other: tuple = None
+        if self._other is not None:
+            chars, attrs, rows, _, saved_curs = self._other
+            other = self._screen_state(chars, attrs, rows, pack) + (saved(saved_curs),)
+        return ((cols, lines, self.curs.x, self.curs.y, pack(self.attr), self.top, self.bottom, self.alternate, saved(self.saved_curs))
+                + self._screen_state(self.chars, self.attrs, self.rows, pack) + (other,))
+
+    def _screen_state(self, chars: array, attrs: array, rows: List[int], pack: Callable[[int], int]) -> Tuple[str, bytes]:
+        """ Text of a screen in on-screen row order, and its packed styles (None if all default) """
+        cols: int = self.size[0]
+        text: str = "".join(chars[row*cols:(row+1)*cols].tounicode() for row in rows)
+        ordered: array = array('H')
+        for row in rows:
+            ordered += attrs[row*cols:(row+1)*cols]
+        return (text, array('Q', map(pack, ordered)).tobytes() if any(ordered) else None)
+
+    def restore(self, state: tuple, unpack: Callable[[int], int]) -> None:
+        """ Take on a `snapshot()`, size included, `unpack` maps packed styles to our style ids """
+        cols, lines, x, y, attr, top, bottom, alternate, saved_curs, text, styles, other = state
+        saved = lambda curs: (curs[0], curs[1], unpack(curs[2])) if curs else None
+        self._alloc(cols, lines)
+        self.size = (cols, lines)
+        self.chars, self.attrs = self._load_screen(text, styles, unpack)
+        self.top, self.bottom = top, bottom
+        self.curs.set_pos(x, y)
+        self.attr = unpack(attr)
+        self.saved_curs = saved(saved_curs)
+        self.alternate = alternate
+        self.view_offset = 0
+        self._other = None
+        if other is not None:
+            chars, attrs = self._load_screen(other[0], other[1], unpack)
+            self._other = (chars, attrs, list(range(lines)), bytearray(lines), saved(other[2]))
+
+    @staticmethod
+    def _load_screen(text: str, styles: bytes, unpack: Callable[[int], int]) -> Tuple[array, array]:
+        if styles is None:
+            return array('u', text), array('H', [0]) * len(text)
+        packed: array = array('Q')
+        packed.frombytes(styles)
+        return array('u', text), array('H', map(unpack, packed))
 
     def resize(self, new_x: int, new_y: int) -> None:
         """
-        Resize display, usually called as a result of `vsplit` or `hsplit`
+        Resize display, usually called as a result of `vsplit` or `hsplit`. The primary screen is
+        reflowed: its logical lines are rewrapped to the new width, and rows which no longer fit above
+        the cursor are pushed into history. Rows of its first line which were pushed there already are
+        taken back first (see `Scrollback.take_wrapped()`), so a line is rewrapped whole. History itself is only rewrapped as it is scrolled into view
+        (see `Scrollback.reflow()`), so resizing takes as long however much of it there is.
+        The alternate screen is cut to size, full-screen programs repaint it anyway
         """
-        # Remove excess rows if neccesary 
-        if self.size[1] > new_y:
-            new = self.buffer[:self.curs.y+1] # rows before and including cursor row
-            if len(new) > new_y:
-                self.buffer = new[-new_y:] # Take last <new_y> rows from <new> if have excess
-            else:
-                self.buffer = self.buffer[-new_y:] # Take last <new_y> rows from entire buffer
-        # Remove excess cells from rows if neccesary
-        if self.size[0] > new_x:
-            for y in range(len(self.buffer)):
-                self.buffer[y] = self.buffer[y][:new_x] # row = first <new_x> cells
-        # Adjust cursor if outside new boundaries
-        if self.curs.x >= new_x:
-            self.curs.x = new_x-1
-        if self.curs.y >= new_y:
-            self.curs.y = new_y-1
+        old_size: Tuple[int, int] = self.size
+        head: List[Line] = [] # Rows of history the primary screen's first line started on
+        if self.history is not None and new_x != old_size[0]:
+            head = self.history.take_wrapped()
+            self.history.reflow(new_x)
+        if self.alternate:
+            old_chars, old_attrs, old_rows = self.chars, self.attrs, self.rows
+            # Drop rows from the top if the cursor row would no longer fit
+            first: int = max(0, self.curs.y+1 - new_y)
+            self._alloc(new_x, new_y)
+            self._copy_cells(old_chars, old_attrs, old_rows, old_size, self.chars, self.attrs, (new_x, new_y), first)
+            self.curs.set_pos(min(self.curs.x, new_x-1), min(self.curs.y - first, new_y-1))
+            # The primary screen keeps its contents for when the full-screen program exits
+            chars, attrs, rows, wrapped, saved = self._other
+            x, y = saved[:2] if saved else (0, 0)
+            chars, attrs, wrapped, (x, y) = self._reflow(chars, attrs, rows, wrapped, old_size, (new_x, new_y), (x, y), head)
+            if saved:
+                saved = (min(x, new_x-1), y, saved[2])
+            self._other = (chars, attrs, list(range(new_y)), wrapped, saved)
+        else:
+            screen: tuple = (self.chars, self.attrs, self.rows, self.wrapped)
+            self._alloc(new_x, new_y)
+            self.chars, self.attrs, self.wrapped, (x, y) = self._reflow(*screen, old_size, (new_x, new_y), self.curs.get_pos(), head)
+            self.curs.set_pos(x, y)
+            self._other = None # Alternate screen contents are not worth keeping, it is reallocated on next use
         # Set new display size
         self.size = (new_x, new_y)
+        if self.history is not None:
+            self.view_offset = min(self.view_offset, self.history.view_len())
+
+    def _reflow(self, chars: array, attrs: array, rows: List[int], wrapped: bytearray, size: Tuple[int, int],
+                new_size: Tuple[int, int], curs: Tuple[int, int], head: List[Line] = ()) -> Tuple[array, array, bytearray, Tuple[int, int]]:
+        """
+        Rewrap the logical lines of a screen into fresh storage of another size, keeping the cursor on the
+        same cell of its line. `head` are rows taken back from history which the first line started on.
+        Returns the new (chars, attrs, wrapped) in on-screen row order, and the cursor
+        """
+        old_x, old_y = size
+        new_x, new_y = new_size
+        curs_x, curs_y = curs
+        head_text: str = "".join(text for text, _ in head)
+        head_attrs: array = array('H')
+        for text, line_attrs in head:
+            head_attrs += line_attrs if line_attrs is not None else array('H', [0]) * len(text)
+        # Join rows into logical lines, trailing blanks trimmed
+        lines: List[Tuple[str, array]] = []
+        curs_line: int = 0
+        curs_at: int = 0 # Cell of its logical line the cursor is on
+        first: int = 0
+        for y, row in enumerate(rows):
+            if y == curs_y:
+                curs_line, curs_at = len(lines), (y-first)*old_x + curs_x + (len(head_text) if not lines else 0)
+            if wrapped[row] and y < old_y-1:
+                continue
+            text: str = "".join(chars[r*old_x:(r+1)*old_x].tounicode() for r in rows[first:y+1])
+            line_attrs: array = array('H')
+            if not lines:
+                text, line_attrs = head_text + text, head_attrs[:]
+            for r in rows[first:y+1]:
+                line_attrs += attrs[r*old_x:(r+1)*old_x]
+            length: int = Scrollback.trimmed_length(text, line_attrs)
+            lines.append((text[:length], line_attrs[:length]))
+            first = y+1
+        # Blank lines below the cursor would only push what is above it off the top
+        while len(lines) > curs_line+1 and not lines[-1][0]:
+            lines.pop()
+        # Rewrap them, the cursor's line taking as many rows as it needs to reach the cursor
+        new_rows: List[Tuple[str, array, bool]] = []
+        new_curs: Tuple[int, int] = (0, 0)
+        for i, (text, line_attrs) in enumerate(lines):
+            count: int = max(1, -(-len(text) // new_x))
+            if i == curs_line:
+                if curs_x >= old_x and curs_at and curs_at % new_x == 0:
+                    new_curs = (new_x, len(new_rows) + curs_at//new_x - 1) # Still pending a wrap
+                else:
+                    new_curs = (curs_at % new_x, len(new_rows) + curs_at//new_x)
+                count = max(count, new_curs[1] - len(new_rows) + 1)
+            for k in range(count):
+                new_rows.append((text[k*new_x:(k+1)*new_x], line_attrs[k*new_x:(k+1)*new_x], k < count-1))
+        # Rows which no longer fit above the cursor go into history, those below are lost
+        drop: int = min(max(0, len(new_rows) - new_y), new_curs[1])
+        new_chars: array = array('u', BLANK * (new_x*new_y))
+        new_attrs: array = array('H', [0]) * (new_x*new_y)
+        new_wrapped: bytearray = bytearray(new_y)
+        for y, (text, line_attrs, soft) in enumerate(new_rows[:drop+new_y]):
+            if y < drop:
+                if self.history is not None:
+                    self.history.push(text.ljust(new_x), line_attrs + self._blank_attrs[len(line_attrs):], soft)
+                continue
+            start: int = (y-drop) * new_x
+            new_chars[start:start+len(text)] = array('u', text)
+            new_attrs[start:start+len(line_attrs)] = line_attrs
+            new_wrapped[y-drop] = soft
+        return new_chars, new_attrs, new_wrapped, (new_curs[0], new_curs[1] - drop)
+
+    @staticmethod
+    def _copy_cells(chars: array, attrs: array, rows: List[int], size: Tuple[int, int],
+                    new_chars: array, new_attrs: array, new_size: Tuple[int, int], first: int) -> None:
+        """ Copy the cells of a screen into freshly allocated storage of another size, starting from row `first` """
+        old_x, old_y = size
+        new_x, new_y = new_size
+        width: int = min(old_x, new_x)
+        for y in range(min(new_y, old_y-first)):
+            src: int = rows[first+y] * old_x
+            dst: int = y * new_x
+            new_chars[dst:dst+width] = chars[src:src+width]
+            new_attrs[dst:dst+width] = attrs[src:src+width]
 
     def write(self, text: str) -> None:
         """
         Insert text into CharDisplay at cursor position
         """
-        for c in text:
+        cols: int = self.size[0]
+        i: int = 0
+        n: int = len(text)
+        while i < n:
+            if self.curs.x >= cols: # Pending wrap from a previous write
+                self.wrapped[self.rows[self.curs.y]] = True
+                self.curs.x = 0
+                self.newline()
+            # Fill as much of the current row as possible in one slice assignment
+            amnt: int = min(cols - self.curs.x, n - i)
             try:
                 # NOTE: IndexOutOfBounds errors may occur here due to resize lag
-                self.buffer[self.curs.y][self.curs.x].data = c 
+                start: int = self._offset(self.curs.y) + self.curs.x
             except IndexError:
-                self.logs.error(f"Error while writing to CharDisplay, {self.curs} {self.buffer}")
-                self.curs.y = 0
-                self.curs.x = 0
-            self.advance_cursor()
+                self.logs.error(f"Error while writing to CharDisplay, {self.curs} {self.size}")
+                self.curs.set_pos(0, 0)
+                continue
+            self.chars[start:start+amnt] = array('u', text[i:i+amnt])
+            self.attrs[start:start+amnt] = array('H', [self.attr]) * amnt
+            self._damage(self.curs.y, self.curs.x, self.curs.x+amnt)
+            self.curs.x += amnt
+            i += amnt
 
     def newline(self) -> None:
         """
-        Handle insertion of newline ("\n")
+        Handle insertion of newline ("\\n")
         """
-        if self.curs.y == self.size[1]-1:
-            self.buffer.pop(0)
-            self.buffer.append([CharCell() for _ in range(self.size[0])])
-            return
-        self.curs.y += 1
+        if self.curs.y == self.bottom:
+            self.scroll_up()
+        elif self.curs.y < self.size[1]-1:
+            self.curs.y += 1
+
+    def reverse_index(self) -> None:
+        """ Move the cursor up a row, scrolling the region down if already on its top row (`ESC M`) """
+        if self.curs.y == self.top:
+            self.scroll_down()
+        elif self.curs.y > 0:
+            self.curs.y -= 1
+
+    def set_margins(self, top: int, bottom: int) -> None:
+        """ DECSTBM, confine scrolling to rows [top, bottom] and home the cursor """
+        if 0 <= top < bottom < self.size[1]:
+            self.top, self.bottom = top, bottom
+            self.curs.set_pos(0, 0)
+
+    def scroll_up(self, amnt: int = 1) -> None:
+        """ Scroll the scroll region up by `amnt` rows, blanking the rows revealed at its bottom """
+        # Only rows leaving the top of the screen go to history
+        push: bool = self.top == 0 and self.history is not None and not self.alternate
+        self._scroll(self.top, self.bottom, amnt, push)
+
+    def scroll_down(self, amnt: int = 1) -> None:
+        """ Scroll the scroll region down by `amnt` rows, blanking the rows revealed at its top """
+        self._scroll(self.top, self.bottom, -amnt, False)
+
+    def insert_lines(self, amnt: int) -> None:
+        """ IL, insert `amnt` blank rows at the cursor, pushing the rows below down within the scroll region """
+        if self.top <= self.curs.y <= self.bottom:
+            self._scroll(self.curs.y, self.bottom, -amnt, False)
+            self.curs.x = 0
 
-    def advance_cursor(self) -> None:
-        """ Move cursor forward by 1 cell """
-        if self.curs.x >= self.size[0]-1:
+    def delete_lines(self, amnt: int) -> None:
+        """ DL, delete `amnt` rows at the cursor, pulling the rows below up within the scroll region """
+        if self.top <= self.curs.y <= self.bottom:
+            self._scroll(self.curs.y, self.bottom, amnt, False)
             self.curs.x = 0
-            self.newline()
+
+    def _scroll(self, top: int, bottom: int, amnt: int, push: bool) -> None:
+        """
+        Rotate rows [top, bottom] up by `amnt` (down if negative) and blank the rows
+        revealed, pushing the rows scrolled off into history if `push`
+        """
+        height: int = bottom-top+1
+        amnt = max(-height, min(height, amnt))
+        if not amnt:
             return
-        self.curs.x += 1
+        if push:
+            for y in range(top, top+amnt):
+                self.history.push(self.row_text(y), self.row_attrs(y), self.wrapped[self.rows[y]])
+            if self.view_offset: # Keep a scrolled back view anchored on the same lines
+                self.view_offset = min(self.history.view_len(), self.view_offset + amnt)
+        region: List[int] = self.rows[top:bottom+1]
+        self.rows[top:bottom+1] = region[amnt:] + region[:amnt]
+        self._damage_scroll(top, bottom, amnt)
+        revealed: range = range(bottom-amnt+1, bottom+1) if amnt > 0 else range(top, top-amnt)
+        for y in revealed:
+            self._blank(y, 0, self.size[0])
+            self.wrapped[self.rows[y]] = False
+
+    def _blank(self, y: int, start_x: int, end_x: int) -> None:
+        """ Blank cells [start_x, end_x) of on-screen row `y` """
+        if end_x <= start_x:
+            return
+        start: int = self._offset(y)
+        self.chars[start+start_x:start+end_x] = self._blank_chars[:end_x-start_x]
+        self.attrs[start+start_x:start+end_x] = self._blank_attrs[:end_x-start_x]
+        self._damage(y, start_x, end_x)
+
+    def carriage_return(self) -> None:
+        """ Handle return carriage ("\\r") """
+        self.curs.x = 0
+
+    def backspace(self) -> None:
+        """ Handle backspace ("\\b"), which only moves the cursor left """
+        self.curs.x = max(0, min(self.curs.x, self.size[0]-1)-1)
+
+    def tab(self) -> None:
+        """ Handle horizontal tab ("\\t"), moving to the next tab stop of every 8 columns """
+        self.curs.x = min(self.size[0]-1, (self.curs.x//8 + 1) * 8)
 
     def erase_all(self) -> None:
         self.erase((0,0), (self.size[0]-1, self.size[1]-1))
@@ -106,14 +513,46 @@ class CharDisplay:
 
     def erase_inline_from_curs(self) -> None:
         self.erase((self.curs.x, self.curs.y), (self.size[0]-1, self.curs.y))
-    
+
+    def erase_inline_to_curs(self) -> None:
+        self.erase((0, self.curs.y), self.curs.get_pos())
+
+    def erase_line(self) -> None:
+        self.erase((0, self.curs.y), (self.size[0]-1, self.curs.y))
+
     def erase(self, start: Tuple[int, int], end: Tuple[int, int]) -> None:
         """ Erase cells from specified start cell to end cell in a downwards and rightwards fashion """
-        lines = self.buffer[start[1]:end[1]+1]
-        if not len(lines):
-            return
-        lines[0] = lines[0][start[0]:]
-        lines[-1] = lines[-1][:end[0]+1]
-        for line in lines:
-            for cell in line:
-                cell.data = ""
\ No newline at end of file
+        cols: int = self.size[0]
+        for y in range(max(0, start[1]), min(self.size[1], end[1]+1)):
+            start_x: int = start[0] if y == start[1] else 0
+            end_x: int = end[0]+1 if y == end[1] else cols
+            self._blank(y, max(0, start_x), min(cols, end_x))
+            if end_x >= cols: # Nothing is left for the next row to carry on from
+                self.wrapped[self.rows[y]] = False
+
+    def erase_chars(self, amnt: int) -> None:
+        """ Blank `amnt` cells from the cursor onwards without moving the rest of the row """
+        x: int = min(self.curs.x, self.size[0]-1)
+        self._blank(self.curs.y, x, min(self.size[0], x+amnt))
+
+    def insert_chars(self, amnt: int) -> None:
+        """ Insert `amnt` blank cells at the cursor, shifting the rest of the row right """
+        cols: int = self.size[0]
+        x: int = min(self.curs.x, cols-1)
+        amnt = min(amnt, cols-x)
+        start: int = self._offset(self.curs.y)
+        self.chars[start+x+amnt:start+cols] = self.chars[start+x:start+cols-amnt]
+        self.attrs[start+x+amnt:start+cols] = self.attrs[start+x:start+cols-amnt]
+        self._blank(self.curs.y, x, x+amnt)
+        self._damage(self.curs.y, x, cols)
+
+    def delete_chars(self, amnt: int) -> None:
+        """ Delete `amnt` cells at the cursor, shifting the rest of the row left and blank-filling the end """
+        cols: int = self.size[0]
+        x: int = min(self.curs.x, cols-1)
+        amnt = min(amnt, cols-x)
+        start: int = self._offset(self.curs.y)
+        self.chars[start+x:start+cols-amnt] = self.chars[start+x+amnt:start+cols]
+        self.attrs[start+x:start+cols-amnt] = self.attrs[start+x+amnt:start+cols]
+        self._blank(self.curs.y, cols-amnt, cols)
+        self._damage(self.curs.y, x, cols)
@@ -1,6 +1,8 @@
+import os
 import shlex
 import sys
 from typing import Callable, List
+from core.logs import level_names
 
 class DefaultCommandSet:
     """
@@ -44,18 +46,30 @@ class BasicCommandSet(DefaultCommandSet):
             self.hsplit,
             self.vsplit,
             self.help,
-            self.cycle
+            self.cycle,
+            self.fps,
+            self.loglevel,
+            self.scroll,
+            self.search,
+            self.next,
+            self.prev,
+            self.panes,
+            self.pool,
+            self.record,
+            self.replay
         )
             
     def quit(self, args: List[str]) -> None:
         self.root.running = False
 
     def hsplit(self, args: List[str]) -> str:
-        self.root.create_term_right()
+        if self.root.create_term_right() is None:
+            return "Term is too small to split."
         return f"Term split successfully. There are {len(self.root.term_wins)} active sessions."
 
     def vsplit(self, args: List[str]) -> str:
-        self.root.create_term_down()
+        if self.root.create_term_down() is None:
+            return "Term is too small to split."
         return f"Term split successfully. There are {len(self.root.term_wins)} active sessions."
 
     def help(self, args: List[str]) -> str:
@@ -73,4 +87,141 @@ class BasicCommandSet(DefaultCommandSet):
             return f"Successfully cycled to term {cycle_idx}"           
         self.root.cycle_active_term()
         return "Successfully cycled"
-        
\ No newline at end of file
+
+    def fps(self, args: List[str]) -> str:
+        if len(args):
+            max_fps: int
+            try:
+                max_fps = int(args[0])
+            except ValueError:
+                return f"Invalid argument {args[0]} must be integer"
+            if max_fps <= 0:
+                return "Frame rate must be greater than 0"
+            self.root.max_fps = max_fps
+        return f"Frame rate is capped at {self.root.max_fps} fps"
+
+    def panes(self, args: List[str]) -> str:
+        if len(args):
+            if args[0] not in ("threads", "processes"):
+                return f"Invalid argument {args[0]} must be one of: threads, processes"
+            self.root.pane_processes = args[0] == "processes"
+        hosts: str = "worker processes" if self.root.pane_processes else "threads"
+        return f"New panes parse their output in {hosts}"
+
+    def pool(self, args: List[str]) -> str:
+        if len(args):
+            try:
+                size: int = int(args[0])
+            except ValueError:
+                return f"Invalid argument {args[0]} must be integer"
+            if size < 0:
+                return "Pool size must not be negative"
+            self.root.set_shell_pool(size)
+        size = self.root.shell_pool.size if self.root.shell_pool else 0
+        return f"{size} idle shells are kept for new panes" if size else "New panes start their own shell"
+
+    def record(self, args: List[str]) -> str:
+        term = self.root.current_active_term
+        if not len(args):
+            if not term.recorder:
+                return "The active terminal is not being recorded"
+            path: str = term.recorder.path
+            term.stop_recording()
+            return f"Stopped recording to {path}"
+        if not term.recordable:
+            return "Only terminals parsing their output in this process can be recorded, see: \"panes\""
+        if term.recorder:
+            return f"The active terminal is already being recorded to {term.recorder.path}"
+        if len(args) > 1 and args[1] not in ("zlib", "none"):
+            return f"Invalid argument {args[1]} must be one of: zlib, none"
+        try:
+            term.start_recording(os.path.expanduser(args[0]), compress=len(args) < 2 or args[1] == "zlib")
+        except OSError as e:
+            return f"Could not record to {args[0]}: {e.strerror}"
+        return f"Recording the active terminal to {args[0]}"
+
+    def replay(self, args: List[str]) -> str:
+        if not len(args):
+            return "Usage: replay <file> [speed], then replay speed <factor>, replay seek <seconds> or replay pause"
+        term = self.root.current_active_term
+        if args[0] in ("speed", "seek", "pause"):
+            playback = term.term
+            if not hasattr(playback, "seek"):
+                return "The active terminal is not a replay"
+            if args[0] == "pause":
+                playback.toggle_pause()
+                return "Paused" if playback.paused else "Resumed"
+            value: float
+            try:
+                value = float(args[1])
+            except (IndexError, ValueError):
+                return f"replay {args[0]} takes a number"
+            if args[0] == "speed":
+                if value <= 0:
+                    return "Speed must be greater than 0"
+                playback.set_speed(value)
+                return f"Replaying at {value:g}x"
+            playback.seek(value)
+            return f"Seeked to {value:g}s of {term.recording.duration:.1f}s"
+        speed: float = 1.0
+        if len(args) > 1:
+            try:
+                speed = float(args[1])
+            except ValueError:
+                return f"Invalid argument {args[1]} must be a number"
+            if speed <= 0:
+                return "Speed must be greater than 0"
+        try:
+            recording = self.root.open_replay(os.path.expanduser(args[0]), speed)
+        except (OSError, ValueError) as e:
+            return f"Could not replay {args[0]}: {e}"
+        return f"Replaying {recording.duration:.1f}s recorded in a {recording.size[0]}x{recording.size[1]} terminal, space pauses and q closes it"
+
+    def loglevel(self, args: List[str]) -> str:
+        if len(args):
+            if args[0].lower() not in level_names:
+                return f"Invalid argument {args[0]} must be one of: {', '.join(level_names)}"
+            self.root.logs.set_level(level_names[args[0].lower()])
+        current: str = [name for name, level in level_names.items() if level == self.root.logs.level][0]
+        return f"Log level is {current}"
+
+    def scroll(self, args: List[str]) -> str:
+        disp = self.root.current_active_term.char_disp
+        if disp.history is None:
+            return "This terminal keeps no history"
+        if not len(args): # Back to live output
+            self.root.scroll_active_term(-disp.view_offset)
+            return "Scrolled to bottom"
+        lines: int
+        try:
+            lines = int(args[0])
+        except ValueError:
+            return f"Invalid argument {args[0]} must be integer"
+        self.root.scroll_active_term(lines)
+        return f"Scrolled {disp.view_offset} of {disp.history.view_len()} lines back"
+
+    def search(self, args: List[str]) -> str:
+        if not len(args):
+            self.root.start_search(None)
+            return "Search cleared"
+        pattern: str = " ".join(args)
+        self.root.start_search(pattern)
+        search = self.root.current_active_term.search
+        status: str = "done" if search.done else "still searching"
+        return f"{len(search.matches)} matches for \"{pattern}\" so far ({status}), use next/prev to step through them"
+
+    def next(self, args: List[str]) -> str:
+        return self._step_match(1)
+
+    def prev(self, args: List[str]) -> str:
+        return self._step_match(-1)
+
+    def _step_match(self, direction: int) -> str:
+        search = self.root.current_active_term.search
+        if not search:
+            return "Nothing searched for, try: \"search <pattern>\""
+        match = self.root.select_match(direction)
+        if not match:
+            return f"No matches for \"{search.pattern}\""
+        position: int = len(search.matches) - search.index(match) # Counting from the oldest
+        return f"Match {position} of {len(search.matches)}"
@@ -1,63 +1,85 @@
-import re
-from typing import Callable, List
+import inspect
+from typing import Callable, List, Tuple, Union
 
 class EscCodeHandler:
     """
-    ANSI Escape code backend parser and dispatcher
+    ANSI Escape code backend dispatcher. Sequences are tokenized by `VTParser`
+    and handed over here to be dispatched to listeners.
+
+    Every sequence has at most one listener, looked up in a flat table keyed by its
+    code: the final character, preceded by any private marker and intermediates
+    (eg. "H", "?h", " q"). CSI listeners are called with the display and integer
+    params, omitted params being 0, and a param with colon separated sub-parameters
+    (eg. `38:2::255:0:0` in SGR) passed as a tuple of them, to listeners taking any number of params
+    only. Sequences with more params than their listener takes are ignored as malformed.
+    OSC listeners are keyed by the command number and get the rest of the string.
     """
-    esc_regexs = [
-        (re.compile(r'^\x1b\[(\d+)?@'), "@"),
-        (re.compile(r'^\x1b\(B'), "IGNORE"),
-        (re.compile(r'^\x1b\[?([?\d;]*)(\w)'), None)
-    ]
-    
     def __init__(self, logs, display) -> None:
         self.logs = logs
         self.display = display
-        self.subscriber_map: dict[str, Callable[str]] = {}
+        self.csi_table: dict[str, Tuple[Callable, Union[int, None]]] = {} # code -> listener, params it takes (None: any)
+        self.esc_table: dict[str, Callable] = {}
+        self.osc_table: dict[int, Callable] = {}
 
-    def on(self, code_char: str, func: Callable[[str], None]) -> None:
-        """ Attach listeners according to type of escape code """
-        if code_char not in self.subscriber_map:
-            self.subscriber_map[code_char] = [func]
-            return
-        self.subscriber_map[code_char].append(func)
-
-    def dispatch(self, code_char: str, args: List[str]) -> None:
-        """ Send escape code information to respective listeners """
-        if code_char in self.subscriber_map:
-            for f in self.subscriber_map[code_char]:
-                f(self.display, *args)
-        
-    def handle_head(self, text: str) -> str:
-        """
-        Chop escape code off the start of string, if present
-        """
-        args, char = self._parse(text)
-        if char == "IGNORE": # Remove esc code from text and carry on
-            return text[len(args):]
-        if not args and not char: # No escape code found
-            return None
-            
-        # Extract multiple args
-        arglist = [args]
-        if ";" in args:
-            arglist = args.split(";")
-        arglist = [arg  if arg else "0" for arg in arglist] # Fill empty args as "0" to be passed as param to listeners
-        self.logs.info(f"Escape Code: {char} - Args: {arglist}")
-        self.dispatch(char, arglist)
-        return text[2+len(args)+1:] # \x1b[ = length 2, code_char = length 1
-
-    def _parse(self, text: str):
+    def on(self, code: str, func: Callable) -> None:
+        """ Set the listener of a CSI sequence, eg. "H" or "?h" """
+        params = list(inspect.signature(func).parameters.values())[1:] # After the display
+        if any(param.kind == param.VAR_POSITIONAL for param in params):
+            self.csi_table[code] = (func, None)
+        else:
+            self.csi_table[code] = (func, len(params))
+
+    def on_esc(self, code: str, func: Callable) -> None:
+        """ Set the listener of a plain escape sequence, eg. "7" or "(B" """
+        self.esc_table[code] = func
+
+    def on_osc(self, command: int, func: Callable) -> None:
+        """ Set the listener of an OSC command, eg. 2 to set the window title """
+        self.osc_table[command] = func
+
+    def handle_csi(self, params: str, intermediates: str, final: str) -> None:
         """
-        Identify escape codes and extract their args
+        Handle a complete CSI sequence (ESC [ <params> <intermediates> <final>).
+        Sequences with a private marker, eg. `ESC [ ? 25 h`, are dispatched
+        with the marker prepended to their code, ie. "?h".
         """
-        for pattern, char in self.esc_regexs:   
-            matches = pattern.match(text)
-            if matches:
-                if char == "IGNORE": # Ignore this escape code and carry on
-                    return matches.group(0), char
-                elif char: # Return hardcoded character for pattern
-                    return matches.group(1), char
-                return matches.groups() # Character and args already captured in pattern
-        return None, None # No escape code found
\ No newline at end of file
+        code: str = intermediates + final if intermediates else final
+        if params and params[0] in "<=>?":
+            code = params[0] + code
+            params = params[1:]
+        listener = self.csi_table.get(code)
+        if listener is None:
+            self.logs.debug("Unhandled Escape Code: %s - Args: %s", code, params)
+            return
+        func, max_params = listener
+        try:
+            if ":" in params:
+                if max_params is not None:
+                    raise ValueError("sub-parameters")
+                args: list = [tuple(int(sub) if sub else 0 for sub in arg.split(":")) if ":" in arg else int(arg) if arg else 0
+                              for arg in params.split(";")]
+            else:
+                args: List[int] = [int(arg) if arg else 0 for arg in params.split(";")] if params else []
+            if max_params is not None and len(args) > max_params:
+                raise ValueError(f"more than {max_params} params")
+        except ValueError as e: # Malformed
+            self.logs.debug("Bad Escape Code: %s - Args: %s (%s)", code, params, e)
+            return
+        func(self.display, *args)
+
+    def handle_esc(self, intermediates: str, final: str) -> None:
+        """ Handle a plain escape sequence, eg. charset designations such as `ESC ( B` """
+        func = self.esc_table.get(intermediates + final)
+        if func is None:
+            self.logs.debug("Unhandled Escape Sequence: %s%s", intermediates, final)
+            return
+        func(self.display)
+
+    def handle_osc(self, data: str) -> None:
+        """ Handle an operating system command string, eg. setting the window title """
+        command, _, arg = data.partition(";")
+        func = self.osc_table.get(int(command)) if command.isdecimal() else None
+        if func is None:
+            self.logs.debug("Unhandled OSC: %s", data)
+            return
+        func(self.display, arg)
@@ -0,0 +1,120 @@
+import os
+import signal
+import selectors
+from collections import deque
+from typing import Callable
+
+class EventLoop:
+    """
+    Reactor over `selectors.DefaultSelector` (epoll on Linux). Blocks until a
+    registered fd is readable (or writable, for writers) and dispatches to its callback, so nothing runs
+    while every shell is idle. Signals are delivered through a self-pipe, letting
+    handlers run from the loop instead of interrupting whatever was executing.
+    Other threads hand work over to the loop the same way, through `call_soon_threadsafe`.
+    """
+    def __init__(self, logs) -> None:
+        self.logs = logs
+        self.selector = selectors.DefaultSelector()
+        self.signal_map: dict[int, list[Callable[[], None]]] = {}
+        # Self-pipe which the interpreter writes signal numbers into upon receiving a signal
+        self._signal_r, self._signal_w = os.pipe()
+        os.set_blocking(self._signal_r, False)
+        os.set_blocking(self._signal_w, False)
+        signal.set_wakeup_fd(self._signal_w, warn_on_full_buffer=False)
+        self.add_reader(self._signal_r, self._on_signal_pipe)
+        # Self-pipe which other threads write into after queueing a call in `calls`
+        self.calls: deque = deque() # Appended to by other threads, popped here: deque appends and pops are atomic
+        self._wakeup_r, self._wakeup_w = os.pipe()
+        os.set_blocking(self._wakeup_r, False)
+        os.set_blocking(self._wakeup_w, False)
+        self.add_reader(self._wakeup_r, self._on_wakeup_pipe)
+
+    def add_reader(self, fd, callback: Callable[[int], None]) -> None:
+        """ Call `callback` with the fd whenever it becomes readable """
+        self._watch(fd, selectors.EVENT_READ, callback)
+
+    def remove_reader(self, fd) -> None:
+        """ Stop watching fd, harmless if it was never registered """
+        self._watch(fd, selectors.EVENT_READ, None)
+
+    def add_writer(self, fd, callback: Callable[[int], None]) -> None:
+        """ Call `callback` with the fd whenever it becomes writable, until `remove_writer` """
+        self._watch(fd, selectors.EVENT_WRITE, callback)
+
+    def remove_writer(self, fd) -> None:
+        self._watch(fd, selectors.EVENT_WRITE, None)
+
+    def _watch(self, fd, event: int, callback: Callable[[int], None]) -> None:
+        """ Set (or clear if None) the callback of `event` on fd, keeping its other callback """
+        try:
+            key = self.selector.get_key(fd)
+        except (KeyError, ValueError):
+            key = None
+        # Registered data is {event: callback} for the events watched
+        callbacks: dict = dict(key.data) if key else {}
+        if callback:
+            callbacks[event] = callback
+        else:
+            callbacks.pop(event, None)
+        events: int = 0
+        for watched in callbacks:
+            events |= watched
+        if key and events:
+            self.selector.modify(fd, events, callbacks)
+        elif key:
+            self.selector.unregister(fd)
+        elif events:
+            self.selector.register(fd, events, callbacks)
+
+    def on_signal(self, signum: int, func: Callable[[], None]) -> None:
+        """ Attach listeners to a signal, which will be run from within the event loop """
+        if signum not in self.signal_map:
+            self.signal_map[signum] = [func]
+            # Python-level handler is only needed so the interpreter writes to the wakeup fd
+            signal.signal(signum, lambda *_: None)
+            return
+        self.signal_map[signum].append(func)
+
+    def _on_signal_pipe(self, fd: int) -> None:
+        """ Drain the self-pipe and dispatch every signal received since last time """
+        try:
+            received: bytes = os.read(fd, 512)
+        except BlockingIOError:
+            return
+        for signum in set(received):
+            for func in self.signal_map.get(signum, []):
+                func()
+
+    def call_soon_threadsafe(self, func: Callable[[], None]) -> None:
+        """ Have `func` run from within the event loop, may be called from any thread """
+        self.calls.append(func)
+        try:
+            os.write(self._wakeup_w, b"\0")
+        except BlockingIOError:
+            pass # Pipe is full, the loop is bound to wake up anyway
+
+    def _on_wakeup_pipe(self, fd: int) -> None:
+        """ Drain the self-pipe and run every call queued since last time """
+        try:
+            os.read(fd, 512)
+        except BlockingIOError:
+            pass
+        while self.calls:
+            self.calls.popleft()()
+
+    def run_once(self, timeout: float = None) -> None:
+        """ Wait up to `timeout` seconds (forever if None) for readable fds and dispatch them """
+        for key, events in self.selector.select(timeout):
+            for event in (selectors.EVENT_READ, selectors.EVENT_WRITE):
+                # An earlier callback in this batch may have unregistered the fd, or stopped watching the event
+                current = self.selector.get_map().get(key.fd)
+                if events & event and current and event in current.data:
+                    current.data[event](key.fd)
+
+    def close(self) -> None:
+        signal.set_wakeup_fd(-1)
+        self.selector.close()
+        os.close(self._signal_r)
+        os.close(self._signal_w)
+        os.close(self._wakeup_r)
+        os.close(self._wakeup_w)
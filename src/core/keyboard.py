@@ -1,21 +1,29 @@
 import sys
 import os
-import select
 import termios
 import tty
-from typing import Union, Callable
+from typing import List, Union, Callable
 
 class KeyboardHandler:
     """
-    Main Keyboard dispatcher - grabs keystrokes and distributes them to attached listeners
+    Main Keyboard dispatcher - grabs keystrokes and distributes them to attached listeners.
+    Bracketed paste is turned on in the terminal we run in, so pasted text arrives between
+    `paste_start` and `paste_end`, and is handed whole to the paste listeners rather than as keys
     """
+    paste_start: bytes = b"\x1b[200~"
+    paste_end: bytes = b"\x1b[201~"
+    paste_read: int = 64*1024 # Bytes read at a time while a paste is coming in
+
     def __init__(self, win) -> None:
         self.win = win
         self.keymap = {}
+        self.paste_listeners: List[Callable[[bytes], None]] = []
+        self.pasted: Union[bytearray, None] = None # Text of a paste under way, until its end arrives
         # Make stdin of main thread non-blocking 
         self.stdinfd = sys.stdin.fileno()
         self.old_stdin_attrs = termios.tcgetattr(self.stdinfd)
         tty.setraw(self.stdinfd)
+        os.write(sys.stdout.fileno(), b"\x1b[?2004h")
         
     def on(self, key_list: Union[str, bytes], func: Callable[[bytes], None]) -> None:
         """
@@ -31,18 +39,44 @@ class KeyboardHandler:
             else:
                 self.keymap[key].append(func)
 
+    def on_paste(self, func: Callable[[bytes], None]) -> None:
+        """ Attach listeners to pastes, which are called with the whole text pasted """
+        self.paste_listeners.append(func)
+
     def getch(self):
         """
         Hacky-way to Grab keystrokes from main thread stdin.
         Builtin curses getch() method returns keys unreliabily,
-        so this is our workaround. Only works because we made
-        stdin non-blocking in __init__().
-        """
-        i, _, _ = select.select([sys.stdin],[],[], 0) # Select syscall to check if theres data available in stdin
-        if i == [sys.stdin]:
-            # Data present, read and dispatch
-            key = os.read(self.stdinfd, 1024)
-            self.dispatch(key)
+        so this is our workaround. Only called by the event loop
+        once stdin is readable, so the read never blocks.
+        """
+        key = os.read(self.stdinfd, 1024 if self.pasted is None else self.paste_read)
+        if key:
+            self.feed(key)
+
+    def feed(self, data: bytes) -> None:
+        """
+        Dispatch keys read, or collect them into `pasted` while a paste is under way. A paste's
+        start is only recognised at the start of a read, as terminals write it out in one go
+        """
+        if self.pasted is None:
+            if not data.startswith(self.paste_start):
+                self.dispatch(data)
+                return
+            self.pasted = bytearray()
+            data = data[len(self.paste_start):]
+        # The end may have been split across reads
+        search_from: int = max(0, len(self.pasted) - len(self.paste_end) + 1)
+        self.pasted += data
+        end: int = self.pasted.find(self.paste_end, search_from)
+        if end == -1:
+            return
+        pasted, rest = bytes(self.pasted[:end]), bytes(self.pasted[end+len(self.paste_end):])
+        self.pasted = None
+        for callback in self.paste_listeners:
+            callback(pasted)
+        if rest:
+            self.feed(rest)
 
     def dispatch(self, key):
         """
@@ -55,4 +89,8 @@ class KeyboardHandler:
             hashed_key = key.decode("utf-8")
         if hashed_key in self.keymap:
             for callback in self.keymap[hashed_key]:
-                callback(key)
\ No newline at end of file
+                callback(key)
+
+    def close(self) -> None:
+        """ Turn bracketed paste back off in the terminal we run in """
+        os.write(sys.stdout.fileno(), b"\x1b[?2004l")
@@ -1,33 +1,135 @@
 from datetime import datetime
+from collections import deque
+import os
 import sys
+import threading
+from typing import Union
+
+# Log levels, higher is more severe
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+level_names = {"debug": DEBUG, "info": INFO, "warning": WARNING, "error": ERROR}
 
 class Logger:
     """
     Basic log implementation.
     Logs are required as UI utilizes the terminal screen, so any errors or debug information must be programatically stored.
+
+    Messages below `level` are dropped before any formatting happens, so hot paths should
+    pass format args (`logs.debug("Chunk: %r", chunk)`) instead of pre-formatted strings.
+    Everything else is queued in memory and written out by a background thread once
+    `flush_size` messages are waiting or `flush_interval` seconds have passed.
+    The log file is rotated into `<filepath>.1`, `<filepath>.2`... once it exceeds `max_bytes`.
     """
-    def __init__(self, filepath):
+    def __init__(self, filepath, level: int = INFO, flush_size: int = 256, flush_interval: float = 0.5,
+                 max_bytes: int = 8*1024*1024, backups: int = 2):
         self.filepath = filepath
+        self.level: int = level
+        self.flush_size: int = flush_size
+        self.flush_interval: float = flush_interval
+        self.max_bytes: int = max_bytes
+        self.backups: int = backups
+        self.queue: deque = deque() # Messages waiting for the writer thread
+        self.size: int = 0 # Bytes written to the current log file
+        # Messages which could not be written and why, only reported on closing as the UI owns the terminal until then
+        self.lost: int = 0
+        self.write_error: Union[OSError, None] = None
+        self._wakeup = threading.Event()
+        self._closed: bool = False
 
         # Empty our log file
         with open(self.filepath, 'w') as f:
             pass
+        self._writer = threading.Thread(target=self._write_loop, name="log-writer", daemon=True)
+        self._writer.start()
+
+    def set_level(self, level: int) -> None:
+        self.level = level
+
+    def is_enabled(self, level: int) -> bool:
+        """ Whether messages of `level` would be logged, for callers with expensive messages """
+        return level >= self.level
 
     def log(self, msg):
         """ Append a message to logs """
-        with open(self.filepath, 'a') as f:
-            f.write(msg)
+        self.queue.append(msg)
+        if len(self.queue) >= self.flush_size:
+            self._wakeup.set()
 
-    def info(self, msg):
+    def _log_at(self, level: int, name: str, msg, args) -> None:
+        if level < self.level:
+            return
+        if args:
+            msg = msg % args
+        self.log(f'[{name}]: {datetime.now()} - {msg}\n')
+
+    def debug(self, msg, *args):
+        """ Log a verbose message, only wanted when debugging """
+        self._log_at(DEBUG, "DEBUG", msg, args)
+
+    def info(self, msg, *args):
         """ Log a debug/info-related message """
-        self.log(f'[INFO]: {datetime.now()} - {msg}\n')
+        self._log_at(INFO, "INFO", msg, args)
 
-    def warning(self, msg):
+    def warning(self, msg, *args):
         """ Log a warning message """
-        self.log(f'[WARNING]: {datetime.now()} - {msg}\n')
+        self._log_at(WARNING, "WARNING", msg, args)
 
     def error(self, msg, exception=None):
         """ Log an error message """
+        if ERROR < self.level:
+            return
         self.log(f'[ERROR]: {datetime.now()} - {msg}\n')
         # Show the exact exception raised if needed
-        self.log(f'Error is as follows: {exception}\n')
\ No newline at end of file
+        self.log(f'Error is as follows: {exception}\n')
+
+    def _write_loop(self) -> None:
+        """ Background writer, flushes the queue whenever it is big enough or old enough """
+        while not self._closed:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def flush(self) -> None:
+        """ Write all queued messages to the log file """
+        if not self.queue:
+            return
+        msgs: list[str] = []
+        try:
+            while True:
+                msgs.append(self.queue.popleft())
+        except IndexError:
+            pass
+        data: str = "".join(msgs)
+        try:
+            with open(self.filepath, 'a') as f:
+                f.write(data)
+        except OSError as e:
+            self.lost += len(msgs)
+            self.write_error = e
+            return
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            self._rotate()
+
+    def _rotate(self) -> None:
+        """ Shift `<filepath>.N` backups up by one and start a fresh log file """
+        for i in range(self.backups-1, 0, -1):
+            if os.path.exists(f"{self.filepath}.{i}"):
+                os.replace(f"{self.filepath}.{i}", f"{self.filepath}.{i+1}")
+        if self.backups:
+            os.replace(self.filepath, f"{self.filepath}.1")
+        with open(self.filepath, 'w') as f:
+            pass
+        self.size = 0
+
+    def close(self) -> None:
+        """ Stop the background writer and write out anything still queued, reporting messages lost """
+        self._closed = True
+        self._wakeup.set()
+        self._writer.join()
+        self.flush()
+        if self.lost:
+            print(f"{self.lost} log messages could not be written to {self.filepath}: {self.write_error}", file=sys.stderr)
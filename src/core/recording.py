@@ -0,0 +1,209 @@
+"""
+Recordings of a terminal's raw pty output, for replaying sessions later (see `ui.replay_window`).
+
+A recording is an append-only file: a header, then records of
+    <kind: 1 byte> <seconds since the recording started: f64> <payload length: u32> <payload>
+with the payload zlib compressed if the header says so. Kinds are:
+    OUTPUT    a batch of chunks of output, each <seconds: f64> <length: u32> <bytes>,
+              the record's time being that of the last chunk
+    KEYFRAME  the terminal's state at that point: `marshal`led (`CharDisplay.snapshot()`,
+              DEC private modes set, title), with styles packed by `core.style.pack_style`
+    RESIZE    <cols: u16> <lines: u16>
+A keyframe is written when recording starts and then every `Recorder.keyframe_interval`
+seconds of output, so a replay can seek anywhere by restoring the keyframe before the
+target and only parsing what was output since. A recording cut short (eg. by a crash)
+is still readable up to its last whole record.
+"""
+import time
+import zlib
+import bisect
+import struct
+import marshal
+import threading
+import traceback
+from collections import deque
+from typing import Iterator, List, Tuple
+from core.style import StyleTable
+
+OUTPUT = b"O"
+KEYFRAME = b"K"
+RESIZE = b"R"
+
+file_header = struct.Struct("<6sBBdHH") # magic, version, compressed, wall clock time started, cols, lines
+record_header = struct.Struct("<cdI")
+chunk_header = struct.Struct("<dI")
+resize_payload = struct.Struct("<HH")
+magic: bytes = b"WA3REC"
+version: int = 1
+
+Record = Tuple[bytes, float, object]
+
+class Recorder:
+    """
+    Writes a terminal's output into a new recording at `path`. `output()` and `keyframe()` are
+    called by the terminal as it parses, they only queue what they are given: a thread of our
+    own batches, compresses and writes it out every `flush_interval` seconds.
+    """
+    keyframe_interval: float = 5.0
+    flush_interval: float = 0.5
+
+    def __init__(self, logs, path: str, size: Tuple[int, int], styles: StyleTable, compress: bool = True) -> None:
+        self.logs = logs
+        self.path: str = path
+        self.styles: StyleTable = styles
+        self.compress: bool = compress
+        self.file = open(path, "xb") # Never clobber an earlier recording
+        self.file.write(file_header.pack(magic, version, int(compress), time.time(), *size))
+        self.start: float = time.monotonic()
+        self.last_keyframe: float = float("-inf")
+        self.queue: deque = deque() # Records waiting for the writer thread
+        self.closed: bool = False
+        self.wake: threading.Event = threading.Event()
+        self.writer: threading.Thread = threading.Thread(target=self._write_loop, name=f"recorder-{path}", daemon=True)
+        self.writer.start()
+
+    def now(self) -> float:
+        return time.monotonic() - self.start
+
+    def output(self, chunk) -> None:
+        """ Queue a chunk of output, copied as pty reads reuse their buffer """
+        if not self.closed: # Writing may have failed
+            self.queue.append((OUTPUT, self.now(), bytes(chunk)))
+
+    def keyframe_due(self) -> bool:
+        return self.now() - self.last_keyframe >= self.keyframe_interval
+
+    def keyframe(self, disp, modes: set, title: str) -> None:
+        """ Queue the state of `disp`, which must have parsed all output queued so far and nothing more """
+        self.last_keyframe = self.now()
+        self.queue.append((KEYFRAME, self.last_keyframe, (disp.snapshot(self.styles.pack), sorted(modes), title)))
+
+    def resize(self, cols: int, lines: int) -> None:
+        self.queue.append((RESIZE, self.now(), (cols, lines)))
+
+    def _encode(self, kind: bytes, t: float, payload: bytes) -> bytes:
+        if self.compress:
+            payload = zlib.compress(payload)
+        return record_header.pack(kind, t, len(payload)) + payload
+
+    def flush(self) -> None:
+        """ Write out everything queued, consecutive chunks of output as one record """
+        out: List[bytes] = []
+        chunks: List[bytes] = []
+        last: float = 0.0
+        while self.queue:
+            kind, t, value = self.queue.popleft()
+            if kind == OUTPUT:
+                chunks.append(chunk_header.pack(t, len(value)))
+                chunks.append(value)
+                last = t
+                continue
+            if chunks:
+                out.append(self._encode(OUTPUT, last, b"".join(chunks)))
+                chunks = []
+            if kind == KEYFRAME:
+                out.append(self._encode(KEYFRAME, t, marshal.dumps(value)))
+            elif kind == RESIZE:
+                out.append(self._encode(RESIZE, t, resize_payload.pack(*value)))
+        if chunks:
+            out.append(self._encode(OUTPUT, last, b"".join(chunks)))
+        if out:
+            self.file.write(b"".join(out))
+            self.file.flush()
+
+    def _write_loop(self) -> None:
+        """ Body of the writer thread """
+        try:
+            while not self.closed:
+                self.wake.wait(self.flush_interval)
+                self.flush()
+            self.flush() # Whatever was queued while we were being closed
+        except OSError as e:
+            self.logs.error(f"Recording to {self.path} failed\n{traceback.format_exc()}", e)
+            self.closed = True
+            self.queue.clear()
+        finally:
+            self.file.close()
+
+    def close(self) -> None:
+        """ Stop recording, once what was queued has been written """
+        self.closed = True
+        self.wake.set()
+        self.writer.join()
+
+class Recording:
+    """
+    A recording opened for replay. Record headers are scanned on opening, so the keyframes
+    and duration are known without reading any output. Raises ValueError if `path` is not a recording.
+    """
+    def __init__(self, path: str) -> None:
+        self.path: str = path
+        self.file = open(path, "rb")
+        header: bytes = self.file.read(file_header.size)
+        if len(header) < file_header.size or header[:len(magic)] != magic:
+            self.file.close()
+            raise ValueError(f"{path} is not a recording")
+        _, file_version, compressed, self.started, cols, lines = file_header.unpack(header)
+        if file_version != version:
+            self.file.close()
+            raise ValueError(f"{path} is a recording of unsupported version {file_version}")
+        self.compressed: bool = bool(compressed)
+        self.size: Tuple[int, int] = (cols, lines)
+        self.keyframes: List[Tuple[float, int]] = [] # (seconds, offset of the record)
+        self.duration: float = 0.0
+        self.end: int = file_header.size # Offset past the last whole record
+        self._scan()
+
+    def _scan(self) -> None:
+        self.file.seek(0, 2)
+        size: int = self.file.tell()
+        offset: int = file_header.size
+        while offset + record_header.size <= size:
+            self.file.seek(offset)
+            kind, t, length = record_header.unpack(self.file.read(record_header.size))
+            if offset + record_header.size + length > size:
+                break # Cut short while being written
+            if kind == KEYFRAME:
+                self.keyframes.append((t, offset))
+            self.duration = max(self.duration, t)
+            offset += record_header.size + length
+        self.end = offset
+        if not self.keyframes:
+            self.file.close()
+            raise ValueError(f"{self.path} has no keyframes to start replaying from")
+
+    def records(self, offset: int = file_header.size) -> Iterator[Record]:
+        """ Records from the one at `offset` on, with output split back into its chunks """
+        while offset < self.end:
+            self.file.seek(offset)
+            kind, t, length = record_header.unpack(self.file.read(record_header.size))
+            payload: bytes = self.file.read(length)
+            offset += record_header.size + length
+            if self.compressed:
+                payload = zlib.decompress(payload)
+            if kind == OUTPUT:
+                at: int = 0
+                while at < len(payload):
+                    chunk_t, chunk_length = chunk_header.unpack_from(payload, at)
+                    at += chunk_header.size
+                    yield (OUTPUT, chunk_t, payload[at:at+chunk_length])
+                    at += chunk_length
+            elif kind == KEYFRAME:
+                yield (KEYFRAME, t, marshal.loads(payload))
+            elif kind == RESIZE:
+                yield (RESIZE, t, resize_payload.unpack(payload))
+
+    def keyframe_before(self, t: float) -> Tuple[int, tuple]:
+        """ Offset and contents of the last keyframe at or before `t` seconds (the first one if none) """
+        idx: int = max(0, bisect.bisect_right(self.keyframes, (t, float("inf"))) - 1)
+        offset: int = self.keyframes[idx][1]
+        return offset, next(self.records(offset))[2]
+
+    def output(self) -> Iterator[bytes]:
+        """ Every chunk of output from the start, eg. as a corpus to benchmark parsing with """
+        for kind, _, value in self.records():
+            if kind == OUTPUT:
+                yield value
+
+    def close(self) -> None:
+        self.file.close()
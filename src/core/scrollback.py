@@ -0,0 +1,506 @@
+import os
+import sys
+import itertools
+import mmap
+import shutil
+import struct
+import threading
+from array import array
+from collections import OrderedDict
+from typing import List, Tuple, Union
+from core.search import SearchIndex, chunk_lines, bloom_bits
+
+# A stored line: text with trailing blanks trimmed, and its attributes (None when all default)
+Line = Tuple[str, Union[array, None]]
+
+default_spill_dir: str = os.path.join(os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "wa3", "scrollback")
+
+wrap_bit: int = 1 << 31 # Set in a record's length when the line is soft-wrapped onto the next
+
+def encode_line(line: Line, wrapped: bool = False) -> bytes:
+    """ <utf8 length: u32, top bit set if soft-wrapped> <utf8 text> <attributes as u16 each> """
+    text: bytes = line[0].encode("utf8")
+    attrs: bytes = line[1].tobytes() if line[1] is not None else b""
+    return struct.pack("<I", len(text) | (wrap_bit if wrapped else 0)) + text + attrs
+
+def decode_wrapped(record) -> bool:
+    return bool(struct.unpack_from("<I", record)[0] & wrap_bit)
+
+def decode_line(record) -> Line:
+    length: int = struct.unpack_from("<I", record)[0] & ~wrap_bit
+    text: str = record[4:4+length].decode("utf8")
+    if len(record) == 4+length:
+        return (text, None)
+    attrs: array = array("H")
+    attrs.frombytes(record[4+length:])
+    return (text, attrs)
+
+class Segment:
+    """
+    One append-only segment file of spilled lines (`.dat`), along with an index
+    file (`.idx`) holding the u32 offset of every line, and the search filters of its
+    chunks of lines (`.blm`, see `SearchIndex`), all read back through `mmap`.
+    """
+    bloom_size: int = bloom_bits // 8
+
+    def __init__(self, path: str) -> None:
+        self.path: str = path
+        self.data = open(path + ".dat", "w+b")
+        self.index = open(path + ".idx", "w+b")
+        self.blooms = open(path + ".blm", "w+b")
+        self.size: int = 0
+        self.count: int = 0
+        self._data_map: mmap.mmap = None
+        self._index_map: mmap.mmap = None
+        self._bloom_map: Union[mmap.mmap, None] = None # None while there are no filters
+        self._mapped_count: int = 0
+        self._mapped_blooms: int = 0
+
+    def append(self, record: bytes) -> None:
+        self.index.write(struct.pack("<I", self.size))
+        self.data.write(record)
+        self.size += len(record)
+        self.count += 1
+
+    def append_bloom(self, bloom: bytes) -> None:
+        self.blooms.write(bloom)
+
+    def seal(self) -> None:
+        """ Called once the segment is full, it is only ever read from afterwards """
+        self.data.close()
+        self.index.close()
+        self.blooms.close()
+
+    def read(self, idx: int) -> bytes:
+        if idx >= self._mapped_count:
+            self._map()
+        start: int = struct.unpack_from("<I", self._index_map, idx*4)[0]
+        end: int = struct.unpack_from("<I", self._index_map, idx*4+4)[0] if idx+1 < self._mapped_count else len(self._data_map)
+        return self._data_map[start:end]
+
+    def bloom(self, idx: int) -> bytes:
+        """ Filter of the segment's chunk `idx` """
+        if idx >= self._mapped_blooms:
+            self._map()
+        return self._bloom_map[idx*self.bloom_size:(idx+1)*self.bloom_size]
+
+    def _map(self) -> None:
+        """ (Re)map the segment, picking up any lines and filters appended since it was last mapped """
+        self.unmap()
+        if not self.data.closed:
+            self.data.flush()
+            self.index.flush()
+            self.blooms.flush()
+        with open(self.path + ".dat", "rb") as data, open(self.path + ".idx", "rb") as index, \
+             open(self.path + ".blm", "rb") as blooms:
+            self._data_map = mmap.mmap(data.fileno(), 0, access=mmap.ACCESS_READ)
+            self._index_map = mmap.mmap(index.fileno(), 0, access=mmap.ACCESS_READ)
+            if os.fstat(blooms.fileno()).st_size: # Empty files cannot be mapped
+                self._bloom_map = mmap.mmap(blooms.fileno(), 0, access=mmap.ACCESS_READ)
+        self._mapped_count = len(self._index_map) // 4
+        self._mapped_blooms = len(self._bloom_map) // self.bloom_size if self._bloom_map is not None else 0
+
+    def unmap(self) -> None:
+        if self._data_map is not None:
+            self._data_map.close()
+            self._index_map.close()
+        if self._bloom_map is not None:
+            self._bloom_map.close()
+        self._data_map = self._index_map = self._bloom_map = None
+        self._mapped_count = self._mapped_blooms = 0
+
+    def close(self) -> None:
+        self.unmap()
+        if not self.data.closed:
+            self.seal()
+
+class SegmentStore:
+    """
+    Unbounded on-disk scrollback for lines evicted from memory, split into segments
+    of `segment_lines` lines so finding line N is O(1): segment N // segment_lines,
+    then a single lookup in that segment's index. Only the most recently read
+    segments stay mapped, so resident memory stays flat as history grows.
+    """
+    segment_lines: int = 65536 # A multiple of `search.chunk_lines`, so that segments hold whole chunks
+    max_mapped: int = 4
+
+    def __init__(self, directory: str) -> None:
+        self.directory: str = directory
+        os.makedirs(directory, exist_ok=True)
+        self.segments: list[Segment] = []
+        self.count: int = 0
+        self._mapped: OrderedDict = OrderedDict() # Segments with live maps, least recently read first
+
+    def __len__(self) -> int:
+        return self.count
+
+    def append(self, line: Line, wrapped: bool = False) -> None:
+        if self.count % self.segment_lines == 0:
+            if self.segments:
+                self.segments[-1].seal()
+            self.segments.append(Segment(os.path.join(self.directory, f"{len(self.segments):06d}")))
+        self.segments[-1].append(encode_line(line, wrapped))
+        self.count += 1
+
+    def _use(self, segment: Segment) -> Segment:
+        """ Note `segment` as the most recently read, unmapping the least recently read beyond `max_mapped` """
+        self._mapped[segment] = None
+        self._mapped.move_to_end(segment)
+        if len(self._mapped) > self.max_mapped:
+            self._mapped.popitem(last=False)[0].unmap()
+        return segment
+
+    def _record(self, idx: int) -> bytes:
+        if not 0 <= idx < self.count:
+            raise IndexError(f"Spilled line {idx} out of range")
+        return self._use(self.segments[idx // self.segment_lines]).read(idx % self.segment_lines)
+
+    def append_bloom(self, chunk: int, bloom: bytes) -> None:
+        """ Store the search filter of chunk `chunk` (see `SearchIndex`), once all its lines have been spilled """
+        self.segments[chunk*chunk_lines // self.segment_lines].append_bloom(bloom)
+
+    def bloom(self, chunk: int) -> bytes:
+        per_segment: int = self.segment_lines // chunk_lines
+        return self._use(self.segments[chunk // per_segment]).bloom(chunk % per_segment)
+
+    def line(self, idx: int) -> Line:
+        return decode_line(self._record(idx))
+
+    def wrapped(self, idx: int) -> bool:
+        return decode_wrapped(self._record(idx))
+
+    def close(self) -> None:
+        """ Delete the store, called when its pane is destroyed """
+        for segment in self.segments:
+            segment.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    @staticmethod
+    def cleanup_stale(base_dir: str) -> None:
+        """ Remove stores left behind by multiplexer processes which are no longer running """
+        if not os.path.isdir(base_dir):
+            return
+        for name in os.listdir(base_dir):
+            pid: str = name.split("-")[0]
+            if not pid.isdigit() or int(pid) == os.getpid():
+                continue
+            try:
+                os.kill(int(pid), 0)
+            except ProcessLookupError:
+                shutil.rmtree(os.path.join(base_dir, name), ignore_errors=True)
+            except PermissionError:
+                pass # Alive, but owned by someone else
+
+class ScrollbackBudget:
+    """
+    Memory budget shared by the scrollback of every pane. Once exceeded,
+    the oldest lines of whichever pane holds the most history are evicted.
+    Panes are fed from their own threads and may evict from each other, so
+    every history under the budget is guarded by the budget's `lock`.
+    """
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes: int = max_bytes
+        self.used: int = 0
+        self.histories: list["Scrollback"] = []
+        self.lock = threading.RLock()
+
+    def register(self, history: "Scrollback") -> None:
+        self.histories.append(history)
+
+    def unregister(self, history: "Scrollback") -> None:
+        """ Release everything held by `history`, usually when its pane is destroyed """
+        with self.lock:
+            if history in self.histories:
+                self.histories.remove(history)
+                self.used -= history.used
+                history.used = 0
+
+    def charge(self, nbytes: int) -> None:
+        """ Account for `nbytes` newly stored, evicting old lines if over budget """
+        with self.lock:
+            self.used += nbytes
+            while self.used > self.max_bytes:
+                largest: Scrollback = max(self.histories, key=lambda history: history.used)
+                if not largest.count:
+                    break
+                largest.pop_oldest()
+
+class Scrollback:
+    """
+    Per-pane history of lines scrolled off the top of a `CharDisplay`, kept in a
+    preallocated ring so pushing a line is O(1) no matter how much history there is.
+    With a `spill` store, lines evicted from the ring are moved to disk rather than lost,
+    and line indexes cover both: the spilled lines are the oldest.
+
+    Lines are stored as they were pushed, along with whether they were soft-wrapped onto
+    the next. Once the display is resized (see `reflow()`), lines pushed before are shown
+    rewrapped to the new width: the view of them is built lazily, newest first, as far
+    back as has been scrolled into view, so resizing costs the same however much history
+    there is. The view is addressed by `view_line()`, counting back from the newest line.
+    """
+    def __init__(self, max_lines: int, budget: ScrollbackBudget = None, spill: SegmentStore = None) -> None:
+        self.max_lines: int = max_lines
+        self.ring: list[Line] = [None] * max_lines
+        self.wraps: bytearray = bytearray(max_lines) # Whether each line in the ring is soft-wrapped
+        self.start: int = 0 # Ring index of the oldest line
+        self.count: int = 0
+        self.used: int = 0 # Approximate bytes held
+        self.budget: ScrollbackBudget = budget
+        self.spill: SegmentStore = spill
+        self.dropped: int = 0 # Lines discarded for good, when there is nowhere to spill them
+        self.index: SearchIndex = SearchIndex(spill)
+        self.lock = budget.lock if budget else threading.RLock()
+        # Rewrapped view of the lines pushed before the last `reflow()`, by absolute line number
+        self.width: int = 0 # Width lines are rewrapped to
+        self.anchor: int = 0 # Lines from this one on were pushed at `width` and are shown as they are
+        self.scanned: int = 0 # Lines from this one up to `anchor` have been rewrapped into `view_rows`
+        self.view_rows: list[Tuple[int, int, int]] = [] # (first line, last line, segment) of each row, newest first
+        self._logical: tuple = (None, None) # Last logical line joined, ((first, last), (text, attrs))
+        if budget:
+            budget.register(self)
+
+    def __len__(self) -> int:
+        return self.count + (len(self.spill) if self.spill is not None else 0)
+
+    @staticmethod
+    def _sizeof(line: Line) -> int:
+        return sys.getsizeof(line[0]) + (sys.getsizeof(line[1]) if line[1] is not None else 0)
+
+    @staticmethod
+    def trimmed_length(text: str, attrs: array) -> int:
+        """ Length of `text` without its trailing blank cells, styled blanks (eg. a coloured background) are kept """
+        length: int = len(text.rstrip(" "))
+        if attrs is not None and any(attrs[length:]):
+            length = len(attrs)
+            while not attrs[length-1]:
+                length -= 1
+        return length
+
+    def push(self, text: str, attrs: array, wrapped: bool = False) -> None:
+        """ Append a row to history, trimming trailing blank cells unless it is soft-wrapped onto the next """
+        length: int = len(text) if wrapped else self.trimmed_length(text, attrs)
+        line: Line = (text[:length], attrs[:length] if any(attrs[:length]) else None)
+        with self.lock:
+            if self.count == self.max_lines:
+                self.pop_oldest()
+            end: int = (self.start + self.count) % self.max_lines
+            self.ring[end] = line
+            self.wraps[end] = wrapped
+            self.count += 1
+            self.index.add(line[0])
+            nbytes: int = self._sizeof(line)
+            self.used += nbytes
+            if self.budget:
+                self.budget.charge(nbytes)
+
+    def pop_oldest(self) -> Line:
+        """ Evict and return the oldest line in memory, spilling it to disk if possible """
+        with self.lock:
+            line: Line = self.ring[self.start]
+            wrapped: bool = bool(self.wraps[self.start])
+            self.ring[self.start] = None
+            self.start = (self.start + 1) % self.max_lines
+            self.count -= 1
+            nbytes: int = self._sizeof(line)
+            self.used -= nbytes
+            if self.budget:
+                self.budget.used -= nbytes
+            if self.spill is not None:
+                self.spill.append(line, wrapped)
+                self.index.spilled(len(self.spill))
+            else:
+                self.dropped += 1
+                self.index.discarded(self.dropped)
+                self._forget()
+            return line
+
+    def take_wrapped(self) -> List[Line]:
+        """
+        Take back the newest lines which are soft-wrapped, ie. carry on onto the screen, oldest first.
+        Only lines still in memory are, what carries on from disk stays there
+        """
+        lines: List[Line] = []
+        with self.lock:
+            while self.count and self.wraps[(self.start + self.count-1) % self.max_lines]:
+                end: int = (self.start + self.count-1) % self.max_lines
+                line: Line = self.ring[end]
+                self.ring[end] = None
+                self.count -= 1
+                self.index.remove()
+                nbytes: int = self._sizeof(line)
+                self.used -= nbytes
+                if self.budget:
+                    self.budget.used -= nbytes
+                lines.append(line)
+        lines.reverse()
+        return lines
+
+    def line(self, idx: int) -> Line:
+        """ Line `idx` of history, 0 being the oldest still kept """
+        with self.lock: # Another pane may be evicting our oldest lines
+            spilled: int = len(self.spill) if self.spill is not None else 0
+            if idx < spilled:
+                return self.spill.line(idx)
+            idx -= spilled
+            if not 0 <= idx < self.count:
+                raise IndexError(f"Scrollback line {idx} out of range")
+            return self.ring[(self.start + idx) % self.max_lines]
+
+    def wrapped(self, idx: int) -> bool:
+        """ Whether line `idx` was soft-wrapped, ie. carries on in line `idx+1` """
+        with self.lock:
+            spilled: int = len(self.spill) if self.spill is not None else 0
+            if idx < spilled:
+                return self.spill.wrapped(idx)
+            idx -= spilled
+            if not 0 <= idx < self.count:
+                raise IndexError(f"Scrollback line {idx} out of range")
+            return bool(self.wraps[(self.start + idx) % self.max_lines])
+
+    def reflow(self, width: int) -> None:
+        """ Show every line pushed so far rewrapped to `width`, which lines pushed from now on are """
+        with self.lock:
+            self.width = width
+            self.anchor = self.scanned = self.dropped + len(self)
+            self.view_rows = []
+            self._logical = (None, None)
+
+    def _forget(self) -> None:
+        """ Drop rows of the rewrapped view showing lines which have been discarded """
+        if self.anchor < self.dropped:
+            self.anchor = self.scanned = self.dropped
+        self.scanned = max(self.scanned, self.dropped)
+        while self.view_rows and self.view_rows[-1][0] < self.dropped:
+            self.view_rows.pop()
+
+    def view_len(self, back: int = 0) -> int:
+        """
+        Rows of history in the view. Lines yet to be rewrapped count as one row each, so this
+        settles on the true count as the view is scrolled back through them: it is exact up to
+        row `back`, rewrapping as far back as that first.
+        """
+        with self.lock:
+            if back > self.dropped + len(self) - self.anchor:
+                self._view_row(back)
+            return self.dropped + len(self) - self.anchor + len(self.view_rows) + self.scanned - self.dropped
+
+    def _view_row(self, back: int) -> Union[Tuple[int, int, int], None]:
+        """ (first line, last line, segment) shown on row `back` of the rewrapped view, rewrapping more lines if need be """
+        back -= self.dropped + len(self) - self.anchor
+        if back >= len(self.view_rows):
+            self._rewrap(back+1)
+        return self.view_rows[back] if 0 <= back < len(self.view_rows) else None
+
+    def _rewrap(self, rows: int) -> None:
+        """ Rewrap lines before `scanned` until the view has `rows` rows or there are none left """
+        spilled: int = len(self.spill) if self.spill is not None else 0
+        ring, wraps, start, max_lines, width = self.ring, self.wraps, self.start, self.max_lines, self.width
+        view_rows: list = self.view_rows
+        while len(view_rows) < rows and self.scanned > self.dropped:
+            line_no: int = self.scanned-1
+            last: int = line_no - self.dropped - spilled # Position in the ring, lines before are on disk
+            if last < 0:
+                self._rewrap_previous() # On disk
+                continue
+            end: int = (start + last) % max_lines
+            # Lines in memory which are not soft-wrapped were trimmed as they were pushed, and
+            # are a logical line each unless the one before is: those are rewrapped a run at a time
+            count: int = min(rows - len(view_rows), last + (0 if spilled else 1), end)
+            if count > 0 and not wraps[end]:
+                begin: int = max(end - count + 1, wraps.rfind(1, end - count, end) + 2)
+                if begin <= end:
+                    lengths: list = [len(line[0]) for line in ring[begin:end+1]]
+                    line_nos: range = range(line_no, line_no - len(lengths), -1)
+                    if max(lengths) <= width:
+                        view_rows.extend(zip(line_nos, line_nos, itertools.repeat(0)))
+                    else:
+                        for line_no, length in zip(line_nos, reversed(lengths)):
+                            view_rows.extend((line_no, line_no, segment) for segment in reversed(range(max(1, -(-length // width)))))
+                    self.scanned = line_nos[-1]
+                    continue
+            # Otherwise one logical line at a time, which may span several lines
+            first: int = last
+            while first > 0 and wraps[(start + first-1) % max_lines]:
+                first -= 1
+            text, attrs = ring[end]
+            length: int = self.trimmed_length(text, attrs) if wraps[end] else len(text)
+            if (first == 0 and spilled) or (first < last and not length):
+                self._rewrap_previous() # Carrying on from disk, or trailing blanks carry on into the lines before
+                continue
+            length += sum(len(ring[(start + pos) % max_lines][0]) for pos in range(first, last))
+            first = line_no - (last - first)
+            view_rows.extend((first, line_no, segment) for segment in reversed(range(max(1, -(-length // width)))))
+            self.scanned = first
+
+    def _rewrap_previous(self) -> None:
+        """ Rewrap the logical line just before `scanned` into rows of `width` """
+        last: int = self.scanned-1
+        first: int = last
+        # A line carrying on past `anchor` is cut there, the rest was pushed at the new width
+        while first > self.dropped and self.wrapped(first-1 - self.dropped):
+            first -= 1
+        text, attrs = self._join(first, last)
+        length: int = self.trimmed_length(text, attrs)
+        rows: int = max(1, -(-length // self.width))
+        self.view_rows.extend((first, last, segment) for segment in reversed(range(rows)))
+        self.scanned = first
+
+    def _join(self, first: int, last: int) -> Line:
+        """ Text and attributes of lines [first, last] (absolute numbers) joined into one logical line """
+        key, joined = self._logical
+        if key == (first, last):
+            return joined
+        lines: list[Line] = [self.line(line_no - self.dropped) for line_no in range(first, last+1)]
+        text: str = "".join(line[0] for line in lines)
+        attrs: Union[array, None] = None
+        if any(line[1] is not None for line in lines):
+            attrs = array("H")
+            for line_text, line_attrs in lines:
+                attrs += line_attrs if line_attrs is not None else array("H", [0]) * len(line_text)
+        self._logical = ((first, last), (text, attrs))
+        return text, attrs
+
+    def view_line(self, back: int) -> Line:
+        """ Row `back` of the view counting back from the newest (0), rewrapped if pushed before the last `reflow()` """
+        with self.lock:
+            native: int = self.dropped + len(self) - self.anchor
+            if back < native:
+                return self.line(len(self) - 1 - back)
+            row: Union[Tuple[int, int, int], None] = self._view_row(back)
+            if row is None:
+                return ("", None)
+            first, last, segment = row
+            text, attrs = self._join(first, last)
+            start: int = segment * self.width
+            return (text[start:start+self.width], attrs[start:start+self.width] if attrs is not None else None)
+
+    def view_line_number(self, back: int) -> Tuple[int, bool]:
+        """
+        Absolute number of the line shown on row `back` of the view (see `view_line()`), and
+        whether the row shows that line exactly, rather than part of it rewrapped
+        """
+        with self.lock:
+            native: int = self.dropped + len(self) - self.anchor
+            if back < native:
+                return (self.dropped + len(self) - 1 - back, True)
+            row: Union[Tuple[int, int, int], None] = self._view_row(back)
+            if row is None:
+                return (self.dropped, False)
+            first, last, segment = row
+            # Exact if the line is shown on this one row, the row before (newer) being another line
+            newer: int = back-native-1
+            exact: bool = first == last and segment == 0 and (newer < 0 or self.view_rows[newer][0] != first)
+            return (min(first + segment, last), exact)
+
+    def close(self) -> None:
+        """ Release memory and any spilled history, called when the pane is destroyed """
+        if self.budget:
+            self.budget.unregister(self)
+        with self.lock:
+            self.ring = [None] * self.max_lines
+            self.start = self.count = 0
+            self.view_rows = []
+            self._logical = (None, None)
+            if self.spill is not None:
+                self.spill.close()
+                self.spill = None
@@ -0,0 +1,195 @@
+import re
+import time
+from collections import deque
+from typing import List, Tuple, Dict, Union
+
+chunk_lines: int = 256 # Lines of history summarised by each bloom filter
+bloom_bits: int = 2048 * 8
+
+word_re = re.compile(r"\w+")
+
+def trigram_bits(text: str) -> set:
+    """
+    Bloom filter bit positions (2 per trigram) of every trigram lying within a word of `text`.
+    Deduplicating words first makes this far cheaper than taking every trigram, and stays exact:
+    each word of a pattern is a substring of some word of any line it appears in.
+    """
+    bits: set = set()
+    trigrams: set = set()
+    for word in set(word_re.findall(text)):
+        trigrams.update(word[i:i+3] for i in range(len(word)-2))
+    for trigram in trigrams:
+        h: int = hash(trigram)
+        bits.add(h & (bloom_bits-1))
+        bits.add((h >> 16) & (bloom_bits-1))
+    return bits
+
+class SearchIndex:
+    """
+    Incrementally built index over a `Scrollback`. Lines are grouped into chunks of
+    `chunk_lines`, and each completed chunk is summarised by a bloom filter of the
+    (lowercased) trigrams it contains, so a search only has to scan chunks which
+    may contain every trigram of the pattern. Only the filters of chunks still in memory
+    are kept here: those of chunks spilled are written to `store` next to their lines
+    (see `SegmentStore.append_bloom`), and those of chunks discarded are released.
+    """
+    def __init__(self, store=None) -> None:
+        self.store = store # `SegmentStore` spilled lines go to, if any
+        self.blooms: deque = deque() # Filters of the chunks in memory, the first one of chunk `first`
+        self.first: int = 0 # Chunk N covers absolute lines [N*chunk_lines, (N+1)*chunk_lines)
+        self.pending: List[str] = [] # Lines of the chunk currently being filled
+        self.reopened: Union[bytes, None] = None # Filter of the chunk being filled again, see `remove()`
+
+    def __len__(self) -> int:
+        """ Chunks completed, whether their filter is still in memory, on disk or released """
+        return self.first + len(self.blooms)
+
+    def add(self, text: str) -> None:
+        self.pending.append(text.lower())
+        if len(self.pending) == chunk_lines:
+            bloom: bytearray = bytearray(bloom_bits // 8)
+            for bit in trigram_bits("\n".join(self.pending)):
+                bloom[bit >> 3] |= 1 << (bit & 7)
+            if self.reopened is not None:
+                bloom = bytearray(a | b for a, b in zip(bloom, self.reopened))
+                self.reopened = None
+            self.blooms.append(bytes(bloom))
+            self.pending = []
+
+    def remove(self) -> None:
+        """
+        Forget the newest line added, taken back out of history. Once its chunk was completed,
+        its filter is kept to be merged into the chunk's new one: it may only match more lines
+        """
+        if self.pending:
+            self.pending.pop()
+        elif self.blooms:
+            self.reopened = self.blooms.pop()
+            self.pending = [""] * (chunk_lines-1) # Lines only covered by `reopened`
+
+    def bloom(self, chunk: int) -> Union[bytes, None]:
+        """ Filter of chunk `chunk`, None once its lines have been discarded """
+        if chunk >= self.first:
+            return self.blooms[chunk - self.first]
+        if self.store is not None:
+            return self.store.bloom(chunk)
+        return None
+
+    def may_contain(self, chunk: int, bits: set) -> bool:
+        """ Whether chunk `chunk` possibly contains a pattern with trigram `bits` """
+        bloom: bytes = self.bloom(chunk)
+        return all(bloom[bit >> 3] & (1 << (bit & 7)) for bit in bits)
+
+    def discarded(self, dropped: int) -> None:
+        """ Called once `dropped` lines have been discarded, releasing the filter of a chunk it completes """
+        if dropped % chunk_lines == 0 and dropped // chunk_lines > self.first and self.blooms:
+            self.blooms.popleft()
+            self.first += 1
+
+    def spilled(self, spilled: int) -> None:
+        """ Called once `spilled` lines have been moved to `store`, moving the filter of a chunk it completes there too """
+        if spilled % chunk_lines == 0 and spilled // chunk_lines > self.first and self.blooms:
+            self.store.append_bloom(self.first, self.blooms.popleft())
+            self.first += 1
+
+class Search:
+    """
+    Incremental search through a `CharDisplay`'s screen and history. Candidate
+    chunks are scanned newest first a few milliseconds at a time by `step()`,
+    so results stream in while the event loop keeps servicing ptys.
+    Matches are (absolute line number, column) pairs, see `CharDisplay.line_number()`, kept
+    newest first: lines are scanned from the newest back, so they are found in that order.
+    Patterns without uppercase characters match case-insensitively.
+    """
+    remote: bool = False # Whether matches are found elsewhere, `step()` then only takes those which arrived
+    def __init__(self, disp, pattern: str) -> None:
+        self.disp = disp
+        self.pattern: str = pattern
+        self.ignore_case: bool = pattern == pattern.lower()
+        self.matches: List[Tuple[int, int]] = [] # Newest first
+        self.by_line: Dict[int, List[int]] = {}
+        self.selected: Union[Tuple[int, int], None] = None
+        self.done: bool = False
+        history = disp.history
+        self._bits: set = trigram_bits(pattern.lower())
+        # Lines not covered by a bloom filter are always scanned: the screen, then history not yet indexed
+        first_screen: int = disp.line_number(disp.view_offset)
+        self._scan(range(first_screen, first_screen + disp.size[1]))
+        self._next_chunk: int = -1
+        if history is not None:
+            indexed: int = len(history.index) * chunk_lines
+            self._scan(range(max(indexed, history.dropped), first_screen))
+            self._next_chunk = len(history.index) - 1
+        self.done = self._next_chunk < 0
+
+    def _text(self, line_no: int) -> str:
+        """ Text of absolute line `line_no`, be it in history or on screen """
+        history = self.disp.history
+        offset: int = (history.dropped + len(history)) if history is not None else 0
+        if line_no >= offset:
+            return self.disp.row_text(line_no - offset)
+        return history.line(line_no - history.dropped)[0]
+
+    def _scan(self, line_nos: range) -> None:
+        """ Look for the pattern in the given lines, newest first """
+        pattern: str = self.pattern.lower() if self.ignore_case else self.pattern
+        for line_no in reversed(line_nos):
+            text: str = self._text(line_no)
+            if self.ignore_case:
+                text = text.lower()
+            cols: List[int] = []
+            col: int = text.find(pattern)
+            while col != -1:
+                cols.append(col)
+                col = text.find(pattern, col+1)
+            if cols:
+                self.by_line[line_no] = cols
+                self.matches.extend((line_no, col) for col in reversed(cols))
+
+    def step(self, budget: float = 0.005) -> bool:
+        """ Scan candidate chunks for up to `budget` seconds, returns whether any matches were found """
+        found: int = len(self.matches)
+        history = self.disp.history
+        deadline: float = time.perf_counter() + budget
+        while self._next_chunk >= 0 and time.perf_counter() < deadline:
+            chunk: int = self._next_chunk
+            self._next_chunk -= 1
+            if history.index.bloom(chunk) is None: # Discarded, as are all older chunks
+                self._next_chunk = -1
+                break
+            if not self._bits or history.index.may_contain(chunk, self._bits):
+                self._scan(range(max(chunk*chunk_lines, history.dropped), (chunk+1)*chunk_lines))
+        self.done = self._next_chunk < 0
+        return len(self.matches) > found
+
+    def select(self, direction: int = 0) -> Union[Tuple[int, int], None]:
+        """
+        Move the selected match `direction` matches forwards (newer) or backwards (older)
+        and return it. The newest match is selected first.
+        """
+        if not self.matches:
+            return None
+        if self.selected is None:
+            self.selected = self.matches[0]
+        else:
+            idx: int = self.index(self.selected) - direction
+            self.selected = self.matches[max(0, min(len(self.matches)-1, idx))]
+        return self.selected
+
+    def index(self, match: Tuple[int, int]) -> int:
+        """ Position of `match` in `matches` (newest first), or of the next older one if it is not there """
+        lo, hi = 0, len(self.matches)
+        while lo < hi:
+            mid: int = (lo + hi) // 2
+            if self.matches[mid] > match:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def cols_on(self, line_no: int) -> List[int]:
+        """ Columns of matches on absolute line `line_no` """
+        return self.by_line.get(line_no, [])
+
+    def close(self) -> None:
+        pass # Nothing runs in between steps
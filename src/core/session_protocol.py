@@ -0,0 +1,98 @@
+"""
+Wire format between a session server and the clients attached to it, over a Unix domain socket.
+Each message is a tuple, `marshal`led and prefixed with its length. `marshal` is only
+safe with trusted data, so the socket is made accessible to its owner alone.
+
+Server to client:
+    ("panes", [(pane, cols, lines), ...])       on attaching, every pane hosted
+    ("created", pane)                           reply to "new"
+    ("rows", pane, history, dropped, x, y, flags, title, [(y, text, styles), ...])
+        rows changed since the last message for that pane (all of them at first), the cursor,
+        `flags` (1: cursor visible) and the title. `history` and `dropped` are the pane's
+        scrollback length and lines discarded for good, which history line numbers start after
+    ("history", pane, first, [(text, styles), ...])
+        scrollback lines from absolute line number `first`, in reply to "history"
+    ("matches", pane, search, [(line, col), ...], done)
+        matches found since the last message for search id `search`, newest first,
+        as (absolute line number, column) pairs. `done` once the search is over
+    ("dropped", pane, nbytes, queued)           input (or a paste) of `nbytes` was dropped, as the pane
+                                                already had `queued` bytes of input its shell is yet to read
+    ("exit", pane)                              the pane's shell has exited
+
+Client to server:
+    ("new", cols, lines)                        start a pane
+    ("keys", pane, data)                        keystrokes for the pane's shell
+    ("paste", pane, data)                       pasted text, bracketed if the pane's shell asked for it
+    ("resize", pane, cols, lines)
+    ("history", pane, first, count)             ask for scrollback lines
+    ("search", pane, search, pattern)           search the pane's screen and history, replacing the
+                                                previous search of that pane. A None pattern only stops it
+
+Rows have trailing blanks trimmed, and `styles` is None when every cell has the
+default style, otherwise the packed styles (see `core.style.pack_style`) as bytes.
+"""
+import os
+import marshal
+import struct
+import tempfile
+from array import array
+from typing import Callable, List, Tuple, Union
+
+default_socket_path: str = os.path.join(os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir(), f"wa3-{os.getuid()}", "session")
+
+length_header = struct.Struct("<I")
+max_message: int = 64*1024*1024
+
+Row = Tuple[str, Union[bytes, None]]
+
+def encode(msg: tuple) -> bytes:
+    payload: bytes = marshal.dumps(msg)
+    return length_header.pack(len(payload)) + payload
+
+class MessageReader:
+    """ Splits a byte stream back into messages, whatever the boundaries of the reads """
+    def __init__(self) -> None:
+        self.buf: bytearray = bytearray()
+
+    def feed(self, data: bytes) -> List[tuple]:
+        """ Messages completed by `data`, raises ValueError on a malformed stream """
+        self.buf += data
+        msgs: List[tuple] = []
+        start: int = 0
+        while len(self.buf) - start >= length_header.size:
+            length: int = length_header.unpack_from(self.buf, start)[0]
+            if length > max_message:
+                raise ValueError(f"Message of {length} bytes is too large")
+            end: int = start + length_header.size + length
+            if end > len(self.buf):
+                break
+            try:
+                msg = marshal.loads(self.buf[start+length_header.size:end])
+            except (EOFError, TypeError) as e:
+                raise ValueError(f"Malformed message: {e}")
+            if not isinstance(msg, tuple) or not msg:
+                raise ValueError(f"Malformed message: {msg!r}")
+            msgs.append(msg)
+            start = end
+        del self.buf[:start]
+        return msgs
+
+def encode_row(text: str, attrs: array, pack: Callable[[int], int]) -> Row:
+    """ A row of cells as sent, `pack` maps the sender's style ids to packed styles """
+    length: int = len(text.rstrip(" "))
+    if any(attrs[length:]): # Styled blanks (eg. a coloured background) must be kept
+        length = max(i for i in range(len(attrs)) if attrs[i]) + 1
+    if not any(attrs[:length]):
+        return (text[:length], None)
+    return (text[:length], array("Q", map(pack, attrs[:length])).tobytes())
+
+def decode_row(row: Row, cols: int, unpack: Callable[[int], int]) -> Tuple[str, array]:
+    """ Text and style ids of a received row, padded or cut to `cols` cells """
+    text, styles = row
+    text = text[:cols].ljust(cols)
+    if styles is None:
+        return (text, array("H", [0]) * cols)
+    packed: array = array("Q")
+    packed.frombytes(styles)
+    attrs: array = array("H", map(unpack, packed[:cols]))
+    return (text, attrs + array("H", [0]) * (cols - len(attrs)))
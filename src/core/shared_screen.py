@@ -0,0 +1,125 @@
+import struct
+from array import array
+from multiprocessing import shared_memory
+from typing import Callable, Dict, List, Tuple
+from core.char_display import CharDisplay
+
+class SharedScreen:
+    """
+    Screen of a `CharDisplay` published into a `multiprocessing.shared_memory` block, so a
+    pane's worker process can parse output while the UI process only copies out what changed.
+
+    The block holds, in this order:
+        header:  cols, lines, cursor x and y, flags, frame pending, bytes parsed and the title
+        chars:   code point of every cell (UTF-32, the same layout as `CharDisplay.chars`)
+        styles:  packed style of every cell (see `core.style.pack_style`), as style ids
+                 are only meaningful to the `StyleTable` of the process which interned them
+        damage:  one byte per row, set once the row's cells have been written
+
+    There are no locks: the worker writes a row's cells before setting its damage byte and
+    the UI clears the byte before reading the cells, so a row read while being written
+    is read again on the next frame. `pending` works the same way for frame notifications.
+    The UI process creates and unlinks blocks, workers only attach to them.
+    """
+    header = struct.Struct("<IIiiIIQ256s")
+    CURSOR_VISIBLE = 1 # Flag set while the cursor is shown (DEC private mode 25)
+
+    def __init__(self, name: str = None, size: Tuple[int, int] = None) -> None:
+        """ Attach to the block `name`, or create a new block for a screen of `size` (cols, lines) """
+        if name is None:
+            cols, lines = size
+            self.shm = shared_memory.SharedMemory(create=True, size=self.block_size(cols, lines))
+            self.header.pack_into(self.shm.buf, 0, cols, lines, 0, 0, self.CURSOR_VISIBLE, 0, 0, b"")
+        else:
+            self.shm = shared_memory.SharedMemory(name)
+        self.name: str = self.shm.name
+        self.cols: int
+        self.lines: int
+        self.cols, self.lines = struct.unpack_from("<II", self.shm.buf, 0)
+        cells: int = self.cols * self.lines
+        chars_at: int = self.header.size
+        styles_at: int = (chars_at + cells*4 + 7) & ~7
+        damage_at: int = styles_at + cells*8
+        self.chars: memoryview = self.shm.buf[chars_at:styles_at]
+        self.styles: memoryview = self.shm.buf[styles_at:damage_at]
+        self.damage: memoryview = self.shm.buf[damage_at:damage_at+self.lines]
+
+    @classmethod
+    def block_size(cls, cols: int, lines: int) -> int:
+        return ((cls.header.size + cols*lines*4 + 7) & ~7) + cols*lines*8 + lines
+
+    def publish(self, disp: CharDisplay, cursor_visible: bool, title: str, parsed: int,
+                pack: Callable[[int], int]) -> int:
+        """
+        Worker side: write rows of `disp` damaged since the last call, and the cursor,
+        flags and title. `pack` packs the worker's style ids. Returns the number of rows written.
+        """
+        if disp.size != (self.cols, self.lines):
+            return 0
+        damage: Dict[int, Tuple[int, int]] = disp.take_damage()
+        for top, bottom, _ in disp.take_scrolls():
+            # Rows moved by scrolling are not damaged in `disp`, they are here
+            for y in range(top, bottom+1):
+                damage[y] = (0, self.cols)
+        for y, (start_x, end_x) in damage.items():
+            at: int = y*self.cols + start_x
+            self.chars[at*4:(at + end_x-start_x)*4] = disp.row_text(y, start_x, end_x).encode("utf-32-le")
+            attrs: array = disp.row_attrs(y)[start_x:end_x]
+            if any(attrs):
+                self.styles[at*8:(at + end_x-start_x)*8] = array("Q", map(pack, attrs)).tobytes()
+            else:
+                self.styles[at*8:(at + end_x-start_x)*8] = bytes(8*len(attrs))
+            self.damage[y] = 1
+        x, y = disp.curs.get_pos()
+        flags: int = self.CURSOR_VISIBLE if cursor_visible else 0
+        struct.pack_into("<iiI", self.shm.buf, 8, x, y, flags)
+        struct.pack_into("<Q256s", self.shm.buf, 24, parsed, title.encode("utf8")[:256])
+        return len(damage)
+
+    def set_pending(self) -> bool:
+        """ Worker side: flag a frame as waiting, returns False if one already was and the UI need not be told """
+        if self.shm.buf[20]:
+            return False
+        self.shm.buf[20] = 1
+        return True
+
+    def copy_into(self, disp: CharDisplay, unpack: Callable[[int], int]) -> int:
+        """
+        UI side: copy rows damaged since the last call into `disp`, which must be the same size,
+        along with the cursor. `unpack` maps packed styles to style ids of the UI's `StyleTable`.
+        Returns the number of rows copied.
+        """
+        self.shm.buf[20] = 0
+        if disp.size != (self.cols, self.lines):
+            return 0
+        rows: List[int] = [y for y, damaged in enumerate(bytes(self.damage)) if damaged]
+        row_bytes: int = self.cols*4
+        for y in rows:
+            self.damage[y] = 0
+            text: str = str(self.chars[y*row_bytes:(y+1)*row_bytes], "utf-32-le")
+            styles: array = array("Q")
+            styles.frombytes(self.styles[y*self.cols*8:(y+1)*self.cols*8])
+            attrs: array = array("H", map(unpack, styles)) if any(styles) else array("H", [0]) * self.cols
+            disp.load_row(y, text, attrs)
+        x, y, _ = struct.unpack_from("<iiI", self.shm.buf, 8)
+        disp.curs.set_pos(x, y)
+        return len(rows)
+
+    def cursor_visible(self) -> bool:
+        return bool(struct.unpack_from("<I", self.shm.buf, 16)[0] & self.CURSOR_VISIBLE)
+
+    def parsed(self) -> int:
+        """ Bytes of output the worker has parsed so far """
+        return struct.unpack_from("<Q", self.shm.buf, 24)[0]
+
+    def title(self) -> str:
+        return struct.unpack_from("<256s", self.shm.buf, 32)[0].rstrip(b"\0").decode("utf8", "replace")
+
+    def close(self, unlink: bool = False) -> None:
+        """ Detach from the block, also destroying it if `unlink` (UI side) """
+        self.chars.release()
+        self.styles.release()
+        self.damage.release()
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
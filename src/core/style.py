@@ -0,0 +1,167 @@
+import threading
+from typing import Tuple, List, Dict
+
+# Style flags
+BOLD = 1
+DIM = 2
+ITALIC = 4
+UNDERLINE = 8
+BLINK = 16
+REVERSE = 32
+INVISIBLE = 64
+STRIKE = 128
+# SGR params which set/reset style flags
+sgr_set = {1: BOLD, 2: DIM, 3: ITALIC, 4: UNDERLINE, 5: BLINK, 7: REVERSE, 8: INVISIBLE, 9: STRIKE}
+sgr_reset = {21: UNDERLINE, 22: BOLD | DIM, 23: ITALIC, 24: UNDERLINE, 25: BLINK, 27: REVERSE, 28: INVISIBLE, 29: STRIKE}
+
+# Colours are -1 for the terminal's default, 0-255 for palette colours,
+# or a truecolour value 0xRRGGBB with `RGB` set
+DEFAULT = -1
+RGB = 1 << 24
+
+# (flags, foreground, background)
+Style = Tuple[int, int, int]
+
+def rgb_to_palette(color: int) -> int:
+    """ Nearest colour of the xterm 256-colour palette (its 6x6x6 cube or grey ramp) to truecolour `color` """
+    r, g, b = (color >> 16) & 0xff, (color >> 8) & 0xff, color & 0xff
+    levels = (0, 95, 135, 175, 215, 255)
+    cube: List[int] = [min(range(6), key=lambda i: abs(levels[i]-c)) for c in (r, g, b)]
+    cube_rgb: List[int] = [levels[i] for i in cube]
+    grey: int = max(0, min(23, round(((r+g+b)/3 - 8) / 10)))
+    grey_level: int = 8 + grey*10
+    if sum(abs(c-grey_level) for c in (r, g, b)) < sum(abs(c-l) for c, l in zip((r, g, b), cube_rgb)):
+        return 232 + grey
+    return 16 + cube[0]*36 + cube[1]*6 + cube[2]
+
+def pack_style(style: Style) -> int:
+    """ `style` as a single integer, for sharing with processes which have their own `StyleTable` """
+    flags, fg, bg = style
+    return flags << 52 | (fg+1) << 26 | (bg+1)
+
+def unpack_style(packed: int) -> Style:
+    return (packed >> 52, (packed >> 26 & 0x3ffffff) - 1, (packed & 0x3ffffff) - 1)
+
+class StyleTable:
+    """
+    Table of every distinct style in use, shared by all terminals. Cells (and scrollback)
+    only store a style's id, which is an index into `styles`, id 0 being the default style.
+    Styles are never removed so that ids in history stay valid, the table is bounded by
+    the 16-bit cell attribute instead: once full, truecolours are folded onto the
+    256-colour palette, and should even that fail the default style is used.
+    """
+    max_styles: int = 65536
+    max_transitions: int = 4096
+
+    def __init__(self) -> None:
+        self.styles: List[Style] = [(0, DEFAULT, DEFAULT)]
+        self.ids: Dict[Style, int] = {self.styles[0]: 0}
+        # (style id, SGR params) -> resulting style id, programs keep repeating the same few
+        self.transitions: Dict[Tuple[int, tuple], int] = {}
+        # Terminals parse on threads of their own, new styles are added one at a time
+        self.lock = threading.Lock()
+        self._packed: List[int] = [] # Style id -> packed style, see `pack()`
+        self._unpacked: Dict[int, int] = {} # Packed style -> style id, see `unpack()`
+
+    def __len__(self) -> int:
+        return len(self.styles)
+
+    def intern(self, style: Style) -> int:
+        """ Id of `style`, adding it to the table if need be, callers hold `lock` """
+        style_id = self.ids.get(style)
+        if style_id is not None:
+            return style_id
+        if len(self.styles) >= self.max_styles:
+            flags, fg, bg = style
+            folded: Style = (flags, rgb_to_palette(fg) if fg >= RGB else fg, rgb_to_palette(bg) if bg >= RGB else bg)
+            return self.ids.get(folded, 0)
+        self.ids[style] = len(self.styles)
+        self.styles.append(style)
+        return self.ids[style]
+
+    def pack(self, style_id: int) -> int:
+        """ Style `style_id` packed by `pack_style`, for sharing with processes which have their own table """
+        try:
+            return self._packed[style_id]
+        except IndexError:
+            with self.lock:
+                while len(self._packed) <= style_id:
+                    self._packed.append(pack_style(self.styles[len(self._packed)]))
+            return self._packed[style_id]
+
+    def unpack(self, packed: int) -> int:
+        """ Id of a style packed by another table's `pack()`, adding it if need be """
+        style_id = self._unpacked.get(packed)
+        if style_id is None:
+            with self.lock:
+                style_id = self._unpacked[packed] = self.intern(unpack_style(packed))
+        return style_id
+
+    def apply_sgr(self, style_id: int, params: tuple) -> int:
+        """ Id of the style resulting from applying SGR `params` on top of style `style_id` """
+        key = (style_id, params)
+        result = self.transitions.get(key)
+        if result is None:
+            with self.lock:
+                if len(self.transitions) >= self.max_transitions:
+                    self.transitions.clear()
+                result = self.transitions[key] = self._apply_sgr(style_id, params)
+        return result
+
+    def _apply_sgr(self, style_id: int, params: tuple) -> int:
+        flags, fg, bg = self.styles[style_id]
+        params = params or (0,)
+        i: int = 0
+        while i < len(params):
+            param = params[i]
+            i += 1
+            if isinstance(param, tuple): # Colon separated sub-parameters, eg. 38:2::255:0:0
+                color: int = self._extended_color(param[1:], True)
+                if param[0] == 38:
+                    fg = color
+                elif param[0] == 48:
+                    bg = color
+                elif param[0] == 4: # Underline style, 4:0 turns it off
+                    flags = flags | UNDERLINE if len(param) < 2 or param[1] else flags & ~UNDERLINE
+                continue
+            if param == 0:
+                flags, fg, bg = 0, DEFAULT, DEFAULT
+            elif param in sgr_set:
+                flags |= sgr_set[param]
+            elif param in sgr_reset:
+                flags &= ~sgr_reset[param]
+            elif 30 <= param <= 37:
+                fg = param - 30
+            elif 40 <= param <= 47:
+                bg = param - 40
+            elif 90 <= param <= 97:
+                fg = param - 90 + 8
+            elif 100 <= param <= 107:
+                bg = param - 100 + 8
+            elif param == 39:
+                fg = DEFAULT
+            elif param == 49:
+                bg = DEFAULT
+            elif param == 38 or param == 48:
+                # 38;5;<n> or 38;2;<r>;<g>;<b>, which consume the params that follow
+                mode = params[i] if i < len(params) else None
+                length: int = 2 if mode == 5 else 4 if mode == 2 else 1
+                color = self._extended_color(params[i:i+length], False)
+                i += length
+                if param == 38:
+                    fg = color
+                else:
+                    bg = color
+        return self.intern((flags, fg, bg))
+
+    @staticmethod
+    def _extended_color(args: tuple, colon: bool) -> int:
+        """ Colour of the arguments following 38/48, `DEFAULT` if malformed """
+        if len(args) >= 2 and args[0] == 5:
+            return args[1] if 0 <= args[1] <= 255 else DEFAULT
+        if len(args) >= 4 and args[0] == 2:
+            # The colon form may carry a colour space id before the components: 38:2:<id>:<r>:<g>:<b>
+            r, g, b = args[-3:] if colon else args[1:4]
+            if all(0 <= c <= 255 for c in (r, g, b)):
+                return RGB | (r << 16) | (g << 8) | b
+        return DEFAULT
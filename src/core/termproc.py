@@ -3,100 +3,246 @@ import termios
 import struct
 import fcntl
 import pty
-import subprocess
 import os
-import sys
+import codecs
+from collections import deque
+from typing import List, Tuple, Union
+
+class ShellProcess:
+    """
+    The parts of `subprocess.Popen` we use, for a shell started by `os.posix_spawn`.
+    Like `Popen`, a child reaped by someone else reads as having exited with 0
+    """
+    def __init__(self, pid: int) -> None:
+        self.pid: int = pid
+        self.returncode: Union[int, None] = None
+        # Readable once the shell has exited, so it can be waited on along with other fds. None where
+        # pidfds are not supported (Linux < 5.3), the shell's exit is then only told by SIGCHLD
+        self.pidfd: Union[int, None] = None
+        try:
+            self.pidfd = os.pidfd_open(pid)
+        except (AttributeError, OSError):
+            pass
+
+    @staticmethod
+    def exit_code(status: int) -> int:
+        """ Exit code of a wait status as `Popen` has it, negative for a signal (`os.waitstatus_to_exitcode` is 3.9+) """
+        if os.WIFSIGNALED(status):
+            return -os.WTERMSIG(status)
+        return os.WEXITSTATUS(status)
+
+    def poll(self) -> Union[int, None]:
+        """ Exit code if the shell has exited, None otherwise """
+        if self.returncode is None:
+            try:
+                pid, status = os.waitpid(self.pid, os.WNOHANG)
+            except ChildProcessError:
+                pid, status = self.pid, 0
+            if pid:
+                self.returncode = self.exit_code(status)
+        return self.returncode
+
+    def wait(self) -> int:
+        if self.returncode is None:
+            try:
+                status: int = os.waitpid(self.pid, 0)[1]
+            except ChildProcessError:
+                status = 0
+            self.returncode = self.exit_code(status)
+        return self.returncode
+
+    def send_signal(self, sig: int) -> None:
+        if self.poll() is None: # Never signal a pid which may have been reused
+            os.kill(self.pid, sig)
+
+    def close(self) -> None:
+        """ Close `pidfd`, the shell can still be reaped with `poll` or `wait` """
+        if self.pidfd is not None:
+            os.close(self.pidfd)
+            self.pidfd = None
 
 class TerminalProcess:
-    def __init__(self):
+    min_read: int = 4096
+    max_read: int = 64*1024
+    max_queued: int = 4*1024*1024 # Bytes of input waiting for the shell to read, beyond which more is refused
+
+    def __init__(self, decode: bool = True, size: Tuple[int, int] = None):
         """
-        Underlying pty process implementation
+        Underlying pty process implementation.
+        With `decode` False, `read` hands back raw bytes for `VTParser` to decode itself.
+        `size` (cols, lines) is set on the pty before the shell starts, so it need not be told with SIGWINCH
         """
+        self.decode: bool = decode
+        # Carries multibyte characters split across reads over to the next read
+        self.decoder = codecs.getincrementaldecoder('utf8')('replace')
         master, slave = pty.openpty() # Open a psuedoterminal pair with  master controlling slave's io
-        self.proc = subprocess.Popen(args=[os.environ.get('SHELL', '/bin/bash')],
-                                    env=os.environ,
-                                    stdin=slave,
-                                    stdout=slave,
-                                    stderr=slave,
-                                    close_fds=True,
-                                    preexec_fn=self.preinit_fn)
-
-        # Create psuedo-iobuffers by opening fd copies of master
+        self.size: Tuple[int, int] = None
+        if size:
+            self.set_size(master, *size)
+        self.proc: ShellProcess = self.spawn(os.ttyname(slave))
+
+        # Create psuedo-iobuffers by opening fd copies of master.
+        # The slave's stdout and stderr both arrive on the master, so there is a single fd to read
         self.stdin = os.fdopen(os.dup(master), 'r+b', 0)
-        self.stderr = os.fdopen(os.dup(master), 'r+b', 0)
         # Make stdout non-blocking
         stdoutfd = os.dup(master) 
         fl = fcntl.fcntl(stdoutfd, fcntl.F_GETFL)
         fcntl.fcntl(stdoutfd, fcntl.F_SETFL, fl | os.O_NONBLOCK)
         self.stdout = os.fdopen(stdoutfd, 'r+b', 0)
         
+        # Reads land in one preallocated buffer, `read_size` adapts to how busy the pty is
+        self.read_buf: bytearray = bytearray(self.max_read)
+        self.read_view: memoryview = memoryview(self.read_buf)
+        self.read_size: int = self.min_read
+        self.closed: bool = False # Set once reading fails for good, ie. the shell has let go of the pty
+        # Input the pty has yet to take, see `send`. `stdin` shares its file description with `stdout`, so is non-blocking too
+        self.queue: deque = deque() # memoryviews, the first of which may have been partly written
+        self.queued: int = 0
+
         # Don't need master and slave open anymore
         os.close(master)
         os.close(slave)
 
-    def preinit_fn(self):
-        '''
-        Taken from https://github.com/Gallopsled/pwntools/blob/493a3e3d925a87dbbfc90423f0d02cf72724fade/pwnlib/tubes/process.py#L774
-        
-        Routine executed in the child process before invoking execve().
-        This makes the pseudo-terminal the controlling tty. This should be
-        more portable than the pty.fork() function.
-        '''
-        child_name = os.ttyname(0)
+    @staticmethod
+    def spawn(tty: str) -> ShellProcess:
+        """
+        Start the shell on the pty slave `tty`. It is made a session leader, then opens `tty` by name
+        as stdin, which makes it its controlling tty. No Python runs in the child (as a `preexec_fn`
+        would), so `posix_spawn` can take its vfork fast path rather than copying our whole process.
+        Our fds are not inheritable, so only the pty is passed on
+        """
+        shell: str = os.environ.get('SHELL', '/bin/bash')
+        pid: int = os.posix_spawnp(shell, [shell], os.environ,
+                                   file_actions=[(os.POSIX_SPAWN_OPEN, 0, tty, os.O_RDWR, 0),
+                                                 (os.POSIX_SPAWN_DUP2, 0, 1),
+                                                 (os.POSIX_SPAWN_DUP2, 0, 2)],
+                                   setsid=True,
+                                   # As `subprocess` does, undo what Python and our event loop changed
+                                   setsigmask=set(), setsigdef=(signal.SIGPIPE, signal.SIGXFSZ))
+        return ShellProcess(pid)
 
-        # Disconnect from controlling tty. Harmless if not already connected.
+    def read(self, limit: int = max_read):
+        """
+        Read up to `min(read_size, limit)` bytes from process (NON-BLOCKING).
+        Returns '' if there is nothing to read. Without `decode` the data is a memoryview
+        into `read_buf`, only valid until the next read.
+        """
+        want: int = min(self.read_size, limit)
         try:
-            fd = os.open('/dev/tty', os.O_RDWR | os.O_NOCTTY)
-            if fd >= 0:
-                os.close(fd)
-        except OSError:
-            pass  # Already disconnected
+            amnt: int = os.readv(self.stdout.fileno(), [self.read_view[:want]])
+        except BlockingIOError: # Nothing to read
+            return ''
+        except OSError: # EIO once the shell has gone
+            self.closed = True
+            return ''
+        # Grow while reads keep filling the buffer, shrink back once the pty goes quiet
+        if amnt == want and want == self.read_size:
+            self.read_size = min(self.read_size * 2, self.max_read)
+        elif amnt < self.read_size // 4:
+            self.read_size = max(self.read_size // 2, self.min_read)
+        chunk: memoryview = self.read_view[:amnt]
+        if not self.decode:
+            return chunk
+        return self.decoder.decode(chunk)
 
-        os.setsid()
+    def send(self, data: bytes) -> bool:
+        """
+        Write to process stdin without blocking. Whatever the pty does not take straight away is queued,
+        for `flush` to write once `stdin` is writable. Returns False, sending none of `data`, if that would
+        queue more than `max_queued` bytes, eg. as the program in the foreground has stopped reading
+        """
+        if self.queued + len(data) > self.max_queued:
+            return False
+        self.queue.append(memoryview(bytes(data)))
+        self.queued += len(data)
+        self.flush()
+        return True
 
-        # Verify we are disconnected from controlling tty
-        # by attempting to open it again.
-        try:
-            fd = os.open('/dev/tty', os.O_RDWR | os.O_NOCTTY)
-            if fd >= 0:
-                os.close(fd)
-                raise Exception('Failed to disconnect from controlling tty. '
-                                'It is still possible to open /dev/tty.')
-        except OSError:
-            pass  # Good! We are disconnected from a controlling tty.
-
-        # Verify we can open the child pty.
-        fd = os.open(child_name, os.O_RDWR)
-        if fd < 0:
-            raise Exception('Could not open child pty, %s' % child_name)
-        else:
-            os.close(fd)
-
-        # Verify we now have a controlling tty.
-        fd = os.open('/dev/tty', os.O_WRONLY)
-        if fd < 0:
-            raise Exception('Could not open controlling tty, /dev/tty')
-        else:
-            os.close(fd)
-
-    def read(self, fd, amnt_bytes: int):
-        """ Read a specified amount of bytes from process (NON-BLOCKING) """
-        try:
-            chunk: bytes = fd.read(amnt_bytes)
-            if chunk is None:
-                return None
-            return chunk.decode('utf8', 'replace')
-        except OSError: # Nothing to read
-            return ''
+    def flush(self) -> None:
+        """ Write as much queued input as the pty takes without blocking """
+        fd: int = self.stdin.fileno()
+        while self.queue:
+            chunk: memoryview = self.queue[0]
+            try:
+                written: int = os.write(fd, chunk)
+            except BlockingIOError: # Full until the shell reads some
+                return
+            except OSError: # EIO once the shell has gone, its input with it
+                self.queue.clear()
+                self.queued = 0
+                return
+            self.queued -= written
+            if written == len(chunk):
+                self.queue.popleft()
+            else:
+                self.queue[0] = chunk[written:]
 
-    def send(self, line: str):
-        """ Write to process stdin """
-        self.stdin.write(line)
+    def set_size(self, fd, cols: int, lines: int) -> None:
+        fcntl.ioctl(fd, termios.TIOCSWINSZ, struct.pack("hhhh", lines, cols, 0, 0))
+        self.size = (cols, lines)
 
     def resize(self, cols: int, lines: int):
         """
         Resize by sending SIGWINCH to process
         """
-        fcntl.ioctl(self.stdout, termios.TIOCSWINSZ, struct.pack("hhhh", lines, cols, 0, 0))
+        self.set_size(self.stdout, cols, lines)
         self.proc.send_signal(signal.SIGWINCH)
+
+    def close(self) -> None:
+        """ Let go of the pty, which hangs up on the shell (SIGHUP), it is left to the caller to reap it """
+        self.closed = True
+        self.queue.clear()
+        self.queued = 0
+        self.stdin.close()
+        self.stdout.close()
+        self.proc.close()
+
+class ShellPool:
+    """
+    Idle shells started ahead of time, which a new terminal can adopt with its rc files already run
+    and its prompt up, rather than wait for a shell to start. Shells are started at the size last
+    asked for, one adopted at another size is resized (and so told with SIGWINCH).
+    `fill()` starts shells to replace those adopted, it is left to the caller so that it can wait
+    until the terminal which adopted one has been drawn. Shells stopped are reaped by `reap()`,
+    eg. upon SIGCHLD
+    """
+    def __init__(self, size: int, cols: int = 80, lines: int = 24) -> None:
+        self.size: int = size
+        self.cols: int = cols
+        self.lines: int = lines
+        self.idle: deque = deque()
+        self.hung_up: List[ShellProcess] = [] # Shells stopped which have yet to exit
+        self.fill()
+
+    def stop(self, term: TerminalProcess) -> None:
+        term.close()
+        self.hung_up.append(term.proc)
+
+    def reap(self) -> None:
+        """ Reap the shells stopped which have exited since """
+        self.hung_up = [proc for proc in self.hung_up if proc.poll() is None]
+
+    def fill(self) -> None:
+        """ Start shells until there are `size` idle ones, and stop any beyond that """
+        self.reap()
+        while len(self.idle) > self.size:
+            self.stop(self.idle.pop())
+        while len(self.idle) < self.size:
+            self.idle.append(TerminalProcess(decode=False, size=(self.cols, self.lines)))
+
+    def take(self, cols: int, lines: int) -> TerminalProcess:
+        """ An idle shell sized `cols` x `lines`, or a new one if there are none left """
+        self.cols, self.lines = cols, lines
+        while self.idle:
+            term: TerminalProcess = self.idle.popleft()
+            if term.proc.poll() is None:
+                if term.size != (cols, lines):
+                    term.resize(cols, lines)
+                return term
+            term.close() # Exited while idle
+        return TerminalProcess(decode=False, size=(cols, lines))
+
+    def close(self) -> None:
+        self.size = 0
+        self.fill()
         
\ No newline at end of file
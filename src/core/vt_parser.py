@@ -0,0 +1,256 @@
+import re
+import codecs
+
+# Parser states, named after the DEC/VT500 state diagram at https://vt100.net/emu/dec_ansi_parser
+GROUND = 0
+ESCAPE = 1
+ESCAPE_INTERMEDIATE = 2
+CSI_ENTRY = 3
+CSI_PARAM = 4
+CSI_INTERMEDIATE = 5
+CSI_IGNORE = 6
+OSC_STRING = 7
+STRING_IGNORE = 8 # DCS, SOS, PM and APC strings, consumed until ST but not acted upon
+
+class VTParser:
+    """
+    Streaming VT escape sequence parser modelled on the DEC/VT500 state machine.
+    Input is consumed by offset, so a chunk is only ever walked once, and runs of
+    printable text are found with a single regex match and written to `CharDisplay` in bulk.
+    All state lives on the instance, so sequences split across two reads still parse correctly.
+
+    Complete sequences are matched whole by `sequence_re` right at the ESC, the state machine
+    only steps through sequences which are split across reads or malformed.
+
+    `feed()` also takes raw pty bytes (or a memoryview of them): escape sequences are then
+    parsed without decoding, and only runs of printable text are decoded, incrementally,
+    so a multibyte character split across two reads is still decoded whole.
+    """
+    printable_re = re.compile(r'[^\x00-\x1f\x7f]+')
+    printable_bytes_re = re.compile(rb'[^\x00-\x1f\x7f]+') # UTF-8 continuation bytes are all >= 0x80
+    # Characters which terminate or interrupt an OSC/DCS string
+    string_end_re = re.compile(r'[\x07\x18\x1a\x1b]')
+    string_end_bytes_re = re.compile(rb'[\x07\x18\x1a\x1b]')
+    # A whole CSI, OSC or plain escape sequence, the index of the last group matched tells which
+    sequence_pattern: str = (
+        r'\x1b(?:'
+        r'\[(?P<csi_params>[<=>?]?[0-;]*)(?P<csi_inter>[ -/]*)(?P<csi_final>[@-~])'
+        r'|\](?P<osc>[^\x07\x18\x1a\x1b]*)(?:\x07|\x1b\\)'
+        # Finals which open CSI/OSC/DCS/SOS/PM/APC only count as such without intermediates
+        r'|(?P<esc_inter>[ -/]*)(?P<esc_final>(?<=[ -/])[0-~]|[0-OQ-WYZ\\`-~]))'
+    )
+    sequence_re = re.compile(sequence_pattern)
+    sequence_bytes_re = re.compile(sequence_pattern.encode())
+
+    def __init__(self, logs, display, esc_handler) -> None:
+        self.logs = logs
+        self.display = display
+        self.esc_handler = esc_handler
+        self.state: int = GROUND
+        self.params: str = ""
+        self.intermediates: str = ""
+        self.osc: list = []
+        self.decoder = codecs.getincrementaldecoder("utf8")("replace")
+        self._partial: bool = False # Whether the decoder holds the start of a multibyte character
+
+    def idle(self) -> bool:
+        """ Whether we are between sequences and characters, so parsing could start afresh from here """
+        return self.state == GROUND and not self._partial
+
+    def reset(self) -> None:
+        """ Drop any sequence or character parsed halfway, to parse a stream from another point """
+        self.state = GROUND
+        self._clear()
+        self.osc = []
+        self.decoder.reset()
+        self._partial = False
+
+    def feed(self, data) -> None:
+        """ Parse a chunk of pty output (str or bytes), continuing from wherever the previous chunk left off """
+        if isinstance(data, str):
+            self._feed_str(data)
+        else:
+            self._feed_bytes(data)
+
+    def _feed_str(self, data: str) -> None:
+        i: int = 0
+        n: int = len(data)
+        while i < n:
+            state = self.state
+            if state == GROUND:
+                match = self.printable_re.match(data, i)
+                if match:
+                    self.display.write(match.group())
+                    i = match.end()
+                    continue
+                if data[i] == "\x1b":
+                    match = self.sequence_re.match(data, i)
+                    if match:
+                        self._sequence(match, str)
+                        i = match.end()
+                        continue
+                self._control(data[i])
+                i += 1
+                continue
+            if state == OSC_STRING or state == STRING_IGNORE:
+                # Swallow everything up to the string terminator in one go
+                match = self.string_end_re.search(data, i)
+                end: int = match.start() if match else n
+                if state == OSC_STRING:
+                    self.osc.append(data[i:end])
+                i = end
+                if match:
+                    self._string_end(data[end])
+                    i += 1
+                continue
+            self._step(data[i])
+            i += 1
+
+    def _feed_bytes(self, data) -> None:
+        """ Same walk as `_feed_str`, over bytes """
+        i: int = 0
+        n: int = len(data)
+        while i < n:
+            state = self.state
+            if state == GROUND:
+                match = self.printable_bytes_re.match(data, i)
+                if match:
+                    i = match.end()
+                    if i == n or self._partial:
+                        # Only a run cut off by the end of the chunk may continue in the next one
+                        self.display.write(self.decoder.decode(match.group(), i != n))
+                        self._partial = i == n and bool(self.decoder.getstate()[0])
+                    else:
+                        self.display.write(match.group().decode("utf8", "replace"))
+                    continue
+                if self._partial: # Truncated character, flushed as U+FFFD
+                    self.display.write(self.decoder.decode(b"", True))
+                    self._partial = False
+                if data[i] == 0x1b:
+                    match = self.sequence_bytes_re.match(data, i)
+                    if match:
+                        self._sequence(match, bytes)
+                        i = match.end()
+                        continue
+                self._control(chr(data[i]))
+                i += 1
+                continue
+            if state == OSC_STRING or state == STRING_IGNORE:
+                match = self.string_end_bytes_re.search(data, i)
+                end: int = match.start() if match else n
+                if state == OSC_STRING:
+                    self.osc.append(bytes(data[i:end]))
+                i = end
+                if match:
+                    self._string_end(chr(data[end]))
+                    i += 1
+                continue
+            self._step(chr(data[i]))
+            i += 1
+
+    def _sequence(self, match, kind: type) -> None:
+        """ Dispatch a sequence matched whole by `sequence_re` """
+        last: int = match.lastindex # 3 for CSI, 4 for OSC and 6 for plain escape sequences
+        if last == 3:
+            params, intermediates, final = match.group(1, 2, 3)
+            if kind is bytes:
+                params, intermediates, final = params.decode("ascii"), intermediates.decode("ascii"), chr(final[0])
+            self.esc_handler.handle_csi(params, intermediates, final)
+        elif last == 4:
+            data = match.group(4)
+            self.esc_handler.handle_osc(data.decode("utf8", "replace") if kind is bytes else data)
+        else:
+            intermediates, final = match.group(5, 6)
+            if kind is bytes:
+                intermediates, final = intermediates.decode("ascii"), chr(final[0])
+            self.esc_handler.handle_esc(intermediates, final)
+
+    def _clear(self) -> None:
+        self.params = ""
+        self.intermediates = ""
+
+    def _control(self, c: str) -> None:
+        """ Handle a C0 control character, which may appear in any state except strings """
+        if c == "\x1b":
+            self._clear()
+            self.state = ESCAPE
+        elif c == "\x18" or c == "\x1a": # CAN and SUB abort the current sequence
+            self.state = GROUND
+        else:
+            self.execute(c)
+
+    def execute(self, c: str) -> None:
+        """ Perform the action of a C0 control character """
+        if c == "\n" or c == "\x0b" or c == "\x0c":
+            self.display.newline()
+        elif c == "\r":
+            self.display.carriage_return()
+        elif c == "\b":
+            self.display.backspace()
+        elif c == "\t":
+            self.display.tab()
+        # BEL, NUL and the rest are ignored
+
+    def _string_end(self, c: str) -> None:
+        """ Called upon the character terminating an OSC/DCS string """
+        if self.state == OSC_STRING:
+            osc: str = "".join(self.osc) if not self.osc or isinstance(self.osc[0], str) else b"".join(self.osc).decode("utf8", "replace")
+            self.esc_handler.handle_osc(osc)
+            self.osc = []
+        self.state = GROUND
+        if c == "\x1b": # Start of ST (ESC \), the backslash is dropped by the escape state
+            self._clear()
+            self.state = ESCAPE
+
+    def _step(self, c: str) -> None:
+        """ Advance the state machine by a single character within an escape sequence """
+        code: int = ord(c)
+        if code < 0x20:
+            self._control(c)
+            return
+        state = self.state
+        if state == ESCAPE:
+            if c == "[":
+                self.state = CSI_ENTRY
+            elif c == "]":
+                self.osc = []
+                self.state = OSC_STRING
+            elif c in "PX^_": # DCS, SOS, PM, APC
+                self.state = STRING_IGNORE
+            elif code <= 0x2f:
+                self.intermediates += c
+                self.state = ESCAPE_INTERMEDIATE
+            elif code <= 0x7e:
+                self.esc_handler.handle_esc(self.intermediates, c)
+                self.state = GROUND
+        elif state == ESCAPE_INTERMEDIATE:
+            if code <= 0x2f:
+                self.intermediates += c
+            elif code <= 0x7e:
+                self.esc_handler.handle_esc(self.intermediates, c)
+                self.state = GROUND
+        elif state == CSI_ENTRY or state == CSI_PARAM:
+            if 0x30 <= code <= 0x3f:
+                # Private markers (<=>?) are only legal as the first parameter character
+                if code >= 0x3c and state == CSI_PARAM:
+                    self.state = CSI_IGNORE
+                    return
+                self.params += c
+                self.state = CSI_PARAM
+            elif code <= 0x2f:
+                self.intermediates += c
+                self.state = CSI_INTERMEDIATE
+            elif code <= 0x7e:
+                self.esc_handler.handle_csi(self.params, self.intermediates, c)
+                self.state = GROUND
+        elif state == CSI_INTERMEDIATE:
+            if code <= 0x2f:
+                self.intermediates += c
+            elif code <= 0x3f:
+                self.state = CSI_IGNORE
+            elif code <= 0x7e:
+                self.esc_handler.handle_csi(self.params, self.intermediates, c)
+                self.state = GROUND
+        elif state == CSI_IGNORE:
+            if 0x40 <= code <= 0x7e:
+                self.state = GROUND
@@ -3,24 +3,60 @@ Main entry point of project
 """
 import os
 import curses
+import argparse
 from core.logs import Logger
+from core.session_protocol import default_socket_path
 from ui.master_window import MasterWindow
+from ui.session_server import SessionServer
+from ui.session_client import SessionConnection
 
 
 class Application:
     """ The main application class where all the important components will live as members """
-    def __init__(self, logs):
+    def __init__(self, logs, session: SessionConnection = None):
         self.logs = logs
-        logs.info("Application initialised")        
+        self.session: SessionConnection = session
+        logs.info("Application initialised")
 
     def run(self, stdscr):
         """ Main application loop """
         curses.use_default_colors()
         stdscr.nodelay(True)
-        self.win = MasterWindow(logs, stdscr)
+        self.win = MasterWindow(logs, stdscr, session=self.session)
         self.win.run()
-        
+
+def serve(logs, path: str) -> None:
+    """ Run headless, hosting a first pane the size of the terminal we were started from """
+    try:
+        cols, lines = os.get_terminal_size()
+    except OSError:
+        cols, lines = 80, 24
+    server: SessionServer = SessionServer(logs, path)
+    server.new_pane(cols-2, lines-3) # Room for the border and command line of the client
+    print(f"Serving on {path}")
+    server.run()
+
 if __name__ == '__main__':
-    logs = Logger(os.path.dirname(__file__) + "/../logs/runtime.log")
-    app = Application(logs)
-    curses.wrapper(app.run)
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--server", nargs="?", const=default_socket_path, metavar="PATH",
+                        help="host the shells headless, for clients to attach to over a Unix socket")
+    parser.add_argument("--attach", nargs="?", const=default_socket_path, metavar="PATH",
+                        help="attach to the session server listening on PATH, quitting only detaches")
+    args = parser.parse_args()
+    log_dir: str = os.path.dirname(__file__) + "/../logs"
+    if args.server:
+        logs = Logger(log_dir + "/server.log")
+        try:
+            serve(logs, args.server)
+        finally:
+            logs.close()
+    else:
+        logs = Logger(log_dir + "/runtime.log")
+        session: SessionConnection = SessionConnection(logs, args.attach) if args.attach else None
+        app = Application(logs, session)
+        try:
+            curses.wrapper(app.run)
+        finally:
+            if session:
+                session.close()
+            logs.close()
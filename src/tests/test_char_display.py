@@ -0,0 +1,56 @@
+"""
+Reflowing on resize, checked against rewrapping every logical line from scratch.
+Run from the src directory: `python -m unittest discover tests`
+"""
+import random
+import unittest
+from core.char_display import CharDisplay
+from core.scrollback import Scrollback
+from bench.bench_logs import NullLogger
+
+def rewrapped(lines, width):
+    """ Rows of `lines` wrapped to `width`, trailing blanks trimmed, and the empty row the cursor is left on """
+    rows = []
+    for line in lines:
+        rows += [line[k*width:(k+1)*width].rstrip() for k in range(max(1, -(-len(line) // width)))]
+    return rows + [""]
+
+def shown(disp):
+    """ Every row of history, oldest first, then the screen down to the cursor """
+    history = disp.history
+    back = history.view_len(10**9)
+    return [history.view_line(b)[0].rstrip() for b in reversed(range(back))] + \
+           [disp.row_text(y).rstrip() for y in range(disp.curs.y+1)]
+
+class ReflowTest(unittest.TestCase):
+    def display(self, size, lines):
+        disp = CharDisplay(NullLogger(), size, Scrollback(1000))
+        for line in lines:
+            disp.write(line)
+            disp.carriage_return()
+            disp.newline()
+        return disp
+
+    def test_line_across_history(self):
+        """ A line wrapped partly into history is rejoined with its rows still on screen """
+        lines = ["first", "adab cdaabeddZ", "last"]
+        disp = self.display((5, 3), lines)
+        self.assertEqual(disp.row_text(0).rstrip(), "eddZ")
+        disp.resize(12, 3)
+        self.assertEqual(shown(disp), rewrapped(lines, 12))
+        disp.resize(4, 5)
+        self.assertEqual(shown(disp), rewrapped(lines, 4))
+
+    def test_random_resizes(self):
+        rnd = random.Random(0)
+        for _ in range(300):
+            lines = ["".join(rnd.choice("abcde ") for _ in range(rnd.randint(0, 60))).strip() + "Z"
+                     for _ in range(rnd.randint(1, 20))]
+            disp = self.display((rnd.randint(4, 30), rnd.randint(3, 10)), lines)
+            for _ in range(3):
+                width: int = rnd.randint(4, 50)
+                disp.resize(width, rnd.randint(3, 10))
+                self.assertEqual(shown(disp), rewrapped(lines, width))
+
+if __name__ == "__main__":
+    unittest.main()
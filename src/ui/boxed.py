@@ -11,7 +11,7 @@ class Boxed:
 
     def box(self):
         self._real_win.box()
-        self._real_win.refresh()
+        self._real_win.noutrefresh()
 
     def win(self):
         return self._win
@@ -0,0 +1,97 @@
+import curses
+from collections import OrderedDict
+from typing import Dict, Tuple
+from core.style import StyleTable, Style, BOLD, DIM, ITALIC, UNDERLINE, BLINK, REVERSE, INVISIBLE, DEFAULT, RGB, rgb_to_palette
+
+# curses attributes of style flags, strikethrough has none
+flag_attrs: Tuple[Tuple[int, int], ...] = (
+    (BOLD, curses.A_BOLD),
+    (DIM, curses.A_DIM),
+    (ITALIC, getattr(curses, "A_ITALIC", 0)),
+    (UNDERLINE, curses.A_UNDERLINE),
+    (BLINK, curses.A_BLINK),
+    (REVERSE, curses.A_REVERSE),
+    (INVISIBLE, curses.A_INVIS),
+)
+
+class ColorPairs:
+    """
+    Maps style ids of a `StyleTable` to curses attributes, shared by all terminals.
+    curses only has a few hundred colour pairs (attributes have 8 bits for them), so pairs
+    are only initialised for (foreground, background) combinations as they get drawn,
+    and the least recently drawn pair is reused once they run out.
+    Redefining a pair recolours whatever is already on screen with it, so `evicted`
+    is set to let the caller repaint everything, which marks visible pairs as recently used.
+    """
+    def __init__(self, logs, styles: StyleTable) -> None:
+        self.logs = logs
+        self.styles: StyleTable = styles
+        self.enabled: bool = curses.has_colors()
+        self.colors: int = curses.COLORS if self.enabled else 0
+        # Pair 0 is the terminal's default colours and cannot be redefined
+        self.max_pairs: int = min(curses.COLOR_PAIRS, 256) - 1 if self.enabled else 0
+        self.pairs: OrderedDict = OrderedDict() # (fg, bg) -> pair number, least recently used first
+        self.free: list[int] = [] # Pair numbers given back after failing to initialise
+        self.next_pair: int = 1
+        self.attrs: Dict[int, Tuple[int, Tuple[int, int]]] = {} # style id -> (flag attributes, colours)
+        self.evicted: bool = False
+
+    def attr(self, style_id: int) -> int:
+        """ curses attribute to draw cells of style `style_id` with """
+        cached = self.attrs.get(style_id)
+        if cached is None:
+            cached = self.attrs[style_id] = self._resolve(self.styles.styles[style_id])
+        flags, colors = cached
+        if colors == (DEFAULT, DEFAULT) or not self.max_pairs:
+            return flags
+        return flags | curses.color_pair(self._pair(colors))
+
+    def _resolve(self, style: Style) -> Tuple[int, Tuple[int, int]]:
+        flags, fg, bg = style
+        attr: int = 0
+        for flag, flag_attr in flag_attrs:
+            if flags & flag:
+                attr |= flag_attr
+        fg, bg = self._color(fg), self._color(bg)
+        if self.colors < 16 and 8 <= style[1] < 16:
+            attr |= curses.A_BOLD # Bright foregrounds are shown bold on 8 colour terminals
+        return (attr, (fg, bg))
+
+    def _color(self, color: int) -> int:
+        """ Closest colour the terminal we are running in can show """
+        if color == DEFAULT:
+            return DEFAULT
+        if color >= RGB:
+            color = rgb_to_palette(color)
+        if color < self.colors:
+            return color
+        if color < 16:
+            return color % 8
+        if color >= 232: # Grey ramp
+            return 7 if color >= 244 else 0
+        # Colour cube, pick the closest basic colour by thresholding each component
+        r, g, b = (color-16) // 36, (color-16) // 6 % 6, (color-16) % 6
+        return (1 if r >= 3 else 0) | (2 if g >= 3 else 0) | (4 if b >= 3 else 0)
+
+    def _pair(self, colors: Tuple[int, int]) -> int:
+        pair = self.pairs.get(colors)
+        if pair is not None:
+            self.pairs.move_to_end(colors)
+            return pair
+        if self.free:
+            pair = self.free.pop()
+        elif self.next_pair <= self.max_pairs:
+            pair = self.next_pair
+            self.next_pair += 1
+        else:
+            pair = self.pairs.popitem(last=False)[1]
+            self.evicted = True
+            self.logs.debug("Reusing colour pair %d for %s", pair, colors)
+        try:
+            curses.init_pair(pair, *colors)
+        except curses.error as e:
+            self.logs.debug("Failed to initialise colour pair %s: %s", colors, e)
+            self.free.append(pair)
+            return 0
+        self.pairs[colors] = pair
+        return pair
@@ -13,6 +13,13 @@ class CommandLine(curses.textpad.Textbox):
         super().__init__(win.derwin(0, len(self.prompt)))
         self.command_set: DefaultCommandSet = DefaultCommandSet()
 
+    def place(self, win) -> None:
+        """ Move into `win`, eg. once the terminal we run in has been resized """
+        self._real_win = win
+        self.win = win.derwin(0, len(self.prompt))
+        self.win.keypad(1)
+        self._update_max_yx()
+
     def clear(self) -> None:
         """ Clear editable area """
         self.win.erase()
@@ -27,8 +34,13 @@ class CommandLine(curses.textpad.Textbox):
         self.clear()
         output: Union[str, None] = self.command_set.process(contents)
         if output:
-            self.win.addstr(output)
-            self.win.refresh()
+            self.show(output)
+
+    def show(self, message: str) -> None:
+        """ Show `message` where command output goes, until the next command """
+        self.clear()
+        self.win.addnstr(message, self.win.getmaxyx()[1] - 1)
+        self.win.refresh()
 
     def inject(self, command_set: DefaultCommandSet) -> None:
         """ Dependency injection of different command sets for flexibility and maintainability """
@@ -0,0 +1,124 @@
+from typing import Callable, Dict, List, Tuple, Union
+
+Geometry = Tuple[int, int, int, int] # (y, x, lines, cols) of a pane's window, its border included
+
+class Split:
+    """
+    Node of a `Layout`: either a pane (a leaf, `term` set), or two nodes sharing its area
+    one above the other if `down`, side by side otherwise
+    """
+    def __init__(self, parent: Union["Split", None], geometry: Geometry, minimum: Tuple[int, int], term=None) -> None:
+        self.parent: Union[Split, None] = parent
+        self.geometry: Geometry = geometry
+        self.minimum: Tuple[int, int] = minimum # Smallest (lines, cols) the panes within fit in, kept by `Layout`
+        self.term = term
+        self.children: List[Split] = []
+        self.down: bool = False
+        self.ratio: float = 0.5 # Share of the area (along the split) given to the first child
+
+    def first_leaf(self, last: bool = False) -> "Split":
+        """ Top-left pane within this node, or the bottom-right one if `last` """
+        node: Split = self
+        while node.children:
+            node = node.children[-1 if last else 0]
+        return node
+
+class Layout:
+    """
+    Binary tree of pane geometry. A split divides a pane's area in two along one axis,
+    and keeps dividing it at the same ratio as the area changes. Closing a pane gives its
+    area to its sibling. Geometry is recomputed top-down, skipping any node whose area is
+    unchanged, and `place` is only called for panes whose geometry actually changed, with
+    their new geometry, so panes left as they were are neither resized nor repainted.
+    Each node keeps the minimum size of its subtree, updated along the path to the root
+    when a pane is split or closed, so laying out does not walk the tree again at each node.
+    """
+    min_size: int = 3 # Rows or columns a pane needs: its border and a cell
+
+    def __init__(self, geometry: Geometry, term, place: Callable[[object, Geometry], None]) -> None:
+        self.root: Union[Split, None] = Split(None, geometry, (self.min_size, self.min_size), term)
+        self.nodes: Dict[object, Split] = {term: self.root} # Pane -> its leaf
+        self.place: Callable[[object, Geometry], None] = place
+
+    def _update_minimum(self, node: Union[Split, None]) -> None:
+        """ Recompute the minimum size of `node` from its children, and of its ancestors while it changes """
+        while node is not None:
+            (first_lines, first_cols), (second_lines, second_cols) = (child.minimum for child in node.children)
+            if node.down:
+                minimum: Tuple[int, int] = (first_lines + second_lines, max(first_cols, second_cols))
+            else:
+                minimum = (max(first_lines, second_lines), first_cols + second_cols)
+            if minimum == node.minimum:
+                return # Nor will any ancestor's
+            node.minimum = minimum
+            node = node.parent
+
+    def _divide(self, node: Split, geometry: Geometry) -> Tuple[Geometry, Geometry]:
+        """ Areas of the two children of `node` when it has `geometry` """
+        y, x, lines, cols = geometry
+        axis: int = 0 if node.down else 1
+        total: int = lines if node.down else cols
+        first_min: int = node.children[0].minimum[axis]
+        second_min: int = node.children[1].minimum[axis]
+        size: int = max(first_min, min(total - second_min, int(total * node.ratio)))
+        if node.down:
+            return (y, x, size, cols), (y+size, x, lines-size, cols)
+        return (y, x, lines, size), (y, x+size, lines, cols-size)
+
+    def _layout(self, node: Split, geometry: Geometry) -> None:
+        if geometry == node.geometry:
+            return # Nothing within has moved
+        node.geometry = geometry
+        if node.term is not None:
+            self.place(node.term, geometry)
+            return
+        for child, child_geometry in zip(node.children, self._divide(node, geometry)):
+            self._layout(child, child_geometry)
+
+    def split(self, term, down: bool, make_term: Callable[[Geometry], object]):
+        """
+        Split the pane of `term` in two, `term` keeping the top (or left) half. The other half goes to
+        the pane `make_term` creates given its geometry, which is returned. None if there is no room
+        """
+        leaf: Split = self.nodes[term]
+        lines, cols = leaf.geometry[2:]
+        if (lines if down else cols) < 2*self.min_size:
+            return None
+        first: Split = Split(leaf, leaf.geometry, leaf.minimum, term)
+        second: Split = Split(leaf, leaf.geometry, leaf.minimum)
+        leaf.term, leaf.down, leaf.children = None, down, [first, second]
+        self.nodes[term] = first
+        self._update_minimum(leaf)
+        first_geometry, second_geometry = self._divide(leaf, leaf.geometry)
+        self._layout(first, first_geometry)
+        second.geometry = second_geometry
+        second.term = make_term(second_geometry)
+        self.nodes[second.term] = second
+        return second.term
+
+    def remove(self, term):
+        """ Close the pane of `term`, its sibling taking over its area. Returns the pane next to where it was, if any """
+        leaf: Split = self.nodes.pop(term)
+        parent: Union[Split, None] = leaf.parent
+        if parent is None:
+            self.root = None
+            return None
+        first: bool = parent.children[0] is leaf
+        sibling: Split = parent.children[1 if first else 0]
+        sibling.parent = parent.parent
+        if parent.parent is None:
+            self.root = sibling
+        else:
+            siblings: List[Split] = parent.parent.children
+            siblings[siblings.index(parent)] = sibling
+            self._update_minimum(sibling.parent)
+        self._layout(sibling, parent.geometry)
+        return sibling.first_leaf(last=not first).term
+
+    def resize(self, geometry: Geometry) -> bool:
+        """ Lay every pane out again within `geometry`, returns False (changing nothing) if they do not fit """
+        lines, cols = self.root.minimum
+        if geometry[2] < lines or geometry[3] < cols:
+            return False
+        self._layout(self.root, geometry)
+        return True
@@ -1,25 +1,69 @@
 import curses
 import curses.ascii
-from typing import Union
+import os
+import signal
+import time
+import itertools
+from typing import Callable, List, Union, Tuple
 from .term_window import TerminalWindow
+from .process_window import ProcessTerminalWindow
+from .session_client import SessionConnection, SessionTerminalWindow
+from .replay_window import ReplayTerminalWindow
+from .layout import Layout, Geometry
 from .command_line import CommandLine
 from core.commands import BasicCommandSet
 from core.keyboard import KeyboardHandler
+from core.event_loop import EventLoop
+from core.scrollback import Scrollback, ScrollbackBudget, SegmentStore, default_spill_dir
+from core.recording import Recording
+from core.termproc import ShellPool
+from core.style import StyleTable
+from .colors import ColorPairs
 
 class MasterWindow:
     """
     Root window manager which houses and manages all ui components
     """    
-    def __init__(self, logs, stdscr) -> None:
+    echo_window: float = 0.1 # Seconds after a keystroke during which output of the active terminal is painted immediately
+    # Keys bound to multiplexer actions, which are not forwarded to terminals
+    bound_keys = (b"\x00", b"\x1b", b"\x1c", b"\x1d", b"\x1b[5;2~", b"\x1b[6;2~")
+
+    def __init__(self, logs, stdscr, max_fps: int = 60, scrollback_lines: int = 10000,
+                 scrollback_bytes: int = 64*1024*1024, spill_dir: Union[str, None] = default_spill_dir,
+                 pane_processes: bool = False, session: Union[SessionConnection, None] = None, shell_pool: int = 0) -> None:
         self.logs = logs
         self.stdscr = stdscr
         self.running: bool = False
+        self.max_fps: int = max_fps
+        self.last_frame: float = 0.0
+        self.echo_deadline: float = 0.0
+        self.scrollback_lines: int = scrollback_lines
+        self.scrollback_budget: ScrollbackBudget = ScrollbackBudget(scrollback_bytes)
+        # Whether new panes host their shell and parser in a worker process rather than a thread
+        self.pane_processes: bool = pane_processes
+        # Session server hosting the panes when attached to one, they are then only mirrored here
+        self.session: Union[SessionConnection, None] = session
+        # Directory which history evicted from memory is spilled to, None to discard it instead
+        self.spill_dir: Union[str, None] = spill_dir
+        self._spill_ids = itertools.count()
+        if spill_dir:
+            SegmentStore.cleanup_stale(spill_dir)
         self.size_y: int
         self.size_x: int
         self.size_y, self.size_x = stdscr.getmaxyx()
-        self.term_wins: list[TerminalWindow] = [TerminalWindow(logs, stdscr.derwin(self.size_y-1, self.size_x, 1, 0), self.on_term_destroy, active=True)]
+        self.shell_pool: Union[ShellPool, None] = None # Idle shells started ahead for new panes to adopt, if any
+        self.event_loop: EventLoop = EventLoop(logs)
+        self.frames_pending: set[TerminalWindow] = set() # Terminals whose reader has a frame queued for the loop
+        # Styles are shared by every terminal
+        self.colors: ColorPairs = ColorPairs(logs, session.styles if session else StyleTable())
+        # Panes are laid out below the command line, `term_wins` keeps the order they are cycled through in
+        geometry: Geometry = (1, 0, self.size_y-1, self.size_x)
+        self.term_wins: list[TerminalWindow] = [self.new_term(self.window(geometry))]
+        self.layout: Layout = Layout(geometry, self.term_wins[0], self.place_term)
         self.setup_commands()
         self.current_active_term: TerminalWindow = self.term_wins[0]
+        self.set_shell_pool(shell_pool)
+        self.watch_term(self.current_active_term)
         self.kbh: KeyboardHandler = KeyboardHandler(stdscr)
 
     def setup_commands(self) -> None:
@@ -29,55 +73,135 @@ class MasterWindow:
         self.command_line: CommandLine = CommandLine(self.logs, self.stdscr.derwin(1, self.size_x, 0, 0))
         self.command_line.inject(BasicCommandSet(self))
 
+    def new_term(self, win) -> TerminalWindow:
+        """ Create an active TerminalWindow in `win`, with its own scrollback unless its shell runs in a worker process """
+        if self.session:
+            # Panes the server already hosts are shown before new ones are started
+            pane_id: Union[int, None] = self.session.unclaimed.pop(0) if self.session.unclaimed else None
+            return SessionTerminalWindow(self.session, pane_id, self.logs, win, self.on_term_destroy, self.colors, active=True)
+        if self.pane_processes:
+            return ProcessTerminalWindow(self.logs, win, self.on_term_destroy, self.colors, active=True)
+        spill: Union[SegmentStore, None] = None
+        if self.spill_dir:
+            spill = SegmentStore(os.path.join(self.spill_dir, f"{os.getpid()}-{next(self._spill_ids)}"))
+        history: Scrollback = Scrollback(self.scrollback_lines, self.scrollback_budget, spill)
+        return TerminalWindow(self.logs, win, self.on_term_destroy, self.colors, active=True, history=history, shells=self.shell_pool)
+
+    def window(self, geometry: Geometry):
+        y, x, lines, cols = geometry
+        return self.stdscr.derwin(lines, cols, y, x)
+
+    def place_term(self, term: TerminalWindow, geometry: Geometry) -> None:
+        """ Called by `layout` for each terminal whose geometry changed """
+        term.place(self.window(geometry))
+
+    def watch_term(self, term: TerminalWindow) -> None:
+        """
+        Start `term` parsing its output on its own thread, the event loop hears about new frames,
+        and about its shell exiting through its `exit_fd` if it has one (SIGCHLD otherwise)
+        """
+        term.start_reader(self.on_term_frame)
+        fd: Union[int, None] = term.exit_fd()
+        if fd is not None:
+            self.event_loop.add_reader(fd, lambda fd: self.on_term_exit(term))
+
+    def on_term_frame(self, term: TerminalWindow) -> None:
+        """
+        Called from a terminal's reader thread once it has parsed some output. Frames are
+        handed over to the event loop, at most one per terminal waiting there at a time.
+        """
+        if term not in self.frames_pending:
+            self.frames_pending.add(term)
+            self.event_loop.call_soon_threadsafe(lambda: self.on_term_output(term))
+
+    def on_term_output(self, term: TerminalWindow) -> None:
+        """
+        Called from the event loop when a terminal has a new frame. Painting is left to
+        the frame scheduler, unless it is likely the echo of a keystroke.
+        """
+        self.frames_pending.discard(term)
+        # A pty hanging up is the one frame which may come with an exit
+        if term not in self.term_wins or (term.term.closed and term.check_exit()):
+            return
+        refused: Union[Tuple[int, int], None] = term.take_refused()
+        if refused:
+            self.show_dropped(*refused)
+        if term is self.current_active_term and time.monotonic() <= self.echo_deadline:
+            self.echo_deadline = 0.0
+            self.render()
+
     def on_term_destroy(self, term: TerminalWindow) -> None:
-        self.cycle_active_term()
+        """ Close `term`, the terminal next to it takes over its space (and focus, if it had it) """
+        fd: Union[int, None] = term.exit_fd()
+        if fd is not None:
+            self.event_loop.remove_reader(fd) # Before it is closed along with the pane, and its number reused
+        if term.term.queued:
+            self.event_loop.remove_writer(term.term.stdin)
+        term.close()
+        neighbour: Union[TerminalWindow, None] = self.layout.remove(term)
         self.term_wins.remove(term)
         if len(self.term_wins) == 0:
             self.running = False
+            return
+        if term is self.current_active_term:
+            self.current_active_term = neighbour
+            neighbour.is_active = True
+        self.render(force=True)
 
-    def create_term_down(self, key: Union[bytes, None] = None) -> None:
-        """
-        Called in `vsplit` command to "split" a terminal vertically into 2. Creates a new TerminalWindow instance
-        which occupies the bottom-half of the space of the current active terminal.
-        The current active terminal is then resized to take up the top-part of the
-        space and the newly created terminal is then made active.
-        """
-        start_y: int
-        start_x: int
-        size_y: int
-        size_x: int
-        start_y, start_x = self.current_active_term.real_win().getbegyx()
-        size_y, size_x = self.current_active_term.real_win().getmaxyx()
-        new_y: int = size_y//2
-        self.current_active_term.resize(size_x, new_y)
-        self.current_active_term.is_active = False
-        self.current_active_term = TerminalWindow(self.logs, self.stdscr.derwin(size_y-new_y, size_x, start_y+new_y, start_x), self.on_term_destroy, active=True)
-        # Reinvoke draw() to readjust cursor position of new terminal
-        self.current_active_term.draw()
-        # Add terminal window to update queue
-        self.term_wins.append(self.current_active_term)
-
-    def create_term_right(self, key: Union[bytes, None] = None) -> None:
-        """
-        Called in `hsplit` command to "split" a terminal horizontally into 2. Creates a new TerminalWindow instance
-        which occupies the right-half of the space of the current active terminal.
-        The current active terminal is then resized to take up the left-half of the
-        space and the newly created terminal is then made active.
-        """
-        start_y: int
-        start_x: int
-        size_y: int
-        size_x: int
-        start_y, start_x = self.current_active_term.real_win().getbegyx()
-        size_y, size_x = self.current_active_term.real_win().getmaxyx()
-        new_x: int = size_x//2
-        self.current_active_term.resize(new_x, size_y)
+    def split_active_term(self, down: bool, make_term: Callable = None) -> Union[TerminalWindow, None]:
+        """
+        Split the current active terminal into 2, one above the other if `down`, side by side otherwise.
+        It keeps the top (or left) half, a new TerminalWindow (created with `make_term` if given, `new_term`
+        otherwise) takes the other half and is made active. Returns it, or None if there is no room to split
+        """
+        make_term = make_term or self.new_term
+        term: Union[TerminalWindow, None] = self.layout.split(self.current_active_term, down,
+                                                              lambda geometry: make_term(self.window(geometry)))
+        if term is None:
+            return None
         self.current_active_term.is_active = False
-        self.current_active_term = TerminalWindow(self.logs, self.stdscr.derwin(size_y, size_x-new_x, start_y, start_x+new_x), self.on_term_destroy, active=True)
-        # Reinvoke draw() to readjust cursor position of new terminal
-        self.current_active_term.draw()
+        self.current_active_term = term
         # Add terminal window to update queue
-        self.term_wins.append(self.current_active_term)
+        self.term_wins.append(term)
+        self.watch_term(term)
+        self.render()
+        if self.shell_pool:
+            self.shell_pool.fill() # Replace the shell adopted, now that the new terminal is up
+        return term
+
+    def create_term_down(self, key: Union[bytes, None] = None, make_term: Callable = None) -> Union[TerminalWindow, None]:
+        """ Called in `vsplit` command to "split" a terminal vertically into 2, see `split_active_term` """
+        return self.split_active_term(True, make_term)
+
+    def create_term_right(self, key: Union[bytes, None] = None) -> Union[TerminalWindow, None]:
+        """ Called in `hsplit` command to "split" a terminal horizontally into 2, see `split_active_term` """
+        return self.split_active_term(False)
+
+    def open_replay(self, path: str, speed: float) -> Recording:
+        """ Split off a pane replaying the recording at `path`, raises OSError or ValueError if it cannot be read """
+        recording: Recording = Recording(path)
+        history: Scrollback = Scrollback(self.scrollback_lines, self.scrollback_budget)
+        term: Union[TerminalWindow, None] = self.create_term_down(make_term=lambda win: ReplayTerminalWindow(
+            recording, speed, self.logs, win, self.on_term_destroy, self.colors, active=True, history=history))
+        if term is None:
+            recording.close()
+            history.close()
+            raise ValueError("the active terminal is too small to split")
+        return recording
+
+    def set_shell_pool(self, size: int) -> None:
+        """ Keep `size` idle shells started ahead for new panes to adopt, none if 0 """
+        if self.session:
+            return # Shells are started by the server
+        if self.shell_pool is None:
+            if not size:
+                return
+            # Started at the size splitting the active terminal in two would give them
+            cols, lines = self.current_active_term.char_disp.size
+            self.shell_pool = ShellPool(size, cols//2, lines)
+            return
+        self.shell_pool.size = size
+        self.shell_pool.fill()
 
     def cycle_active_term(self, key: Union[bytes, int, None] = None) -> None:
         """
@@ -95,47 +219,219 @@ class MasterWindow:
             idx_active += 1
         self.current_active_term = self.term_wins[idx_active]
         self.current_active_term.is_active = True
-        self.current_active_term.draw()
-        self.current_active_term.draw()
+        # Cursor has to move over to the new active terminal even if nothing was damaged
+        self.render(force=True)
 
     def init_kb(self) -> None:
         """
         Setup listeners and callbacks to different keystrokes
         """
         self.kbh.on("*", self.on_key) # Will fire upon any keystroke
+        self.kbh.on_paste(self.on_paste)
         self.kbh.on("\x00", self.create_term_right) # Ctrl-2
         self.kbh.on("\x1b", self.create_term_down) # Ctrl-3
         self.kbh.on("\x1c", self.cycle_active_term) # Ctrl-4
         self.kbh.on("\x1d", self.focus_command_line) # Ctrl-5
+        self.kbh.on(["\x1b[5;2~"], self.scroll_page_up) # Shift-PageUp
+        self.kbh.on(["\x1b[6;2~"], self.scroll_page_down) # Shift-PageDown
+
+    def scroll_active_term(self, lines: int) -> None:
+        """ Scroll the view of the active terminal `lines` back into its history, or forwards if negative """
+        with self.current_active_term.lock:
+            self.current_active_term.char_disp.scroll_view(lines)
+        self.render()
+
+    def scroll_page_up(self, key: bytes) -> None:
+        self.scroll_active_term(self.current_active_term.char_disp.size[1] // 2)
+
+    def scroll_page_down(self, key: bytes) -> None:
+        self.scroll_active_term(-(self.current_active_term.char_disp.size[1] // 2))
 
     def focus_command_line(self, key: bytes) -> None:
         """
         Allow user to type into command line and execute commands.
-        NOTE: This WILL block the main thread and pause updating
-        of terminals. 
+        NOTE: This blocks the main thread, terminals keep reading and
+        parsing their output meanwhile but are only painted once done.
         """
         self.command_line.interact()
-        self.current_active_term.draw()
+        self.render(force=True)
         
     def on_key(self, key: bytes) -> None:
         """
         Called upon any keystroke. Essentially forwards keys from 
         stdin of main thread to pty of current active terminal
         """
-        self.logs.info(f"Key Pressed: \"{key}\"")
-        if key in (b"\x00", b"\x1b", b"\x1c", b"\x1d"):
+        self.logs.debug("Key Pressed: \"%s\"", key)
+        if key in self.bound_keys:
             return
-        self.current_active_term.term.send(key)
-        self.current_active_term.update()
+        self.send_input(self.current_active_term, key)
+        self.echo_deadline = time.monotonic() + self.echo_window
+
+    def on_paste(self, data: bytes) -> None:
+        """ Called with the whole of a paste, which goes to the active terminal in one write rather than key by key """
+        self.logs.debug("Pasted %d bytes", len(data))
+        self.send_input(self.current_active_term, data, paste=True)
+
+    def send_input(self, term: TerminalWindow, data: bytes, paste: bool = False) -> None:
+        """
+        Type (or paste) `data` into `term`, which jumps back to live output. Whatever its pty does not
+        take straight away is written from the event loop once it can, see `TerminalProcess.send`
+        """
+        with term.lock:
+            term.char_disp.scroll_view(-term.char_disp.view_offset)
+        if not (term.paste(data) if paste else term.term.send(data)):
+            self.show_dropped(len(data), term.term.queued)
+        if term.term.queued:
+            self.event_loop.add_writer(term.term.stdin, lambda fd: self.flush_input(term))
+
+    def show_dropped(self, nbytes: int, queued: int) -> None:
+        self.command_line.show(f"Dropped {nbytes} bytes of input, the terminal has {queued} yet to read")
+
+    def flush_input(self, term: TerminalWindow) -> None:
+        """ Called while `term` has input queued, once its pty can take more """
+        term.term.flush()
+        if not term.term.queued:
+            self.event_loop.remove_writer(term.term.stdin)
         
+    def render(self, force: bool = False) -> None:
+        """
+        Paint damaged regions of all terminals onto the screen with a single `curses.doupdate()`.
+        The active terminal is always staged last so that the hardware cursor ends up inside it.
+        """
+        if not self.term_wins:
+            return
+        if not force and not any(term.needs_draw() for term in self.term_wins):
+            return
+        # Reader threads are kept out of a terminal's display while it is drawn
+        for term in self.term_wins:
+            if term is not self.current_active_term and term.needs_draw():
+                with term.lock:
+                    term.draw()
+        with self.current_active_term.lock:
+            self.current_active_term.draw()
+        # Programs such as vim and htop hide the cursor while they redraw (`ESC [ ? 25 l`)
+        curses.curs_set(2 if self.current_active_term.cursor_visible() else 0)
+        curses.doupdate()
+        self.last_frame = time.monotonic()
+        if self.colors.evicted:
+            # A colour pair still on screen may have been redefined, repaint to mark visible pairs as in use
+            self.colors.evicted = False
+            for term in self.term_wins:
+                with term.lock:
+                    term.char_disp.damage_all()
+
+    def frame_timeout(self) -> Union[float, None]:
+        """
+        Seconds until the next frame is due, capped by `max_fps`.
+        None if there is nothing to paint, so the event loop may sleep indefinitely.
+        """
+        if not any(term.needs_draw() for term in self.term_wins):
+            return None
+        return max(0.0, self.last_frame + 1/self.max_fps - time.monotonic())
+
+    def start_search(self, pattern: Union[str, None]) -> None:
+        """ Search the active terminal's screen and history for `pattern`, or stop searching if None """
+        term: TerminalWindow = self.current_active_term
+        with term.lock:
+            if term.search:
+                term.search.close()
+            term.search = term.new_search(pattern) if pattern else None
+            term.char_disp.damage_all()
+            if term.search:
+                self.select_match(0)
+
+    def select_match(self, direction: int) -> Union[Tuple[int, int], None]:
+        """
+        Select the search match `direction` matches newer (or older if negative)
+        than the current one in the active terminal, scrolling it into view.
+        """
+        term: TerminalWindow = self.current_active_term
+        if not term.search:
+            return None
+        with term.lock:
+            match: Union[Tuple[int, int], None] = term.search.select(direction)
+            if match:
+                disp = term.char_disp
+                first: int = disp.line_number(0)
+                if not first <= match[0] < first + disp.size[1]:
+                    # Scroll so that the match sits in the middle of the view
+                    disp.scroll_view(first + disp.size[1]//2 - match[0])
+                disp.damage_all()
+        return match
+
+    def pending_searches(self) -> List[TerminalWindow]:
+        return [term for term in self.term_wins if term.search and not term.search.done]
+
+    def step_searches(self) -> None:
+        """ Give every unfinished search a slice of time, results stream in between pty reads """
+        for term in self.pending_searches():
+            # Other panes' readers may be evicting this pane's history to stay within budget
+            with term.lock, term.char_disp.history.lock:
+                if term.search.step():
+                    if term.search.selected is None and term is self.current_active_term:
+                        self.select_match(0)
+                    term.char_disp.damage_all()
+
+    def on_term_exit(self, term: TerminalWindow) -> None:
+        """ Called once the `exit_fd` of `term` is readable, ie. its shell has exited """
+        if term in self.term_wins:
+            term.check_exit()
+
+    def on_child_exit(self) -> None:
+        """
+        Called upon SIGCHLD, lets terminals whose shell's exit is not watched for otherwise
+        destroy themselves, and reaps the shells stopped by the pool
+        """
+        for term in list(self.term_wins):
+            if term.exit_fd() is None:
+                term.check_exit()
+        if self.shell_pool:
+            self.shell_pool.reap()
+
+    def on_outer_resize(self) -> None:
+        """
+        Called upon SIGWINCH of the terminal we are running in. Panes are laid out again in one pass,
+        only those whose size changed are resized, curses repaints the rest from what it already has
+        """
+        try:
+            cols, lines = os.get_terminal_size()
+        except OSError:
+            return
+        curses.resizeterm(lines, cols)
+        self.size_y, self.size_x = self.stdscr.getmaxyx()
+        self.command_line.place(self.stdscr.derwin(1, self.size_x, 0, 0))
+        if not self.layout.resize((1, 0, self.size_y-1, self.size_x)):
+            self.logs.warning("Terminal resized to %dx%d, too small for the panes", cols, lines)
+        self.render(force=True)
+
     def run(self) -> None:
         """
-        Main event loop
+        Main event loop. Sleeps until a pty, stdin or a signal has something for us,
+        and only then dispatches to whoever it concerns. Output keeps being parsed
+        as it arrives, but is painted at most `max_fps` times per second.
         """
         self.running = True
         self.init_kb()
+        self.event_loop.add_reader(self.kbh.stdinfd, lambda fd: self.kbh.getch())
+        self.event_loop.on_signal(signal.SIGCHLD, self.on_child_exit)
+        self.event_loop.on_signal(signal.SIGWINCH, self.on_outer_resize)
         self.stdscr.erase()
+        curses.curs_set(2) # Blinking cursor, only ever shown inside the active terminal
+        while self.session and self.session.unclaimed:
+            self.create_term_down()
+        self.render(force=True)
         while self.running:
-            for term in self.term_wins:
-                term.update()
-            self.kbh.getch()
+            timeout: Union[float, None] = self.frame_timeout()
+            if timeout == 0.0:
+                self.render()
+                continue
+            if any(not term.search.remote for term in self.pending_searches()):
+                timeout = 0.0 # Only poll, so searching carries on right after
+            self.event_loop.run_once(timeout)
+            self.step_searches()
+        for term in self.term_wins:
+            term.close()
+        if self.shell_pool:
+            self.shell_pool.close()
+        self.kbh.close()
+        self.event_loop.close()
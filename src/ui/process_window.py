@@ -0,0 +1,195 @@
+import os
+import select
+import struct
+import traceback
+import multiprocessing
+from typing import Tuple, Union
+from core.logs import Logger
+from core.termproc import TerminalProcess
+from core.shared_screen import SharedScreen
+from .term_window import TerminalWindow, HeadlessTerminal
+
+refusal = struct.Struct("<QQ") # Bytes of input refused and bytes queued, sent by workers in place of a frame notification
+
+def pane_worker(conn, screen_name: str, log_path: str, log_level: int) -> None:
+    """
+    Entry point of a pane's worker process. Hosts the shell and parses its output into a
+    `HeadlessTerminal`, publishing its screen into the `SharedScreen` block `screen_name`.
+    Keys and resizes arrive over `conn`, which is sent an empty message whenever a new
+    frame is waiting, and a `refusal` whenever input is dropped. Runs until the shell lets go of its pty or the UI closes `conn`.
+    There is no scrollback, rows scrolled off the top of the screen are discarded.
+    """
+    # stdout and stderr are still the terminal the UI is drawing on
+    devnull: int = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1)
+    os.dup2(devnull, 2)
+    log_path = f"{log_path}.pane-{os.getpid()}"
+    logs = Logger(log_path, log_level)
+    screen: SharedScreen = SharedScreen(screen_name)
+    term: TerminalProcess = TerminalProcess(decode=False, size=(screen.cols, screen.lines))
+    emulator: HeadlessTerminal = HeadlessTerminal(logs, (screen.cols, screen.lines), term=term)
+    parsed: int = 0
+    try:
+        while not term.closed:
+            readable, writable, _ = select.select([term.stdout, conn], [term.stdin] if term.queued else [], [])
+            if writable:
+                term.flush()
+            changed: bool = False
+            if conn in readable:
+                try:
+                    msg: tuple = conn.recv()
+                except EOFError: # The UI has closed the pane
+                    break
+                if msg[0] == "send":
+                    if not term.send(msg[1]):
+                        logs.warning("Dropped %d bytes of input, %d are waiting to be read", len(msg[1]), term.queued)
+                        conn.send_bytes(refusal.pack(len(msg[1]), term.queued))
+                elif msg[0] == "paste":
+                    if not emulator.paste(msg[1]):
+                        logs.warning("Dropped a paste of %d bytes, %d are waiting to be read", len(msg[1]), term.queued)
+                        conn.send_bytes(refusal.pack(len(msg[1]), term.queued))
+                elif msg[0] == "resize":
+                    resized: Union[SharedScreen, None] = None
+                    try:
+                        resized = SharedScreen(msg[1])
+                    except FileNotFoundError:
+                        pass # Resized again before we got to it, the block was replaced by one whose resize is on its way
+                    if resized:
+                        screen.close()
+                        screen = resized
+                        term.resize(screen.cols, screen.lines)
+                        emulator.char_disp.resize(screen.cols, screen.lines)
+                        changed = True
+            if term.stdout in readable:
+                amnt: int = emulator.update()
+                parsed += amnt
+                changed = changed or amnt > 0
+            if changed:
+                screen.publish(emulator.char_disp, emulator.cursor_visible(), emulator.title, parsed, emulator.styles.pack)
+                if screen.set_pending():
+                    conn.send_bytes(b"")
+    except Exception as e:
+        logs.error(f"Pane worker failed\n{traceback.format_exc()}", e)
+    finally:
+        screen.close()
+        logs.close()
+        if not os.path.getsize(log_path):
+            os.remove(log_path)
+
+class PaneProcess:
+    """
+    Stand-in for `TerminalProcess` in the UI process, for a shell hosted along with
+    the parsing of its output by a worker process (see `pane_worker`).
+    The worker's screen is read from `screen`, `stdout` is what to wait on for new frames.
+    """
+    # Forking would copy our threads' locks in whatever state they happen to be
+    context = multiprocessing.get_context("spawn")
+    queued: int = 0 # Input is queued by the worker, see `TerminalProcess.send`
+
+    def __init__(self, logs, cols: int, lines: int) -> None:
+        self.logs = logs
+        self.screen: SharedScreen = SharedScreen(size=(cols, lines))
+        self.conn, worker_conn = self.context.Pipe()
+        self.proc = self.context.Process(target=pane_worker, name="pane-worker", daemon=True,
+                                         args=(worker_conn, self.screen.name, logs.filepath, logs.level))
+        self.proc.start()
+        worker_conn.close()
+        self.stdout = self.conn
+        self.closed: bool = False # Set once the worker has gone
+        self.refused: Union[Tuple[int, int], None] = None # Last input the worker dropped, see `take_refused`
+
+    def receive(self) -> int:
+        """ Drain frame notifications, returns how many there were """
+        frames: int = 0
+        try:
+            while self.conn.poll():
+                msg: bytes = self.conn.recv_bytes()
+                if msg:
+                    self.refused = refusal.unpack(msg)
+                frames += 1
+        except (EOFError, OSError):
+            self.closed = True
+        return frames
+
+    def send(self, line: bytes) -> bool:
+        """ Write to process stdin. The worker queues it, and tells us if it is dropped instead """
+        try:
+            self.conn.send(("send", line))
+        except OSError:
+            pass # Worker has gone, the pane is about to be destroyed
+        return True
+
+    def paste(self, data: bytes) -> bool:
+        """ Have the worker paste `data`, it knows whether the shell asked for bracketed paste """
+        try:
+            self.conn.send(("paste", data))
+        except OSError:
+            pass
+        return True
+
+    def resize(self, cols: int, lines: int) -> None:
+        """
+        Move the worker over to a block for the new size, the old one is destroyed straight away.
+        The worker skips a block destroyed before it got to it, the next resize is then already queued
+        """
+        old: SharedScreen = self.screen
+        self.screen = SharedScreen(size=(cols, lines))
+        try:
+            self.conn.send(("resize", self.screen.name))
+        except OSError:
+            pass
+        old.close(unlink=True)
+
+    def close(self) -> None:
+        """ Shut the worker down, closing `conn` makes it quit """
+        if self.conn.closed:
+            return
+        self.conn.close()
+        self.proc.join(1)
+        if self.proc.is_alive():
+            self.logs.warning("Pane worker %d did not quit, terminating it", self.proc.pid)
+            self.proc.terminate()
+            self.proc.join()
+        self.screen.close(unlink=True)
+
+class ProcessTerminalWindow(TerminalWindow):
+    """
+    `TerminalWindow` whose shell and parsing are hosted by a worker process, so busy
+    panes are parsed on as many cores as there are panes. `char_disp` only mirrors
+    the worker's screen, the reader thread copies rows out of the shared block as
+    frames come in. Neither process keeps scrollback: output scrolled off the top of the
+    screen is lost, and searches only cover the screen.
+    """
+    recordable: bool = False
+    def spawn(self, cols: int, lines: int) -> PaneProcess:
+        return PaneProcess(self.logs, cols, lines)
+
+    def update(self, budget: int = 0) -> int:
+        """ Copy the worker's latest frame into `char_disp`, returns how many frames were waiting """
+        frames: int = self.term.receive()
+        with self.lock: # Resizing swaps the block under the same lock
+            screen: SharedScreen = self.term.screen
+            screen.copy_into(self.char_disp, self.styles.unpack)
+            self.title = screen.title()
+            if screen.cursor_visible():
+                self.modes.add(25)
+            else:
+                self.modes.discard(25)
+        return frames
+
+    def paste(self, data: bytes) -> bool:
+        return self.term.paste(data)
+
+    def take_refused(self) -> Union[Tuple[int, int], None]:
+        refused, self.term.refused = self.term.refused, None
+        return refused
+
+    def exit_fd(self) -> int:
+        return self.term.proc.sentinel # Readable once the worker has exited, along with the shell
+
+    def check_exit(self) -> bool:
+        if self.term.proc.is_alive():
+            return False
+        self.drain()
+        self.on_destroy(self)
+        return True
@@ -0,0 +1,182 @@
+import time
+import threading
+import traceback
+from typing import Callable, Iterator, Union
+from core.recording import Recording, Record, OUTPUT
+from core.scrollback import Scrollback
+from .term_window import TerminalWindow
+
+class Playback:
+    """
+    Stand-in for `TerminalProcess` in a replay: the clock output is replayed against, which keys
+    sent to the pane control rather than go to a shell (space pauses, q closes the pane).
+    Times are seconds into the recording, which pass `speed` times as fast as real ones.
+    """
+    queued: int = 0 # Keys are never held back, there is no shell to read them
+    def __init__(self) -> None:
+        self.cond: threading.Condition = threading.Condition() # Notified whenever the clock is changed
+        self.speed: float = 1.0
+        self.paused: bool = False
+        self.position: float = 0.0 # Time in the recording as of `anchor`
+        self.anchor: float = time.monotonic()
+        self.seek_to: Union[float, None] = 0.0 # Seek waiting to be carried out, starting off from the first keyframe
+        self.closed: bool = False
+
+    def now(self) -> float:
+        if self.paused:
+            return self.position
+        return self.position + (time.monotonic() - self.anchor) * self.speed
+
+    def _reanchor(self, position: float) -> None:
+        self.position = position
+        self.anchor = time.monotonic()
+        self.cond.notify_all()
+
+    def set_speed(self, speed: float) -> None:
+        with self.cond:
+            self._reanchor(self.now())
+            self.speed = speed
+
+    def toggle_pause(self) -> None:
+        with self.cond:
+            self._reanchor(self.now())
+            self.paused = not self.paused
+
+    def seek(self, t: float) -> None:
+        with self.cond:
+            self.seek_to = max(0.0, t)
+            self._reanchor(self.seek_to)
+
+    def take_seek(self) -> Union[float, None]:
+        with self.cond:
+            t, self.seek_to = self.seek_to, None
+            return t
+
+    def wait_until(self, t: float) -> bool:
+        """ Sleep until `t` in the recording, returns False if a seek or closing cut the wait short """
+        with self.cond:
+            while not self.closed and self.seek_to is None:
+                if self.paused or t == float("inf"):
+                    self.cond.wait()
+                    continue
+                remaining: float = (t - self.now()) / self.speed
+                if remaining <= 0:
+                    return True
+                self.cond.wait(remaining)
+            return False
+
+    def send(self, line: bytes) -> bool:
+        if line == b" ":
+            self.toggle_pause()
+        elif line == b"q":
+            self.close()
+        return True
+
+    def resize(self, cols: int, lines: int) -> None:
+        pass # A replay is parsed at the size of its pane, there is no one else to tell
+
+    def close(self) -> None:
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+class ReplayTerminalWindow(TerminalWindow):
+    """
+    `TerminalWindow` playing back a recording (see `core.recording`) rather than running a shell.
+    Output is parsed on a thread of our own at the pace it was recorded, see `Playback`.
+    Seeking restores the last keyframe before the target then parses only what was output
+    since, so it takes as long wherever it lands. The pane keeps its own size, recordings
+    show as recorded in panes at least as large as the terminal they were made in.
+    """
+    recordable: bool = False
+    def __init__(self, recording: Recording, speed: float, *args, **kwargs) -> None:
+        self.recording: Recording = recording
+        self.pending: Union[Record, None] = None # Next record to replay, once its time comes
+        self.records: Iterator[Record] = iter(())
+        super().__init__(*args, **kwargs)
+        self.term.set_speed(speed)
+
+    def spawn(self, cols: int, lines: int) -> Playback:
+        return Playback()
+
+    def seek(self, t: float) -> None:
+        """ Bring the display to where it was `t` seconds into the recording, from the keyframe before """
+        offset, (snapshot, modes, title) = self.recording.keyframe_before(t)
+        with self.lock:
+            size = self.char_disp.size
+            self.char_disp.restore(snapshot, self.styles.unpack)
+            if self.char_disp.size != size:
+                self.char_disp.resize(*size)
+            # History from wherever we were before would not follow on
+            history: Scrollback = self.char_disp.history
+            self.char_disp.history = Scrollback(history.max_lines, history.budget) # Still accounted for
+            history.close()
+            self.parser.reset()
+            self.modes = set(modes)
+            self.title = title
+        self.records = self.recording.records(offset)
+        next(self.records) # The keyframe itself
+        self.pending = None
+        for record in self.records:
+            if record[1] > t:
+                self.pending = record
+                return
+            self.replay(record)
+
+    def replay(self, record: Record) -> None:
+        kind, _, value = record
+        if kind == OUTPUT:
+            with self.lock:
+                self._parse(value)
+        # Keyframes match what was parsed anyway, and resizes are left to the pane
+
+    def update(self, budget: int = 0) -> int:
+        return 0 # Output is parsed as its time comes
+
+    def exit_fd(self) -> None:
+        return None # There is no process, the replay thread hands over a last frame once closed
+
+    def check_exit(self) -> bool:
+        if not self.term.closed:
+            return False
+        self.on_destroy(self)
+        return True
+
+    def start_reader(self, on_frame: Callable[[TerminalWindow], None]) -> None:
+        self.reader = threading.Thread(target=self._replay_loop, args=(on_frame,), name="replay", daemon=True)
+        self.reader.start()
+
+    def stop_reader(self) -> None:
+        if self.reader is None:
+            return
+        self.term.close()
+        self.reader.join()
+        self.reader = None
+
+    def close(self) -> None:
+        super().close()
+        self.recording.close()
+
+    def _replay_loop(self, on_frame: Callable[[TerminalWindow], None]) -> None:
+        """ Body of the replay thread, sleeps until the next record is due or the playback is changed """
+        playback: Playback = self.term
+        while not playback.closed:
+            try:
+                target: Union[float, None] = playback.take_seek()
+                if target is not None:
+                    self.seek(target)
+                    on_frame(self)
+                    continue
+                if self.pending is None:
+                    self.pending = next(self.records, None)
+                if self.pending is None: # The end, wait for a seek or the pane closing
+                    playback.wait_until(float("inf"))
+                    continue
+                if playback.wait_until(self.pending[1]):
+                    record, self.pending = self.pending, None
+                    self.replay(record)
+                    on_frame(self)
+            except Exception as e:
+                self.logs.error(f"Error while replaying {self.recording.path}\n{traceback.format_exc()}", e)
+                self.pending = None
+        on_frame(self)
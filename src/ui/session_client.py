@@ -0,0 +1,361 @@
+import queue
+import socket
+import itertools
+import threading
+import traceback
+from array import array
+from typing import Callable, Dict, List, Set, Tuple, Union
+from core.scrollback import Line
+from core.search import Search
+from core.session_protocol import MessageReader, encode, decode_row
+from core.style import StyleTable
+from .term_window import TerminalWindow
+
+class SessionConnection:
+    """
+    Connection of the UI to a session server (see `ui.session_server`). Messages from the
+    server are read on a thread of our own and applied to the `SessionTerminalWindow`s
+    mirroring the panes, which are then handed to the event loop as frames, as
+    `TerminalWindow`s are by their reader thread.
+    """
+    chunk_lines: int = 256 # Lines of scrollback asked for at a time
+
+    def __init__(self, logs, path: str) -> None:
+        self.logs = logs
+        self.path: str = path
+        self.styles: StyleTable = StyleTable() # Shared with the UI's `ColorPairs`
+        self.sock: socket.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(path)
+        self.send_lock = threading.Lock()
+        self.closed: bool = False # Set once the server has gone
+        self.windows: Dict[int, "SessionTerminalWindow"] = {}
+        self.created: queue.Queue = queue.Queue() # Replies to "new"
+        self.search_ids = itertools.count()
+        self.reader: MessageReader = MessageReader()
+        self._backlog: List[tuple] = [] # Messages received along with the first
+        # The server starts off with the panes it hosts, which are waiting for a window each
+        self.unclaimed: List[int] = [pane_id for pane_id, _, _ in self.receive_one("panes")[1]]
+        self.thread: threading.Thread = threading.Thread(target=self._read_loop, name="session-reader", daemon=True)
+        self.thread.start()
+
+    def receive_one(self, kind: str) -> tuple:
+        """ Block until the first message has been received, which must be of `kind` """
+        msgs: List[tuple] = []
+        while not msgs:
+            data: bytes = self.sock.recv(64*1024)
+            if not data:
+                raise ConnectionError(f"Session server at {self.path} hung up")
+            msgs = self.reader.feed(data)
+        if msgs[0][0] != kind:
+            raise ValueError(f"Expected {kind!r} from the session server, got {msgs[0][0]!r}")
+        self._backlog = msgs[1:]
+        return msgs[0]
+
+    def send(self, msg: tuple) -> None:
+        """ Send `msg` to the server, from any thread. Dropped once the server has gone """
+        if self.closed:
+            return
+        try:
+            with self.send_lock:
+                self.sock.sendall(encode(msg))
+        except OSError:
+            self.closed = True
+
+    def new_pane(self, cols: int, lines: int) -> int:
+        """ Have the server start a shell in a new pane, returns its id """
+        self.send(("new", cols, lines))
+        try:
+            return self.created.get(timeout=10)
+        except queue.Empty:
+            raise RuntimeError("Session server did not start a pane")
+
+    def _read_loop(self) -> None:
+        """ Body of the reader thread, applies messages until the server hangs up """
+        msgs: List[tuple] = self._backlog
+        while True:
+            for msg in msgs:
+                try:
+                    self.dispatch(msg)
+                except Exception as e:
+                    self.logs.error(f"Error while applying {msg[0]!r} from the session server\n{traceback.format_exc()}", e)
+            try:
+                data: bytes = self.sock.recv(256*1024)
+                msgs = self.reader.feed(data) if data else []
+            except (OSError, ValueError) as e:
+                self.logs.error("Lost the session server: %r", e)
+                data = b""
+            if not data:
+                break
+        self.closed = True
+        for window in list(self.windows.values()):
+            window.frame()
+
+    def dispatch(self, msg: tuple) -> None:
+        kind: str = msg[0]
+        if kind == "created":
+            self.created.put(msg[1])
+            return
+        window: Union[SessionTerminalWindow, None] = self.windows.get(msg[1])
+        if window is None:
+            return # A window yet to be created asks for a full copy once it is
+        if kind == "rows":
+            window.apply_rows(*msg[2:])
+        elif kind == "history":
+            window.char_disp.history.receive(msg[2], msg[3])
+            with window.lock: # Lines shown blank until now may have arrived
+                if window.char_disp.view_offset:
+                    window.char_disp.damage_all()
+        elif kind == "matches":
+            search: Union[Search, None] = window.search
+            if not isinstance(search, RemoteSearch) or search.search_id != msg[2]:
+                return # Superseded already
+            search.receive(msg[3], msg[4])
+        elif kind == "dropped":
+            window.term.refused = (msg[2], msg[3])
+        elif kind == "exit":
+            window.term.exited = True
+        window.frame()
+
+    def close(self) -> None:
+        """ Detach, leaving the server and its panes running """
+        self.closed = True
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.thread.join()
+        self.sock.close()
+
+class RemotePane:
+    """ Stand-in for `TerminalProcess`, for a shell hosted by the session server """
+    queued: int = 0 # Input is queued by the server, see `TerminalProcess.send`
+    def __init__(self, session: SessionConnection, pane_id: int) -> None:
+        self.session: SessionConnection = session
+        self.pane_id: int = pane_id
+        self.exited: bool = False # Set once the server reports the shell has exited
+        self.refused: Union[Tuple[int, int], None] = None # Last input the server dropped, see `take_refused`
+
+    @property
+    def closed(self) -> bool:
+        return self.exited or self.session.closed
+
+    def send(self, line: bytes) -> bool:
+        """ Write to process stdin. The server queues it, and tells us if it is dropped instead """
+        self.session.send(("keys", self.pane_id, line))
+        return True
+
+    def paste(self, data: bytes) -> bool:
+        """ Have the server paste `data`, it knows whether the shell asked for bracketed paste """
+        self.session.send(("paste", self.pane_id, data))
+        return True
+
+    def resize(self, cols: int, lines: int) -> None:
+        # The server answers with the whole screen at the new size
+        self.session.send(("resize", self.pane_id, cols, lines))
+
+    def close(self) -> None:
+        pass # The shell keeps running on the server, to be attached to again
+
+class RemoteScrollback:
+    """
+    Stand-in for `Scrollback` mirroring a pane's history on the server, which is only
+    fetched once shown, `SessionConnection.chunk_lines` at a time. Lines not fetched yet
+    read as blank until they arrive. Line numbers are those of the server. Lines are shown
+    as they were pushed there, history is not rewrapped to the pane's width once it is resized.
+    """
+    def __init__(self, session: SessionConnection, pane_id: int) -> None:
+        self.session: SessionConnection = session
+        self.pane_id: int = pane_id
+        self.length: int = 0
+        self.dropped: int = 0 # Lines discarded for good by the server
+        self.lines: Dict[int, Line] = {} # Absolute line number -> line
+        self.requested: Set[int] = set() # Chunks asked for
+        self.lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return self.length
+
+    def update(self, length: int, dropped: int) -> int:
+        """ Take on the server's history length, returns how many lines were added """
+        with self.lock:
+            added: int = dropped + length - (self.dropped + self.length)
+            if dropped != self.dropped:
+                self.lines = {line_no: line for line_no, line in self.lines.items() if line_no >= dropped}
+            self.length, self.dropped = length, dropped
+            return added
+
+    def line(self, idx: int) -> Line:
+        """ Line `idx` of history, 0 being the oldest still kept """
+        with self.lock:
+            line_no: int = self.dropped + idx
+            line: Union[Line, None] = self.lines.get(line_no)
+            if line is None:
+                chunk: int = line_no // self.session.chunk_lines
+                if chunk not in self.requested:
+                    self.requested.add(chunk)
+                    self.session.send(("history", self.pane_id, chunk*self.session.chunk_lines, self.session.chunk_lines))
+                return ("", None)
+            return line
+
+    def push(self, text: str, attrs: array, wrapped: bool = False) -> None:
+        pass # The server pushes its own copy of rows, into the history we mirror
+
+    def reflow(self, width: int) -> None:
+        pass # So does the server, lines are mirrored as they were pushed there
+
+    def take_wrapped(self) -> List[Line]:
+        return [] # The server joins its own lines back onto the screen, and sends the rows again
+
+    def view_len(self, back: int = 0) -> int:
+        return self.length # Rows are lines, there is nothing to rewrap however far back
+
+    def view_line(self, back: int) -> Line:
+        return self.line(self.length-1 - back)
+
+    def view_line_number(self, back: int) -> tuple:
+        return (self.dropped + self.length-1 - back, True)
+
+    def receive(self, first: int, rows: list) -> None:
+        """ Store lines sent by the server from absolute line number `first` """
+        decoded: List[Line] = []
+        for text, styles in rows:
+            if styles is None:
+                decoded.append((text, None))
+            else:
+                packed: array = array("Q")
+                packed.frombytes(styles)
+                decoded.append((text, array("H", map(self.session.styles.unpack, packed))))
+        with self.lock:
+            for line_no, line in enumerate(decoded, first):
+                self.lines[line_no] = line
+            if len(rows) < self.session.chunk_lines:
+                # Only part of the chunk existed yet, the rest is asked for once shown
+                self.requested.discard(first // self.session.chunk_lines)
+
+    def close(self) -> None:
+        with self.lock:
+            self.lines = {}
+            self.requested = set()
+
+class RemoteSearch(Search):
+    """
+    `Search` carried out by the session server, which holds the pane's history and its index.
+    Matches are sent over as they are found, the connection's reader thread keeps them
+    aside until `step()` takes them in, as `Search.step()` would have found them.
+    """
+    remote: bool = True
+    def __init__(self, session: SessionConnection, pane_id: int, disp, pattern: str) -> None:
+        self.session: SessionConnection = session
+        self.pane_id: int = pane_id
+        self.disp = disp
+        self.pattern: str = pattern
+        self.ignore_case: bool = pattern == pattern.lower()
+        self.matches: List[Tuple[int, int]] = [] # Newest first
+        self.by_line: Dict[int, List[int]] = {}
+        self.selected: Union[Tuple[int, int], None] = None
+        self.done: bool = False
+        self.lock = threading.Lock()
+        self._arrived: List[Tuple[int, int]] = [] # Received, yet to be taken by `step()`
+        self._finished: bool = False # The server has sent every match
+        self.search_id: int = next(session.search_ids)
+        session.send(("search", pane_id, self.search_id, pattern))
+
+    def receive(self, matches: list, done: bool) -> None:
+        """ Keep matches sent by the server (see `core.session_protocol`), from the reader thread """
+        with self.lock:
+            self._arrived.extend(tuple(match) for match in matches)
+            self._finished = self._finished or bool(done)
+
+    def step(self, budget: float = 0.005) -> bool:
+        """ Take in the matches which arrived since, returns whether there were any """
+        with self.lock:
+            arrived, self._arrived = self._arrived, []
+            self.done = self._finished or self.session.closed
+        for line_no, col in arrived:
+            self.by_line.setdefault(line_no, []).append(col)
+        self.matches.extend(arrived)
+        return bool(arrived)
+
+    def close(self) -> None:
+        if not self.done:
+            self.session.send(("search", self.pane_id, self.search_id, None)) # Stop searching
+
+class SessionTerminalWindow(TerminalWindow):
+    """
+    `TerminalWindow` mirroring a pane of a session server: there is no shell or parser here,
+    rows changed on the server are copied into `char_disp` by the connection's reader thread.
+    Creates a new pane unless given the id of one to attach to.
+    """
+    recordable: bool = False
+    def __init__(self, session: SessionConnection, pane_id: Union[int, None], *args, **kwargs) -> None:
+        self.session: SessionConnection = session
+        self.pane_id: Union[int, None] = pane_id
+        self.on_frame: Union[Callable[[TerminalWindow], None], None] = None
+        super().__init__(*args, **kwargs)
+        self.pane_id = self.term.pane_id
+        self.char_disp.history = RemoteScrollback(session, self.pane_id)
+        session.windows[self.pane_id] = self
+        self.term.resize(*self.char_disp.size)
+
+    def spawn(self, cols: int, lines: int) -> RemotePane:
+        if self.pane_id is None:
+            self.pane_id = self.session.new_pane(cols, lines)
+        return RemotePane(self.session, self.pane_id)
+
+    def apply_rows(self, history: int, dropped: int, x: int, y: int, flags: int, title: str, rows: list) -> None:
+        """ Apply a "rows" message from the server (see `core.session_protocol`) """
+        with self.lock:
+            disp = self.char_disp
+            cols, lines = disp.size
+            added: int = disp.history.update(history, dropped)
+            if disp.view_offset and added > 0: # Keep a scrolled back view anchored on the same lines
+                disp.view_offset = min(history, disp.view_offset + added)
+                disp.damage_all()
+            for row_y, text, styles in rows:
+                if row_y < lines: # Rows are for the size last asked for, which may have changed since
+                    disp.load_row(row_y, *decode_row((text, styles), cols, self.session.styles.unpack))
+            disp.curs.set_pos(min(x, cols), min(y, lines-1))
+            self.title = title
+            if flags & 1:
+                self.modes.add(25)
+            else:
+                self.modes.discard(25)
+
+    def frame(self) -> None:
+        """ Something new came from the server, hand it to whoever draws us """
+        if self.on_frame:
+            self.on_frame(self)
+
+    def update(self, budget: int = 0) -> int:
+        return 0 # Rows are applied as they arrive
+
+    def new_search(self, pattern: str) -> RemoteSearch:
+        """ Have the server search the pane, our own copy of its history is mostly blank """
+        return RemoteSearch(self.session, self.pane_id, self.char_disp, pattern)
+
+    def paste(self, data: bytes) -> bool:
+        return self.term.paste(data)
+
+    def take_refused(self) -> Union[Tuple[int, int], None]:
+        refused, self.term.refused = self.term.refused, None
+        return refused
+
+    def exit_fd(self) -> None:
+        return None # The server tells us, see `SessionConnection.dispatch`
+
+    def check_exit(self) -> bool:
+        if not self.term.closed:
+            return False
+        self.on_destroy(self)
+        return True
+
+    def start_reader(self, on_frame: Callable[[TerminalWindow], None]) -> None:
+        """ The connection's reader thread calls `on_frame` for us """
+        self.on_frame = on_frame
+
+    def stop_reader(self) -> None:
+        self.on_frame = None
+
+    def close(self) -> None:
+        super().close()
+        self.session.windows.pop(self.pane_id, None)
@@ -0,0 +1,360 @@
+import os
+import time
+import signal
+import socket
+import itertools
+from array import array
+from typing import Dict, List, Set, Tuple, Union
+from core.event_loop import EventLoop
+from core.search import Search
+from core.termproc import TerminalProcess
+from core.scrollback import Scrollback, ScrollbackBudget, SegmentStore, default_spill_dir
+from core.session_protocol import MessageReader, encode, encode_row
+from core.style import StyleTable
+from .term_window import HeadlessTerminal
+
+class ServerClient:
+    """ A client attached to the server: its socket, bytes queued for it, rows it has yet to be sent and its searches """
+    def __init__(self, sock: socket.socket) -> None:
+        self.sock: socket.socket = sock
+        self.reader: MessageReader = MessageReader()
+        self.out: bytearray = bytearray()
+        self.pending: Dict[int, Set[int]] = {} # pane -> rows changed since it was last sent that pane
+        self.searches: Dict[int, Tuple[int, Search]] = {} # pane -> search id and search, until it is done
+        self.matches_sent: Dict[int, int] = {} # pane -> matches of its search sent so far
+
+class SessionServer:
+    """
+    Headless server owning the shells and their scrollback, so they outlive the curses frontend
+    and the connection it runs over. Panes are `HeadlessTerminal`s parsed on reader threads,
+    just like `TerminalWindow`s are.
+
+    Clients attach over a Unix domain socket (see `core.session_protocol`) and are sent the
+    visible screens first, then only the rows changed since, at most `max_fps` times per second.
+    Changes coalesce while a client is slow to read, rather than queueing up without bound.
+    Scrollback is only sent as clients ask for it, so attaching costs the same however much
+    history there is. It is searched here too, matches are streamed to the client as they are found.
+    Any number of clients may be attached at once, the last one to resize a pane decides its size.
+    """
+    max_fps: int = 60
+    max_queued: int = 256*1024 # Bytes queued for a client after which frames are held back
+    max_history: int = 1024 # Lines of scrollback sent per request
+
+    def __init__(self, logs, path: str, scrollback_lines: int = 10000, scrollback_bytes: int = 64*1024*1024,
+                 spill_dir: Union[str, None] = default_spill_dir) -> None:
+        self.logs = logs
+        self.path: str = path
+        self.running: bool = False
+        self.last_frame: float = 0.0
+        self.event_loop: EventLoop = EventLoop(logs)
+        self.styles: StyleTable = StyleTable()
+        self.panes: Dict[int, HeadlessTerminal] = {}
+        self._pane_ids = itertools.count()
+        self.frames_pending: Set[int] = set() # Panes whose reader has a frame queued for the loop
+        self.clients: List[ServerClient] = []
+        self.scrollback_lines: int = scrollback_lines
+        self.scrollback_budget: ScrollbackBudget = ScrollbackBudget(scrollback_bytes)
+        self.spill_dir: Union[str, None] = spill_dir
+        if spill_dir:
+            SegmentStore.cleanup_stale(spill_dir)
+        self.sock: socket.socket = self.listen(path)
+        self.event_loop.add_reader(self.sock, lambda fd: self.on_accept())
+
+    def listen(self, path: str) -> socket.socket:
+        """ Listen on `path`, only accessible to us as messages are trusted """
+        os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+        if os.path.exists(path):
+            probe: socket.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(path)
+                raise RuntimeError(f"A session server is already listening on {path}")
+            except (ConnectionRefusedError, FileNotFoundError):
+                os.unlink(path) # Left behind by a server which is no longer running
+            finally:
+                probe.close()
+        sock: socket.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(path)
+        os.chmod(path, 0o600)
+        sock.listen()
+        sock.setblocking(False)
+        return sock
+
+    def new_pane(self, cols: int, lines: int) -> int:
+        """ Start a shell in a new pane, returns its id """
+        pane_id: int = next(self._pane_ids)
+        spill: Union[SegmentStore, None] = None
+        if self.spill_dir:
+            spill = SegmentStore(os.path.join(self.spill_dir, f"{os.getpid()}-{pane_id}"))
+        history: Scrollback = Scrollback(self.scrollback_lines, self.scrollback_budget, spill)
+        term: TerminalProcess = TerminalProcess(decode=False, size=(cols, lines))
+        pane: HeadlessTerminal = HeadlessTerminal(self.logs, (cols, lines), self.styles, term, history)
+        self.panes[pane_id] = pane
+        pane.start_reader(lambda pane: self.on_pane_frame(pane_id))
+        if pane.exit_fd() is not None:
+            self.event_loop.add_reader(pane.exit_fd(), lambda fd: self.on_pane_exit(pane_id))
+        self.logs.info("Started pane %d (%dx%d)", pane_id, cols, lines)
+        return pane_id
+
+    def close_pane(self, pane_id: int) -> None:
+        pane: HeadlessTerminal = self.panes.pop(pane_id)
+        if pane.exit_fd() is not None:
+            self.event_loop.remove_reader(pane.exit_fd())
+        self.event_loop.remove_writer(pane.term.stdin)
+        pane.close()
+        for client in list(self.clients):
+            client.pending.pop(pane_id, None)
+            client.searches.pop(pane_id, None)
+            client.matches_sent.pop(pane_id, None)
+            self.send(client, ("exit", pane_id))
+        self.logs.info("Pane %d exited", pane_id)
+        if not self.panes:
+            self.running = False
+
+    def on_pane_frame(self, pane_id: int) -> None:
+        """ Called from a pane's reader thread, hands the frame over to the event loop once at a time """
+        if pane_id not in self.frames_pending:
+            self.frames_pending.add(pane_id)
+            self.event_loop.call_soon_threadsafe(lambda: self.on_pane_output(pane_id))
+
+    def on_pane_output(self, pane_id: int) -> None:
+        """ Note the rows of `pane_id` which changed for every client, they are sent with the next frame """
+        self.frames_pending.discard(pane_id)
+        pane: HeadlessTerminal = self.panes.get(pane_id)
+        if pane is None:
+            return
+        if pane.term.closed: # The pty hung up, the shell has likely exited
+            self.on_pane_exit(pane_id)
+            if pane_id not in self.panes:
+                return
+        with pane.lock:
+            rows: Set[int] = set(pane.char_disp.take_damage())
+            for top, bottom, _ in pane.char_disp.take_scrolls():
+                rows.update(range(top, bottom+1)) # Clients are sent rows, not scrolls
+        for client in self.clients:
+            # Even with no rows, the cursor may have moved
+            client.pending.setdefault(pane_id, set()).update(rows)
+
+    def on_pane_exit(self, pane_id: int) -> None:
+        """ Called once the shell of `pane_id` is reported to have exited, closes the pane if it has """
+        pane: HeadlessTerminal = self.panes.get(pane_id)
+        if pane is None or pane.term.proc.poll() is None:
+            return
+        pane.drain()
+        self.close_pane(pane_id)
+
+    def on_child_exit(self) -> None:
+        """ Called upon SIGCHLD, only panes whose shell's exit is not watched for otherwise are checked """
+        for pane_id, pane in list(self.panes.items()):
+            if pane.exit_fd() is None:
+                self.on_pane_exit(pane_id)
+
+    def rows_message(self, pane_id: int, rows: Set[int]) -> tuple:
+        pane: HeadlessTerminal = self.panes[pane_id]
+        with pane.lock:
+            disp = pane.char_disp
+            encoded: list = [(y,) + encode_row(disp.row_text(y), disp.row_attrs(y), self.styles.pack)
+                             for y in sorted(rows) if y < disp.size[1]]
+            x, y = disp.curs.get_pos()
+            return ("rows", pane_id, len(disp.history), disp.history.dropped, x, y,
+                    int(pane.cursor_visible()), pane.title, encoded)
+
+    def history_message(self, pane_id: int, first: int, count: int) -> tuple:
+        """ Up to `count` scrollback lines of `pane_id` from absolute line number `first` """
+        pane: HeadlessTerminal = self.panes[pane_id]
+        history: Scrollback = pane.char_disp.history
+        with pane.lock, history.lock:
+            first = max(first, history.dropped)
+            end: int = min(first + min(count, self.max_history), history.dropped + len(history))
+            lines: list = []
+            for idx in range(first - history.dropped, end - history.dropped):
+                text, attrs = history.line(idx)
+                lines.append(encode_row(text, attrs if attrs is not None else array("H", [0]) * len(text), self.styles.pack))
+        return ("history", pane_id, first, lines)
+
+    def on_accept(self) -> None:
+        try:
+            sock, _ = self.sock.accept()
+        except BlockingIOError:
+            return
+        sock.setblocking(False)
+        client: ServerClient = ServerClient(sock)
+        self.clients.append(client)
+        self.event_loop.add_reader(sock, lambda fd: self.on_client_input(client))
+        self.send(client, ("panes", [(pane_id, *pane.char_disp.size) for pane_id, pane in self.panes.items()]))
+        # Visible screens go first, in full
+        for pane_id, pane in self.panes.items():
+            client.pending[pane_id] = set(range(pane.char_disp.size[1]))
+        self.logs.info("Client attached, %d attached", len(self.clients))
+
+    def drop(self, client: ServerClient) -> None:
+        self.event_loop.remove_reader(client.sock)
+        self.event_loop.remove_writer(client.sock)
+        client.sock.close()
+        self.clients.remove(client)
+        self.logs.info("Client detached, %d attached", len(self.clients))
+
+    def on_client_input(self, client: ServerClient) -> None:
+        try:
+            data: bytes = client.sock.recv(64*1024)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b""
+        if not data:
+            self.drop(client)
+            return
+        try:
+            for msg in client.reader.feed(data):
+                self.handle(client, msg)
+        except (ValueError, TypeError, KeyError, IndexError) as e:
+            self.logs.warning("Dropping client after a bad message: %r", e)
+            self.drop(client)
+
+    def handle(self, client: ServerClient, msg: tuple) -> None:
+        kind: str = msg[0]
+        if kind in ("keys", "paste"):
+            pane_id, data = msg[1:]
+            if pane_id in self.panes and not self.send_input(pane_id, data, paste=kind == "paste"):
+                self.send(client, ("dropped", pane_id, len(data), self.panes[pane_id].term.queued))
+        elif kind == "new":
+            cols, lines = msg[1:]
+            self.send(client, ("created", self.new_pane(cols, lines)))
+        elif kind == "resize":
+            pane_id, cols, lines = msg[1:]
+            pane: HeadlessTerminal = self.panes.get(pane_id)
+            if pane is None:
+                return
+            with pane.lock:
+                if pane.char_disp.size != (cols, lines):
+                    pane.term.resize(cols, lines)
+                    pane.char_disp.resize(cols, lines)
+                pane.char_disp.damage_all() # Clients asking are also after a fresh copy
+            self.on_pane_output(pane_id)
+        elif kind == "history":
+            pane_id, first, count = msg[1:]
+            if pane_id in self.panes:
+                self.send(client, self.history_message(pane_id, first, count))
+        elif kind == "search":
+            pane_id, search_id, pattern = msg[1:]
+            self.start_search(client, pane_id, search_id, pattern)
+        else:
+            raise ValueError(f"Unknown message {kind!r}")
+
+    def start_search(self, client: ServerClient, pane_id: int, search_id: int, pattern: Union[str, None]) -> None:
+        """ Search a pane for `client`, replacing its previous search of that pane. None only stops it """
+        client.searches.pop(pane_id, None)
+        client.matches_sent.pop(pane_id, None)
+        pane: HeadlessTerminal = self.panes.get(pane_id)
+        if pane is None or not pattern:
+            return
+        with pane.lock, pane.char_disp.history.lock:
+            search: Search = Search(pane.char_disp, pattern)
+        client.searches[pane_id] = (search_id, search)
+        client.matches_sent[pane_id] = 0
+        self.send_matches(client, pane_id)
+
+    def send_matches(self, client: ServerClient, pane_id: int) -> None:
+        """ Send `client` the matches its search of `pane_id` found since they were last sent """
+        search_id, search = client.searches[pane_id]
+        sent: int = client.matches_sent[pane_id]
+        self.send(client, ("matches", pane_id, search_id, search.matches[sent:], search.done))
+        client.matches_sent[pane_id] = len(search.matches)
+        if search.done:
+            del client.searches[pane_id]
+            del client.matches_sent[pane_id]
+
+    def step_searches(self) -> None:
+        """ Give every unfinished search a slice of time, as `MasterWindow.step_searches` does """
+        for client in list(self.clients):
+            for pane_id, (search_id, search) in list(client.searches.items()):
+                pane: HeadlessTerminal = self.panes[pane_id]
+                with pane.lock, pane.char_disp.history.lock:
+                    found: bool = search.step()
+                if found or search.done:
+                    self.send_matches(client, pane_id)
+
+    def send_input(self, pane_id: int, data: bytes, paste: bool = False) -> bool:
+        """
+        Type (or paste) `data` into a pane, what its pty does not take straight away is written once it can.
+        False if it was dropped, see `TerminalProcess.send`
+        """
+        pane: HeadlessTerminal = self.panes[pane_id]
+        sent: bool = pane.paste(data) if paste else pane.term.send(data)
+        if not sent:
+            self.logs.warning("Dropped %d bytes of input to pane %d, %d are waiting to be read", len(data), pane_id, pane.term.queued)
+        if pane.term.queued:
+            self.event_loop.add_writer(pane.term.stdin, lambda fd: self.flush_input(pane))
+        return sent
+
+    def flush_input(self, pane: HeadlessTerminal) -> None:
+        """ Called while a pane has input queued, once its pty can take more """
+        pane.term.flush()
+        if not pane.term.queued:
+            self.event_loop.remove_writer(pane.term.stdin)
+
+    def send(self, client: ServerClient, msg: tuple) -> None:
+        client.out += encode(msg)
+        self.flush(client)
+
+    def flush(self, client: ServerClient) -> None:
+        """ Write out as much as the client's socket takes, waiting for it to become writable for the rest """
+        if client not in self.clients:
+            return
+        try:
+            sent: int = client.sock.send(client.out)
+            del client.out[:sent]
+        except BlockingIOError:
+            pass
+        except OSError:
+            self.drop(client)
+            return
+        if client.out:
+            self.event_loop.add_writer(client.sock, lambda fd: self.flush(client))
+        else:
+            self.event_loop.remove_writer(client.sock)
+
+    def ready_clients(self) -> List[ServerClient]:
+        """ Clients with changes to be sent and room for them """
+        return [client for client in self.clients if client.pending and len(client.out) < self.max_queued]
+
+    def send_frames(self) -> None:
+        for client in self.ready_clients():
+            pending: Dict[int, Set[int]] = client.pending
+            client.pending = {}
+            for pane_id, rows in pending.items():
+                if pane_id in self.panes:
+                    self.send(client, self.rows_message(pane_id, rows))
+        self.last_frame = time.monotonic()
+
+    def frame_timeout(self) -> Union[float, None]:
+        """ Seconds until the next frame is due, None if no client has anything to be sent """
+        if not self.ready_clients():
+            return None
+        return max(0.0, self.last_frame + 1/self.max_fps - time.monotonic())
+
+    def run(self) -> None:
+        """ Serve until every pane has exited or we are told to stop """
+        self.running = True
+        # Keep running once the terminal we were started from goes away
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        self.event_loop.on_signal(signal.SIGCHLD, self.on_child_exit)
+        self.event_loop.on_signal(signal.SIGTERM, self.stop)
+        while self.running:
+            timeout: Union[float, None] = self.frame_timeout()
+            if timeout == 0.0:
+                self.send_frames()
+                continue
+            if any(client.searches for client in self.clients):
+                timeout = 0.0 # Only poll, so searching carries on right after
+            self.event_loop.run_once(timeout)
+            self.step_searches()
+        for client in list(self.clients):
+            self.drop(client)
+        for pane in self.panes.values():
+            pane.close()
+        self.sock.close()
+        os.unlink(self.path)
+        self.event_loop.close()
+
+    def stop(self) -> None:
+        self.running = False
@@ -1,49 +1,99 @@
+import os
 import re
 import curses
 import select
-from typing import Callable
+import threading
+import traceback
+from typing import Callable, Tuple, Union
 from core.esc_code import EscCodeHandler
-from core.termproc import TerminalProcess
-from core.char_display import CharDisplay, CharCell
+from core.vt_parser import VTParser
+from core.termproc import TerminalProcess, ShellPool
+from core.char_display import CharDisplay
+from core.style import StyleTable
+from core.scrollback import Scrollback
+from core.recording import Recorder
+from core.search import Search
+from core.logs import DEBUG
 from .boxed import Boxed
+from .colors import ColorPairs
 
 class TerminalWindow(Boxed):
     """
-    Terminal emulator UI 
+    Terminal emulator UI.
+    Once `start_reader` is called, the pty is drained and parsed on a thread of its own,
+    so output keeps flowing while the main thread is busy. Everything the parser
+    mutates (`char_disp` and the modes/title set by escape codes) is guarded by `lock`,
+    and the reader never calls into curses, drawing is left to the main thread.
     """
-    def __init__(self, logs, win, on_destroy: Callable[[], None], active: bool = False) -> None:
+    # Runs of identical 16-bit style ids within the bytes of an attribute array
+    style_run_re = re.compile(rb'(..)\1*', re.DOTALL)
+    recordable: bool = True # Whether output is parsed here, and so can be recorded (see `start_recording`)
+
+    def __init__(self, logs, win, on_destroy: Callable[[], None], colors: ColorPairs, active: bool = False, history: Scrollback = None,
+                 shells: ShellPool = None) -> None:
         super().__init__(win)
         self.logs = logs
+        self.shells: ShellPool = shells # Idle shells to adopt one of rather than start our own, if any
+        self.colors: ColorPairs = colors
+        self.styles: StyleTable = colors.styles
         self.on_destroy: Callable[[], None] = on_destroy
         max_y, max_x = self._win.getmaxyx()
-        self.term: TerminalProcess = TerminalProcess()
-        self.term.resize(max_x, max_y)
-        self.char_disp: CharDisplay = CharDisplay(logs, (max_x, max_y))
+        self.term: TerminalProcess = self.spawn(max_x, max_y)
+        self.char_disp: CharDisplay = CharDisplay(logs, (max_x, max_y), history)
         self.esc_handler: EscCodeHandler = EscCodeHandler(self.logs, self.char_disp)
+        self.parser: VTParser = VTParser(self.logs, self.char_disp, self.esc_handler)
         self.is_active: bool = active
+        self._drawn_curs: Tuple[int, int] = None
+        self.search: Search = None # Search whose matches are highlighted, if any
+        self.modes: set[int] = {25} # DEC private modes currently set, the cursor starts off visible
+        self.title: str = "" # Set by the shell through OSC 0/2
+        self._drawn_title: str = ""
+        self.lock = threading.RLock()
+        self.reader: threading.Thread = None
+        self.recorder: Recorder = None
         self.setup_esc()
         self.box()
+        self._win.idlok(True) # Let curses use the terminal's own line insertion/deletion when replaying scrolls
+
+    def spawn(self, cols: int, lines: int) -> TerminalProcess:
+        """ Start the shell shown in this window """
+        if self.shells:
+            return self.shells.take(cols, lines)
+        return TerminalProcess(decode=False, size=(cols, lines)) # The parser decodes printable runs itself
 
-    def resize(self, new_x: int, new_y: int) -> None:
-        # Clear windows to prevent leftover characters
-        self._real_win.erase()
-        self._real_win.refresh()
-        self._win.erase()
-        self._win.refresh()
-        # Redraw box
-        self._real_win.resize(new_y, new_x)
+    def place(self, win) -> None:
+        """
+        Move into `win`, eg. once the layout has changed. The shell is only told (SIGWINCH)
+        if the size changed, otherwise the display is just repainted where it now is
+        """
+        old_size: Tuple[int, int] = self._win.getmaxyx()
+        win.erase()
+        self._real_win = win
         self.box()
-        self._real_win.refresh()
-        # Create new window instance and redraw
-        start_y, start_x = self._real_win.getbegyx()
-        self._win = self._real_win.derwin(new_y-2, new_x-2, 1, 1)
-        self.term.resize(new_x-2, new_y-2)
-        self.char_disp.resize(new_x-2, new_y-2)
-        self.draw()
-        
+        max_y, max_x = win.getmaxyx()
+        self._win = win.derwin(max_y-2, max_x-2, 1, 1)
+        self._win.idlok(True)
+        self._drawn_curs = None
+        if (max_y-2, max_x-2) != old_size:
+            self._fit(max_x-2, max_y-2)
+        else:
+            with self.lock:
+                self.char_disp.damage_all()
+
+    def _fit(self, cols: int, lines: int) -> None:
+        """ Resize the shell's pty and the display to the window, resizing the display damages all of it for the next draw """
+        with self.lock:
+            self.term.resize(cols, lines)
+            self.char_disp.resize(cols, lines)
+            if self.recorder:
+                self.recorder.resize(cols, lines)
+
     def refresh_curs(self):
         """ Update cursor position to emulated backend cursor position """
-        self._win.move(self.char_disp.curs.y, self.char_disp.curs.x)
+        # Cursor sits one past the last column while a wrap is pending
+        # and is shifted down along with the screen while scrolled back into history
+        y: int = self.char_disp.curs.y + self.char_disp.view_offset
+        self._win.move(min(y, self.char_disp.size[1]-1), min(self.char_disp.curs.x, self.char_disp.size[0]-1))
 
     def setup_esc(self):
         """ 
@@ -56,147 +106,359 @@ class TerminalWindow(Boxed):
         self.esc_handler.on("C", self.move_curs_right)
         self.esc_handler.on("D", self.move_curs_left)
         self.esc_handler.on("H", self.move_curs_home)
+        self.esc_handler.on("f", self.move_curs_home)
         self.esc_handler.on("d", self.move_curs_vertical)
         self.esc_handler.on("G", self.move_curs_horizontal)
         self.esc_handler.on("J", self.erase_disp)
         self.esc_handler.on("K", self.erase_inline)
         self.esc_handler.on("P", self.del_char)
-        self.esc_handler.on("@", self.backspace_char)
-
-    def move_curs_horizontal(self, disp: CharDisplay, cols: str):
-        cols: int = int(cols)
-        if not cols:
-            cols = 1
-        disp.curs.x = cols - 1
-
-    def move_curs_vertical(self, disp: CharDisplay, lines: str):
-        lines: int = int(lines)
-        if not lines:
-            lines: int = 1
-        disp.curs.y = lines - 1
-
-    def move_curs_home(self, disp: CharDisplay, lines: int = 1, cols: int = 1):
-        if lines == "0":
-            lines: int = 1
-        if cols == "0":
-            cols: int = 1
-        disp.curs.set_pos(int(cols)-1, int(lines)-1)
-
-    def backspace_char(self, disp: CharDisplay, code: str):
-        cols: int = int(code)
-        if cols == 0:
-            cols = 1
+        self.esc_handler.on("@", self.insert_char)
+        self.esc_handler.on("X", self.erase_char)
+        self.esc_handler.on("L", self.insert_lines)
+        self.esc_handler.on("M", self.delete_lines)
+        self.esc_handler.on("S", self.scroll_up)
+        self.esc_handler.on("T", self.scroll_down)
+        self.esc_handler.on("r", self.set_margins)
+        self.esc_handler.on_esc("M", lambda disp: disp.reverse_index())
+        self.esc_handler.on_esc("D", lambda disp: disp.newline())
+        self.esc_handler.on_esc("E", self.next_line)
+        self.esc_handler.on("m", self.set_graphics)
+        self.esc_handler.on("?h", self.set_private_modes)
+        self.esc_handler.on("?l", self.reset_private_modes)
+        self.esc_handler.on("s", self.save_cursor)
+        self.esc_handler.on("u", self.restore_cursor)
+        self.esc_handler.on_esc("7", self.save_cursor)
+        self.esc_handler.on_esc("8", self.restore_cursor)
+        self.esc_handler.on_osc(0, self.set_title)
+        self.esc_handler.on_osc(2, self.set_title)
+
+    def move_curs_horizontal(self, disp: CharDisplay, cols: int = 0):
+        disp.curs.x = min(disp.size[0], max(cols, 1)) - 1
+
+    def move_curs_vertical(self, disp: CharDisplay, lines: int = 0):
+        disp.curs.y = min(disp.size[1], max(lines, 1)) - 1
+
+    def move_curs_home(self, disp: CharDisplay, lines: int = 0, cols: int = 0):
+        disp.curs.set_pos(min(disp.size[0], max(cols, 1)) - 1, min(disp.size[1], max(lines, 1)) - 1)
+
+    def insert_char(self, disp: CharDisplay, cols: int = 0):
+        # Shift the rest of the row right by `cols` cells
+        disp.insert_chars(cols or 1)
+
+    def erase_char(self, disp: CharDisplay, cols: int = 0):
         # Erase `cols` number of cells after cursor position
-        for cell in disp.buffer[disp.curs.y][disp.curs.x:disp.curs.x+cols]:
-            cell.data = ""
-        self.draw()
-        
-    def del_char(self, disp: CharDisplay, code: str):
-        line: list[CharCell] = disp.buffer[disp.curs.y]
-        cols: int = int(code)
-        if not cols:
-            cols = 1
-        if cols + disp.curs.x > disp.size[0] - 1: # Attempted deleting past line size, Invalid delete
-            self.logs.error(f"Invalid delete escape code, tried {cols} when max is {disp.size[0]}")
-            return
-        # row = <row before curs> + <row after last deleted cell> + <replacement cells for deleted cells> 
-        disp.buffer[disp.curs.y] = line[:disp.curs.x] + line[disp.curs.x+cols:] + [CharCell() for _ in range(cols)]
-        self.draw()
+        disp.erase_chars(cols or 1)
 
-    def erase_disp(self, disp: CharDisplay, code: str):
-        if code == "0":
-            disp.erase_all_to_curs()
-        elif code == "1":
+    def insert_lines(self, disp: CharDisplay, lines: int = 0):
+        disp.insert_lines(lines or 1)
+
+    def delete_lines(self, disp: CharDisplay, lines: int = 0):
+        disp.delete_lines(lines or 1)
+
+    def scroll_up(self, disp: CharDisplay, lines: int = 0):
+        disp.scroll_up(lines or 1)
+
+    def scroll_down(self, disp: CharDisplay, lines: int = 0):
+        disp.scroll_down(lines or 1)
+
+    def set_margins(self, disp: CharDisplay, top: int = 0, bottom: int = 0):
+        disp.set_margins(max(top, 1) - 1, (bottom or disp.size[1]) - 1)
+
+    def next_line(self, disp: CharDisplay):
+        disp.carriage_return()
+        disp.newline()
+
+    def del_char(self, disp: CharDisplay, cols: int = 0):
+        disp.delete_chars(cols or 1)
+
+    def erase_disp(self, disp: CharDisplay, code: int = 0):
+        if code == 0:
             disp.erase_all_from_curs()
-        elif code == "2":
+        elif code == 1:
+            disp.erase_all_to_curs()
+        elif code == 2:
             disp.erase_all()
 
-    def erase_inline(self, disp: CharDisplay, code: str):
-        if code == "0":
+    def erase_inline(self, disp: CharDisplay, code: int = 0):
+        if code == 0:
             disp.erase_inline_from_curs()
+        elif code == 1:
+            disp.erase_inline_to_curs()
+        elif code == 2:
+            disp.erase_line()
 
-    def move_curs_up(self, disp: CharDisplay, lines: str):
-        if lines == "0":
-            lines: int = 1
-        disp.curs.y = max(0, disp.curs.y-int(lines))
-        self.refresh_curs()
-    
-    def move_curs_down(self, disp: CharDisplay, lines: str):
-        if lines == "0":
-            lines: int = 1
-        disp.curs.y = min(disp.size[1]-1, disp.curs.y+int(lines))
-        self.refresh_curs()
+    def move_curs_up(self, disp: CharDisplay, lines: int = 0):
+        disp.curs.y = max(0, disp.curs.y-(lines or 1))
 
-    def move_curs_right(self, disp: CharDisplay, cols: str):
-        if cols == "0":
-            cols: int = 1
-        disp.curs.x = min(disp.size[0]-1, disp.curs.x+int(cols))
-        self.refresh_curs()
+    def move_curs_down(self, disp: CharDisplay, lines: int = 0):
+        disp.curs.y = min(disp.size[1]-1, disp.curs.y+(lines or 1))
 
-    def move_curs_left(self, disp: CharDisplay, cols: str):
-        if cols == "0":            
-            cols: int = 1
-        disp.curs.x = max(0, disp.curs.x-int(cols))
-        self.refresh_curs()
+    def move_curs_right(self, disp: CharDisplay, cols: int = 0):
+        disp.curs.x = min(disp.size[0]-1, disp.curs.x+(cols or 1))
+
+    def move_curs_left(self, disp: CharDisplay, cols: int = 0):
+        disp.curs.x = max(0, min(disp.curs.x, disp.size[0]-1)-(cols or 1))
+
+    def set_graphics(self, disp: CharDisplay, *params: int):
+        """ SGR: set the style stamped onto subsequently written cells """
+        disp.attr = self.styles.apply_sgr(disp.attr, params)
+
+    def set_private_modes(self, disp: CharDisplay, *modes: int):
+        """ DECSET, eg. `ESC [ ? 25 h` to show the cursor """
+        for mode in modes:
+            if mode == 1049: # Alternate screen, saving the cursor and starting off blank
+                disp.save_cursor()
+                disp.use_alternate(True)
+                disp.erase_all()
+            elif mode == 47 or mode == 1047:
+                disp.use_alternate(True)
+        self.modes.update(modes)
+        self.logs.debug("Private modes set: %s", modes)
+
+    def reset_private_modes(self, disp: CharDisplay, *modes: int):
+        """ DECRST, eg. `ESC [ ? 25 l` to hide the cursor """
+        for mode in modes:
+            if mode == 1049:
+                disp.use_alternate(False)
+                disp.restore_cursor()
+            elif mode == 1047: # Alternate screen is cleared on the way out
+                if disp.alternate:
+                    disp.erase_all()
+                disp.use_alternate(False)
+            elif mode == 47:
+                disp.use_alternate(False)
+        self.modes.difference_update(modes)
+        self.logs.debug("Private modes reset: %s", modes)
+
+    def save_cursor(self, disp: CharDisplay, *params: int):
+        """ DECSC (`ESC 7`) and SCOSC (`ESC [ s`) """
+        disp.save_cursor()
+
+    def restore_cursor(self, disp: CharDisplay, *params: int):
+        """ DECRC (`ESC 8`) and SCORC (`ESC [ u`) """
+        disp.restore_cursor()
+
+    def cursor_visible(self) -> bool:
+        return 25 in self.modes and not self.char_disp.view_offset
+
+    def set_title(self, disp: CharDisplay, title: str):
+        # The border is redrawn with it on the next draw
+        self.title = title
+
+    def box(self):
+        """ Border, with the title set by the shell (if any) inset into its top edge """
+        super().box()
+        width: int = self._real_win.getmaxyx()[1]
+        if self.title and width > 6:
+            try:
+                self._real_win.addnstr(0, 2, f" {self.title} ", width-4)
+            except curses.error:
+                pass
+            self._real_win.noutrefresh()
+
+    def needs_draw(self) -> bool:
+        """ Whether the display was damaged, its cursor moved or its title changed since the last draw """
+        return (bool(self.char_disp.damage) or self.char_disp.curs.get_pos() != self._drawn_curs
+                or self.title != self._drawn_title)
 
     def draw(self) -> None:
         """
-        Construction of frontend terminal display
+        Construction of frontend terminal display. Scrolling is replayed on the
+        window first, so that only damaged spans of the display need repainting,
+        one `addnstr` per run of same-styled cells, and the window is staged
+        with `noutrefresh` for the caller to flush with `curses.doupdate()`
         """
-        if self.is_active:
-            curses.curs_set(2) # Set cursor to blinking
-        else:
-            curses.curs_set(0) # Hide cursor
-        self.box()
-        self._win.erase()
-        for y, row in enumerate(self.char_disp.buffer):
-            for x, cell in enumerate(row):
-                if cell.data:
-                    self._win.addch(y, x, cell.data)
+        disp: CharDisplay = self.char_disp
+        if self.title != self._drawn_title:
+            self._drawn_title = self.title
+            self.box()
+        damage = disp.take_damage()
+        scrolls = disp.take_scrolls()
+        if scrolls:
+            # Only scroll while replaying, otherwise writing the bottom-right cell would scroll the window too
+            self._win.scrollok(True)
+            for top, bottom, amnt in scrolls:
+                self._win.setscrreg(top, bottom)
+                self._win.scroll(amnt)
+            self._win.setscrreg(0, disp.size[1]-1)
+            self._win.scrollok(False)
+        for y, (start_x, end_x) in damage.items():
+            text: str = disp.view_text(y, start_x, end_x)
+            attrs = disp.view_attrs(y, start_x, end_x)
+            try:
+                if attrs.count(attrs[0]) != len(attrs):
+                    # One `addnstr` per run of same-styled cells
+                    for run in self.style_run_re.finditer(attrs.tobytes()):
+                        x: int = run.start() // 2
+                        self._win.addnstr(y, start_x+x, text[x:run.end()//2], run.end()//2-x, self.colors.attr(attrs[x]))
+                else:
+                    self._win.addnstr(y, start_x, text, end_x-start_x, self.colors.attr(attrs[0]))
+            except curses.error:
+                pass # Writing the bottom-right cell moves the cursor out of the window, but the text is still drawn
+            if self.search:
+                self.highlight_matches(y)
         self.refresh_curs()
-        self._win.refresh()
-
-    def _parse(self, chunk: str) -> None:
-        line = ""
-        while chunk:
-            c: str = chunk[0]
-            if c == "\n": # newline
-                self.char_disp.write(line)
-                self.char_disp.newline()
-                line = ""
-            elif c == "\x1b": # encountered potential escape code
-                self.char_disp.write(line)            
-                line = ""
-                new_chunk = self.esc_handler.handle_head(chunk)
-                if new_chunk is not None:
-                    chunk = new_chunk
-                    continue
-            elif c == "\r": # return carriage
-                self.char_disp.write(line)
-                self.char_disp.curs.x = 0
-                line = ""
-            elif c == "\b": # backspace
-                self.char_disp.write(line)
-                self.move_curs_left(self.char_disp, 1)
-                line = ""
-            else:
-                line += c
-            # Prepare next character for parsing
-            chunk = chunk[1:]
-        # Write any leftover trailing data
-        self.char_disp.write(line)
-
-    def update(self) -> None:
-        """
-        Called every tick of event loop to update terminal window
-        """
-        # If terminal process ended, destroy ourselves
-        if self.term.proc.poll() is not None:
-            self.on_destroy(self)
-        # Check stdout and stderr for new data
-        for buff in [self.term.stdout, self.term.stderr]:
-            chunk: str = self.term.read(buff, 4096)
-            if chunk:
-                self.logs.info(f"Chunk Received: {repr(chunk)}")
+        self._drawn_curs = disp.curs.get_pos()
+        self._win.noutrefresh()
+
+    def new_search(self, pattern: str) -> Search:
+        """ Search for `pattern` through our screen and history """
+        return Search(self.char_disp, pattern)
+
+    def highlight_matches(self, y: int) -> None:
+        """ Highlight search matches on view row `y`, the selected match in reverse video """
+        line_no: int = self.char_disp.line_number(y, exact=True)
+        if line_no is None:
+            return # Part of a line rewrapped since it was searched, matches would not line up
+        for col in self.search.cols_on(line_no):
+            if col >= self.char_disp.size[0]:
+                continue
+            attr: int = curses.A_REVERSE if (line_no, col) == self.search.selected else curses.A_UNDERLINE
+            self._win.chgat(y, col, min(len(self.search.pattern), self.char_disp.size[0]-col), attr)
+
+    def _parse(self, chunk: memoryview) -> None:
+        """ Feed a chunk of pty output through the streaming escape code parser """
+        self.parser.feed(chunk)
+
+    def update(self, budget: int = 256*1024) -> int:
+        """
+        Reads until the pty is drained or `budget` bytes have been parsed, returning how many were.
+        `lock` is only held while each chunk is parsed, so drawing never waits on a whole burst
+        """
+        parsed: int = 0
+        while parsed < budget:
+            chunk: memoryview = self.term.read(budget - parsed)
+            if not chunk:
+                break
+            parsed += len(chunk)
+            if self.logs.is_enabled(DEBUG):
+                self.logs.debug("Chunk Received: %r", bytes(chunk))
+            with self.lock:
                 self._parse(chunk)
-                self.draw()
\ No newline at end of file
+                if self.recorder:
+                    self.record(chunk)
+        return parsed
+
+    def record(self, chunk: memoryview) -> None:
+        """ Hand a parsed chunk to `recorder`, with a keyframe if one is due and the parser is between sequences """
+        self.recorder.output(chunk)
+        if self.recorder.keyframe_due() and self.parser.idle():
+            self.recorder.keyframe(self.char_disp, self.modes, self.title)
+
+    def start_recording(self, path: str, compress: bool = True) -> None:
+        """ Record our output into a new file at `path`, starting off with our current state """
+        with self.lock:
+            self.recorder = Recorder(self.logs, path, self.char_disp.size, self.styles, compress)
+            self.recorder.keyframe(self.char_disp, self.modes, self.title)
+
+    def stop_recording(self) -> None:
+        with self.lock:
+            recorder, self.recorder = self.recorder, None
+        if recorder:
+            recorder.close()
+
+    def paste(self, data: bytes) -> bool:
+        """
+        Send pasted text to the shell in one write, between `ESC [ 200 ~` and `ESC [ 201 ~` if it has set
+        bracketed paste (`?2004`), so that it can tell the text from typing. False if it was dropped, see `TerminalProcess.send`
+        """
+        if 2004 in self.modes:
+            data = b"\x1b[200~" + data + b"\x1b[201~"
+        return self.term.send(data)
+
+    def take_refused(self) -> Union[Tuple[int, int], None]:
+        """
+        Bytes of the last input refused since the last call and bytes then queued, for shells which
+        refuse it only after it was sent. Ours refuses it as it is sent, see `TerminalProcess.send`
+        """
+        return None
+
+    def exit_fd(self) -> Union[int, None]:
+        """ fd readable once the shell has exited, for the event loop to watch. None if only SIGCHLD tells """
+        return self.term.proc.pidfd
+
+    def check_exit(self) -> bool:
+        """
+        Destroy ourselves if the shell has exited, returns whether it has. Called once an exit
+        is reported (by `exit_fd`, SIGCHLD, or the pty hanging up) rather than on every frame,
+        as it is a `waitpid` call
+        """
+        if self.term.proc.poll() is None:
+            return False
+        self.drain()
+        self.on_destroy(self)
+        return True
+
+    def drain(self) -> None:
+        """
+        Stop the reader and parse what the shell output before exiting, which it may not have got to yet
+        if the exit was reported first. Processes the shell left running on the pty are read up to one `update`
+        """
+        self.stop_reader()
+        self.update()
+
+    def start_reader(self, on_frame: Callable[["TerminalWindow"], None]) -> None:
+        """
+        Start draining the pty on a thread of our own, which calls `on_frame` (from that thread)
+        whenever the display has something new to draw, and once more when the shell lets go of the pty
+        """
+        self._stop_r, self._stop_w = os.pipe()
+        self.reader = threading.Thread(target=self._read_loop, args=(on_frame,),
+                                       name=f"pty-reader-{self.term.proc.pid}", daemon=True)
+        self.reader.start()
+
+    def stop_reader(self) -> None:
+        """ Stop the reader thread and wait for it to finish """
+        if self.reader is None:
+            return
+        os.write(self._stop_w, b"\0")
+        self.reader.join()
+        os.close(self._stop_r)
+        os.close(self._stop_w)
+        self.reader = None
+
+    def close(self) -> None:
+        """ Stop reading and release the pane's pty and history, once it is destroyed or we are quitting """
+        self.stop_reader()
+        self.stop_recording()
+        self.term.close()
+        if self.char_disp.history is not None:
+            self.char_disp.history.close()
+
+    def _read_loop(self, on_frame: Callable[["TerminalWindow"], None]) -> None:
+        """ Body of the reader thread, sleeps until the pty has output or we are told to stop """
+        stdout: int = self.term.stdout.fileno()
+        while not self.term.closed:
+            readable, _, _ = select.select([stdout, self._stop_r], [], [])
+            if self._stop_r in readable:
+                return
+            try:
+                parsed: int = self.update()
+            except Exception as e:
+                # Carry on with the next chunk rather than leave the pane frozen
+                self.logs.error(f"Error while parsing output of {self.reader.name}\n{traceback.format_exc()}", e)
+                continue
+            if parsed:
+                on_frame(self)
+        on_frame(self)
+
+class HeadlessTerminal(TerminalWindow):
+    """
+    Escape code handling of `TerminalWindow` without any curses window, for terminals
+    emulated out of sight: in a pane's worker process, or in benchmarks.
+    `term` is only needed to use the reader thread.
+    """
+    def __init__(self, logs, size: Tuple[int, int], styles: StyleTable = None, term: TerminalProcess = None,
+                 history: Scrollback = None) -> None:
+        self.logs = logs
+        self.styles: StyleTable = styles or StyleTable()
+        self.term: TerminalProcess = term
+        self.char_disp: CharDisplay = CharDisplay(logs, size, history)
+        self.esc_handler: EscCodeHandler = EscCodeHandler(self.logs, self.char_disp)
+        self.parser: VTParser = VTParser(self.logs, self.char_disp, self.esc_handler)
+        self.modes: set[int] = {25}
+        self.title: str = ""
+        self.lock = threading.RLock()
+        self.reader: threading.Thread = None
+        self.recorder: Recorder = None
+        self.setup_esc()